@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Process-wide pool of pre-built consultation pipelines
+
+Building the four agents and the GroupChatManager is the expensive part of
+starting a consultation, so pipelines are built once, checked out for a
+single consultation, reset and returned for the next one.
+"""
+
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from healthcare_chatbot import ConsultationPipeline
+
+
+class AgentPool:
+    """Config-keyed pool of idle ConsultationPipeline objects"""
+
+    def __init__(self, max_idle=4, pipeline_factory=ConsultationPipeline):
+        self.max_idle = max_idle
+        self.pipeline_factory = pipeline_factory
+        self._idle = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def checkout(self, llm_config, **options):
+        """Take an idle pipeline for this config, building one if none is free"""
+        candidate = self.pipeline_factory(llm_config, **options)
+        with self._lock:
+            idle = self._idle[candidate.key]
+            if idle:
+                pipeline = idle.pop()
+                self.reused += 1
+            else:
+                pipeline = candidate
+                self.created += 1
+            self.in_use += 1
+        return pipeline.build()
+
+    def release(self, pipeline):
+        """Reset a pipeline and make it available to the next consultation"""
+        pipeline.reset()
+        with self._lock:
+            self.in_use -= 1
+            idle = self._idle[pipeline.key]
+            if len(idle) < self.max_idle:
+                idle.append(pipeline)
+
+    @contextmanager
+    def pipeline(self, llm_config, **options):
+        """Check out a pipeline for the duration of one consultation"""
+        pipeline = self.checkout(llm_config, **options)
+        try:
+            yield pipeline
+        finally:
+            self.release(pipeline)
+
+    def warm(self, llm_config, count=1, **options):
+        """Pre-build pipelines until at least ``count`` are idle for this config"""
+        key = self.pipeline_factory(llm_config, **options).key
+        with self._lock:
+            missing = min(count, self.max_idle) - len(self._idle[key])
+        for _ in range(missing):
+            pipeline = self.pipeline_factory(llm_config, **options).build()
+            with self._lock:
+                self.created += 1
+                if len(self._idle[key]) < self.max_idle:
+                    self._idle[key].append(pipeline)
+
+    def clear(self):
+        """Drop every idle pipeline"""
+        with self._lock:
+            self._idle.clear()
+
+    def stats(self):
+        """Counters describing pool usage"""
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "in_use": self.in_use,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide agent pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = AgentPool()
+    return _pool
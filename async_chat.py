@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Async reply path for the consultation agents
+
+``ConsultationPipeline.a_consult`` drives the GroupChat with autogen's async
+chat loop (``a_initiate_chat`` / ``a_run_chat``), so a consultation is a
+coroutine on the caller's event loop rather than a thread held for its whole
+multi-second duration. Only the provider call itself is blocking (the
+middleware chain and the OpenAI client are synchronous); it borrows a thread
+from one process-wide executor for the length of that request and gives it
+back between turns. The executor is sized for concurrent provider calls
+(LLM_THREADS), not for consultations in flight.
+
+autogen's own async reply hops to the loop's default executor without the
+caller's context, which would lose the stream sink and trace ContextVars;
+``install_async_reply`` replaces it with one that carries them along.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+DEFAULT_LLM_THREADS = 64
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_llm_executor():
+    """Return the process-wide executor for blocking provider calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("LLM_THREADS") or DEFAULT_LLM_THREADS),
+                    thread_name_prefix="llm",
+                )
+    return _executor
+
+
+def _reset_after_fork():
+    """Executor threads don't survive fork; a forked child starts its own"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Await ``func`` on the LLM executor, in a copy of the current context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_llm_executor(), partial(context.run, func, *args, **kwargs)
+    )
+
+
+async def a_generate_oai_reply(agent, messages=None, sender=None, config=None):
+    """Async counterpart of ``ConversableAgent.generate_oai_reply``"""
+    return await run_blocking(
+        agent.generate_oai_reply, messages=messages, sender=sender, config=config
+    )
+
+
+def install_async_reply(agent):
+    """Use ``a_generate_oai_reply`` for the agent's LLM replies in async chats"""
+    from autogen import ConversableAgent
+
+    agent.replace_reply_func(
+        ConversableAgent.a_generate_oai_reply, a_generate_oai_reply
+    )
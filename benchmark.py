@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the agent pipeline
+
+Runs the real GroupChat/GroupChatManager flow against FakeLLMClient, so no
+API key or network is needed, and reports:
+
+- startup: cold import of healthcare_chatbot, of autogen+openai, and the
+  time to build one pipeline
+- orchestration overhead per LLM round with a zero-latency model
+- consultations/sec through ConsultationEngine with simulated latency
+- memory retained per live consultation
+
+Pass --baseline with a previous JSON report to fail on regressions.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from consultation_engine import ConsultationEngine
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Metric name -> True if higher is better
+METRICS = {
+    "import_seconds": False,
+    "bootstrap_import_seconds": False,
+    "pipeline_build_seconds": False,
+    "overhead_per_round_ms": False,
+    "consultations_per_second": True,
+    "memory_per_consultation_kb": False,
+}
+
+# Absolute differences below these are treated as timer noise
+NOISE_FLOOR = {
+    "import_seconds": 0.05,
+    "bootstrap_import_seconds": 0.25,
+    "pipeline_build_seconds": 0.005,
+    "overhead_per_round_ms": 0.5,
+}
+
+
+def time_import(statement):
+    """Wall time of a fresh interpreter running ``statement`` minus an empty one"""
+
+    def run(code):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True)
+        return time.perf_counter() - started
+
+    empty = min(run("pass") for _ in range(3))
+    return max(0.0, min(run(statement) for _ in range(3)) - empty)
+
+
+def measure_startup():
+    report = {
+        "import_seconds": time_import("import healthcare_chatbot"),
+        "bootstrap_import_seconds": time_import("import autogen, openai"),
+    }
+    import autogen  # noqa: F401  (import cost is reported separately above)
+
+    timings = []
+    for _ in range(10):
+        started = time.perf_counter()
+        ConsultationPipeline(fake_llm_config(), silent=True).build()
+        timings.append(time.perf_counter() - started)
+    report["pipeline_build_seconds"] = statistics.median(timings)
+    return report
+
+
+def measure_overhead(consultations, repeats=3):
+    """Best-of-``repeats`` wall time per LLM round with a zero-latency model"""
+    pipeline = ConsultationPipeline(fake_llm_config(), silent=True)
+    pipeline.consult("warm up")
+    per_round = []
+    for _ in range(repeats):
+        rounds = 0
+        started = time.perf_counter()
+        for index in range(consultations):
+            pipeline.reset()
+            pipeline.consult(f"headache and fatigue {index}")
+            rounds += len(pipeline.groupchat.messages) - 1
+        per_round.append((time.perf_counter() - started) / rounds)
+    return {"overhead_per_round_ms": min(per_round) * 1000}
+
+
+def measure_throughput(consultations, concurrency, ttft):
+    engine = ConsultationEngine(
+        fake_llm_config(ttft=ttft, seed=1), concurrency=concurrency, silent=True
+    )
+    engine.run_batch(["warm up"] * concurrency)
+    started = time.perf_counter()
+    results = engine.run_batch(f"case {i}" for i in range(consultations))
+    elapsed = time.perf_counter() - started
+    failed = [r.error for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(f"{len(failed)} consultations failed: {failed[0]}")
+    return {"consultations_per_second": consultations / elapsed}
+
+
+def measure_memory(consultations):
+    ConsultationPipeline(fake_llm_config(), silent=True).consult("warm up")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live = []
+    for index in range(consultations):
+        pipeline = ConsultationPipeline(fake_llm_config(), silent=True)
+        pipeline.consult(f"headache and fatigue {index}")
+        live.append(pipeline)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {"memory_per_consultation_kb": (after - before) / len(live) / 1024}
+
+
+def run_benchmarks(quick=False):
+    scale = 1 if quick else 5
+    report = {}
+    report.update(measure_startup())
+    report.update(measure_overhead(consultations=20 * scale))
+    report.update(
+        measure_throughput(consultations=40 * scale, concurrency=8, ttft=0.05)
+    )
+    report.update(measure_memory(consultations=10 * scale))
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of ``report`` against ``baseline`` beyond ``tolerance``"""
+    regressions = []
+    for name, higher_is_better in METRICS.items():
+        if name not in baseline or name not in report:
+            continue
+        old, new = baseline[name], report[name]
+        if abs(new - old) < NOISE_FLOOR.get(name, 0.0):
+            continue
+        if higher_is_better:
+            regressed = new < old * (1 - tolerance)
+        else:
+            regressed = new > old * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller run for CI")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(quick=args.quick)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            return 1
+        print("✅ No performance regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
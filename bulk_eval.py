@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Offline bulk evaluation over a dataset of symptom cases
+
+Replays a JSONL, CSV or plain-text file of cases (a day's intake traffic,
+say) through the diagnosis -> pharmacy -> consultation pipeline and writes
+one row per case in a columnar file (``.npz``, or ``.parquet`` with
+pyarrow installed) for regression testing.
+
+Cases are cut into shards and spread over a process pool; inside each
+worker process a ``ConsultationEngine`` runs the shard's cases
+concurrently on the async chat path. Every finished shard is appended to
+a JSONL checkpoint next to the output, so after a crash the same command
+picks up where it stopped; the checkpoint is removed once the output is
+written.
+
+Dataset rows have a ``symptoms`` field and optionally ``id`` and
+``expected_outcome`` (one of the ``consultation_store`` outcomes); the
+summary reports how many outcomes agree with the expected ones and, with
+``--baseline``, which cases changed outcome since an earlier run.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from itertools import islice
+
+import numpy as np
+
+from consultation_engine import DEFAULT_CONCURRENCY, ConsultationEngine
+from consultation_store import UNKNOWN, classify_outcome, recommendation
+from dag import DEFAULT_DAG
+from healthcare_chatbot import build_llm_config, load_environment
+from instrumentation import Instrumentation
+from structured import DEFAULT_STRUCTURED
+
+# Shards per worker kept in flight, so workers never wait for the parent
+SHARDS_PER_WORKER = 2
+
+# Output columns and their types
+COLUMNS = (
+    ("index", int),
+    ("case_id", str),
+    ("symptoms", str),
+    ("expected", str),
+    ("outcome", str),
+    ("matched", bool),
+    ("error", str),
+    ("elapsed", float),
+    ("turns", int),
+    ("prompt_tokens", int),
+    ("completion_tokens", int),
+    ("cached_prompt_tokens", int),
+    ("summary", str),
+    ("messages", str),
+)
+_DTYPES = {int: np.int64, float: np.float64, bool: np.bool_, str: np.str_}
+
+
+@dataclass
+class EvalCase:
+    """One symptom case of a dataset"""
+
+    index: int
+    case_id: str
+    symptoms: str
+    expected: str = ""
+
+
+def _case(index, record):
+    symptoms = str(record.get("symptoms") or "").strip()
+    if not symptoms:
+        return None
+    return EvalCase(
+        index,
+        str(record.get("id") or index),
+        symptoms,
+        str(record.get("expected_outcome") or ""),
+    )
+
+
+def read_dataset(path):
+    """Cases of a ``.jsonl``, ``.csv`` or plain-text (one case per line) file"""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        elif path.endswith((".jsonl", ".json")):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = ({"symptoms": line} for line in f)
+        for index, record in enumerate(records):
+            case = _case(index, record)
+            if case is not None:
+                yield case
+
+
+def result_row(case, result):
+    """Output row for a case and its ConsultationResult"""
+    agents = (result.trace or {}).get("agents", {}).values()
+    outcome = classify_outcome(recommendation(result.messages)) if result.ok else ""
+    return {
+        "index": case.index,
+        "case_id": case.case_id,
+        "symptoms": case.symptoms,
+        "expected": case.expected,
+        "outcome": outcome or UNKNOWN,
+        "matched": bool(case.expected) and outcome == case.expected,
+        "error": result.error or "",
+        "elapsed": result.elapsed,
+        "turns": len(result.messages),
+        "prompt_tokens": sum(a["prompt_tokens"] for a in agents),
+        "completion_tokens": sum(a["completion_tokens"] for a in agents),
+        "cached_prompt_tokens": sum(a.get("cached_prompt_tokens", 0) for a in agents),
+        "summary": result.summary or "",
+        "messages": json.dumps(result.messages),
+    }
+
+
+class Checkpoint:
+    """Append-only JSONL of finished rows; a rerun skips the cases it holds"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a")
+
+    def _load(self):
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            # A crash can leave half a line behind; drop it before appending
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            self.rows[row["case_id"]] = row
+
+    def __contains__(self, case_id):
+        return case_id in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, rows):
+        for row in rows:
+            self.rows[row["case_id"]] = row
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+def write_columns(rows, path):
+    """Write rows column by column to a ``.npz`` or ``.parquet`` file"""
+    columns = {name: [row[name] for row in rows] for name, _ in COLUMNS}
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError(
+                "Parquet output needs pyarrow (pip install pyarrow); "
+                "use a .npz output instead"
+            )
+        pq.write_table(pa.table(columns), path)
+    elif path.endswith(".npz"):
+        np.savez_compressed(
+            path,
+            **{
+                name: np.asarray(columns[name], dtype=_DTYPES[kind])
+                for name, kind in COLUMNS
+            },
+        )
+    else:
+        raise ValueError(f"Unsupported output format (use .npz or .parquet): {path}")
+
+
+def read_columns(path):
+    """Columns of a file written by ``write_columns``, as lists"""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path).to_pydict()
+    with np.load(path) as data:
+        return {name: data[name].tolist() for name in data.files}
+
+
+def summarize(rows, wall_seconds=0.0):
+    """Counts, outcome agreement and latency percentiles of a run"""
+    elapsed = np.array([row["elapsed"] for row in rows], dtype=np.float64)
+    labelled = [row for row in rows if row["expected"]]
+    matched = sum(row["matched"] for row in labelled)
+    outcomes = {}
+    for row in rows:
+        outcomes[row["outcome"]] = outcomes.get(row["outcome"], 0) + 1
+    return {
+        "cases": len(rows),
+        "errors": sum(bool(row["error"]) for row in rows),
+        "outcomes": outcomes,
+        "labelled": len(labelled),
+        "agreement": matched / len(labelled) if labelled else None,
+        "p50_seconds": float(np.percentile(elapsed, 50)) if len(rows) else 0.0,
+        "p95_seconds": float(np.percentile(elapsed, 95)) if len(rows) else 0.0,
+        "wall_seconds": wall_seconds,
+    }
+
+
+def outcome_changes(rows, baseline):
+    """(case_id, old outcome, new outcome) for cases whose outcome changed"""
+    old = dict(zip(baseline["case_id"], baseline["outcome"]))
+    return [
+        (row["case_id"], old[row["case_id"]], row["outcome"])
+        for row in rows
+        if row["case_id"] in old and old[row["case_id"]] != row["outcome"]
+    ]
+
+
+_engine = None
+
+
+def _init_worker(llm_config, concurrency, dag, structured):
+    """Build this worker process's engine once, for all its shards"""
+    global _engine
+    # Registers FakeLLMClient for offline runs
+    import fake_llm  # noqa: F401
+
+    _engine = ConsultationEngine(
+        llm_config,
+        concurrency=concurrency,
+        instrumentation=Instrumentation(),
+        silent=True,
+        dag=DEFAULT_DAG if dag else None,
+        structured=DEFAULT_STRUCTURED if structured else None,
+    )
+
+
+def _run_shard(cases):
+    """Rows for a shard of cases, run concurrently in this worker"""
+
+    async def run():
+        slots = asyncio.Semaphore(_engine.concurrency)
+
+        async def consult(case):
+            async with slots:
+                result = await _engine.a_consult(case.index, case.symptoms)
+            return result_row(case, result)
+
+        return await asyncio.gather(*(consult(case) for case in cases))
+
+    return asyncio.run(run())
+
+
+def _shards(cases, size):
+    cases = iter(cases)
+    while True:
+        shard = list(islice(cases, size))
+        if not shard:
+            return
+        yield shard
+
+
+def run_eval(
+    cases,
+    output,
+    llm_config,
+    workers=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    shard_size=None,
+    dag=False,
+    structured=False,
+    progress=None,
+):
+    """Run every case not yet checkpointed and write all rows to ``output``.
+
+    Returns the run's ``summarize`` dict plus how many cases were resumed
+    from the checkpoint. ``progress(done, errors)`` is called after each
+    shard.
+    """
+    workers = workers or os.cpu_count() or 1
+    shard_size = shard_size or concurrency * 4
+    checkpoint = Checkpoint(output + ".checkpoint.jsonl")
+    resumed = len(checkpoint)
+    pending_cases = (case for case in cases if case.case_id not in checkpoint)
+    started = time.perf_counter()
+    errors = sum(bool(row["error"]) for row in checkpoint.rows.values())
+    # Forked workers could inherit locks held by this process's LLM and
+    # writer threads, so workers start fresh and build their own engines
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(llm_config, concurrency, dag, structured),
+    ) as executor:
+        shards = _shards(pending_cases, shard_size)
+        in_flight = set()
+        try:
+            while True:
+                for shard in islice(
+                    shards, workers * SHARDS_PER_WORKER - len(in_flight)
+                ):
+                    in_flight.add(executor.submit(_run_shard, shard))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows = future.result()
+                    checkpoint.append(rows)
+                    errors += sum(bool(row["error"]) for row in rows)
+                    if progress is not None:
+                        progress(len(checkpoint), errors)
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            checkpoint.close()
+            raise
+    rows = sorted(checkpoint.rows.values(), key=lambda row: row["index"])
+    write_columns(rows, output)
+    checkpoint.remove()
+    return {
+        **summarize(rows, time.perf_counter() - started),
+        "resumed": resumed,
+    }
+
+
+def main(argv=None):
+    """Evaluate a dataset of symptom cases and write the results as columns"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("dataset", help=".jsonl, .csv or text file of symptom cases")
+    parser.add_argument(
+        "--output",
+        default="eval_results.npz",
+        help="columnar output file (.npz, or .parquet with pyarrow)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="consultations in flight per worker",
+    )
+    parser.add_argument("--shard-size", type=int, help="cases per unit of work")
+    parser.add_argument(
+        "--dag",
+        action="store_true",
+        help="run independent agents concurrently instead of the round-robin GroupChat",
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        help="exchange schema-validated JSON payloads between agents",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="use the offline fake LLM backend instead of OpenAI",
+    )
+    parser.add_argument(
+        "--baseline", help="earlier output to compare consultation outcomes against"
+    )
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        from fake_llm import fake_llm_config
+
+        llm_config = fake_llm_config()
+    else:
+        load_environment()
+        if not os.getenv("OPENAI_API_KEY"):
+            print(
+                "⚠️ OPENAI_API_KEY not set. Use --offline or set the key.",
+                file=sys.stderr,
+            )
+            return 1
+        llm_config = build_llm_config()
+
+    def progress(done, errors):
+        print(f"⏳ {done} cases done, {errors} errors", file=sys.stderr, flush=True)
+
+    try:
+        summary = run_eval(
+            read_dataset(args.dataset),
+            args.output,
+            llm_config,
+            workers=args.workers,
+            concurrency=args.concurrency,
+            shard_size=args.shard_size,
+            dag=args.dag,
+            structured=args.structured,
+            progress=progress,
+        )
+    except BrokenProcessPool:
+        print(
+            "❌ A worker process died; rerun the same command to resume",
+            file=sys.stderr,
+        )
+        return 1
+    print(json.dumps(summary, indent=2))
+    print(f"✅ Results written to: {args.output}")
+
+    if args.baseline:
+        rows = read_columns(args.output)
+        rows = [dict(zip(rows, values)) for values in zip(*rows.values())]
+        changes = outcome_changes(rows, read_columns(args.baseline))
+        for case_id, old, new in changes:
+            print(f"❌ Outcome changed for {case_id}: {old} -> {new}")
+        if changes:
+            return 1
+        print("✅ No outcome changes against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Conversation-history compaction for agent LLM calls
+
+Every round of the GroupChat resends the whole conversation, so prompts
+grow with ``max_round``. A ``CompactionPolicy`` rewrites the messages of
+each call before it reaches the model:
+
+- the patient's opening message is always kept verbatim
+- each role only sees the agents it needs (``role_context``) plus itself
+- the last ``keep_recent`` turns are kept verbatim
+- older turns are cut down to their summary, and dropped entirely once the
+  same speaker has spoken again
+
+The prompt therefore stays bounded by the number of speakers rather than
+the number of rounds.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+# Which earlier speakers each role needs to see
+ROLE_CONTEXT = {
+    "diagnosis": ("patient",),
+    "pharmacy": ("patient", "diagnosis"),
+    "consultation": ("patient", "diagnosis", "pharmacy"),
+}
+
+_SUMMARY_HEADING = re.compile(
+    r"^[#*>\s-]*(summary|key points)\b", re.IGNORECASE | re.MULTILINE
+)
+
+
+def summarize(text, max_chars):
+    """The summary section of a reply (or its opening), cut to ``max_chars``"""
+    match = _SUMMARY_HEADING.search(text)
+    if match:
+        text = text[match.start() :]
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " …"
+
+
+@dataclass
+class CompactionPolicy:
+    """LLM middleware keeping a bounded, summarized view of earlier turns"""
+
+    keep_recent: int = 2
+    summary_chars: int = 400
+    role_context: dict = field(default_factory=lambda: dict(ROLE_CONTEXT))
+
+    def agent_names(self):
+        names = set(self.role_context)
+        for needed in self.role_context.values():
+            names.update(needed)
+        return names
+
+    def compact(self, agent_name, messages):
+        """Messages ``agent_name`` needs for its next reply"""
+        system = [m for m in messages if m.get("role") == "system"]
+        turns = [m for m in messages if m.get("role") != "system"]
+        if len(turns) <= 1:
+            return list(messages)
+        first, rest = turns[0], turns[1:]
+        wanted = self.role_context.get(agent_name)
+        if wanted is not None:
+            # Only other agents' turns are filtered; e.g. manager instructions stay
+            skipped = self.agent_names() - {*wanted, agent_name}
+            rest = [m for m in rest if m.get("name") not in skipped]
+
+        recent = (
+            rest[max(0, len(rest) - self.keep_recent) :] if self.keep_recent else []
+        )
+        older = rest[: len(rest) - len(recent)]
+        seen = {m.get("name") for m in recent}
+        summarized = []
+        for message in reversed(older):
+            if message.get("name") in seen:
+                continue
+            seen.add(message.get("name"))
+            content = message.get("content")
+            if isinstance(content, str):
+                message = {**message, "content": summarize(content, self.summary_chars)}
+            summarized.append(message)
+        return system + [first] + summarized[::-1] + recent
+
+    def __call__(self, agent, params, call_next):
+        messages = params.get("messages")
+        if messages:
+            params = {**params, "messages": self.compact(agent.name, messages)}
+        return call_next(params)
+
+
+DEFAULT_COMPACTION = CompactionPolicy()
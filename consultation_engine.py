@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Concurrent consultation engine
+
+Runs many symptom cases through the diagnosis -> pharmacy -> consultation
+GroupChat at once. Each in-flight case gets its own pipeline from an
+AgentPool, so GroupChat state is never shared between cases, and results
+are yielded in completion order.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from agent_pool import AgentPool
+from consultation_store import ConsultationStore
+from dag import DEFAULT_DAG
+from healthcare_chatbot import build_llm_config, load_environment
+from instrumentation import Instrumentation
+from response_cache import from_environment
+from similarity import from_environment as similarity_from_environment
+from speculative import DEFAULT_SPECULATIVE
+from streaming import StreamingMiddleware
+from structured import DEFAULT_STRUCTURED
+
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class ConsultationResult:
+    """Outcome of one consultation in a batch"""
+
+    index: int
+    symptoms: str
+    messages: list = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    trace: Optional[dict] = None
+    cost: Optional[dict] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def summary(self):
+        """Content of the last message in the chat, normally the consultation agent's"""
+        for message in reversed(self.messages):
+            if message.get("content"):
+                return message["content"]
+        return None
+
+    def to_dict(self):
+        return {**asdict(self), "summary": self.summary}
+
+
+class ConsultationEngine:
+    """Run symptom cases through the agent pipeline with bounded concurrency"""
+
+    def __init__(
+        self,
+        llm_config,
+        concurrency=DEFAULT_CONCURRENCY,
+        pool=None,
+        instrumentation=None,
+        store=None,
+        ledger=None,
+        **options,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.llm_config = llm_config
+        self.concurrency = concurrency
+        self.pool = pool if pool is not None else AgentPool(max_idle=concurrency)
+        self.instrumentation = instrumentation
+        self.store = store
+        self.ledger = ledger
+        if ledger is not None:
+            middlewares = list(options.get("middlewares", ()))
+            # In front of the response cache, whose hits cost nothing
+            middlewares.insert(0, ledger)
+            options["middlewares"] = middlewares
+        if instrumentation is not None:
+            middlewares = list(options.get("middlewares", ()))
+            # Behind StreamingMiddleware so streamed chunks reach it (for TTFT)
+            position = next(
+                (
+                    index + 1
+                    for index, middleware in enumerate(middlewares)
+                    if isinstance(middleware, StreamingMiddleware)
+                ),
+                0,
+            )
+            middlewares.insert(position, instrumentation)
+            options["middlewares"] = middlewares
+        self.options = options
+
+    def _trace(self, symptoms):
+        if self.instrumentation is None:
+            return nullcontext()
+        return self.instrumentation.trace(symptoms)
+
+    def _account(self, tenant, trace):
+        if self.ledger is None:
+            return nullcontext()
+        consultation_id = trace.consultation_id if trace is not None else None
+        return self.ledger.consultation(tenant, consultation_id)
+
+    def consult(self, index, symptoms, tenant=None):
+        """Run a single case on a pooled pipeline, capturing any error"""
+        started = time.perf_counter()
+        result = ConsultationResult(index=index, symptoms=symptoms)
+        try:
+            if self.ledger is not None:
+                self.ledger.check(tenant)
+            with self.pool.pipeline(self.llm_config, **self.options) as pipeline:
+                with self._trace(symptoms) as trace:
+                    with self._account(tenant, trace) as cost:
+                        try:
+                            pipeline.consult(symptoms)
+                        finally:
+                            result.messages = [
+                                dict(m) for m in pipeline.groupchat.messages
+                            ]
+                if trace is not None:
+                    result.trace = trace.to_dict()
+                if cost is not None:
+                    result.cost = cost.to_dict()
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        return self._finish(result, started)
+
+    async def a_consult(self, index, symptoms, tenant=None):
+        """Awaitable ``consult``: the case is a coroutine, not a thread of its own"""
+        started = time.perf_counter()
+        result = ConsultationResult(index=index, symptoms=symptoms)
+        try:
+            if self.ledger is not None:
+                self.ledger.check(tenant)
+            with self.pool.pipeline(self.llm_config, **self.options) as pipeline:
+                with self._trace(symptoms) as trace:
+                    with self._account(tenant, trace) as cost:
+                        try:
+                            await pipeline.a_consult(symptoms)
+                        finally:
+                            result.messages = [
+                                dict(m) for m in pipeline.groupchat.messages
+                            ]
+                if trace is not None:
+                    result.trace = trace.to_dict()
+                if cost is not None:
+                    result.cost = cost.to_dict()
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        return self._finish(result, started)
+
+    def _finish(self, result, started):
+        result.elapsed = time.perf_counter() - started
+        if self.store is not None:
+            self.store.record_result(result)
+        return result
+
+    async def run(self, cases):
+        """Yield a ConsultationResult for each symptom string as it finishes.
+
+        ``cases`` is consumed lazily, so at most ``concurrency`` cases are
+        held in memory at a time.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="consultation"
+        )
+        pending = set()
+        try:
+            for index, symptoms in enumerate(cases):
+                pending.add(
+                    loop.run_in_executor(executor, self.consult, index, symptoms)
+                )
+                if len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+        finally:
+            executor.shutdown(wait=False)
+
+    def run_batch(self, cases):
+        """Run every case and return the results in input order"""
+
+        async def collect():
+            return [result async for result in self.run(cases)]
+
+        return sorted(asyncio.run(collect()), key=lambda result: result.index)
+
+
+def read_cases(stream):
+    """Non-empty, stripped lines of a text stream"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def main(argv=None):
+    """Run a file of symptom cases (one per line) and print JSON results"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "cases", nargs="?", help="file with one symptom description per line"
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument(
+        "--dag",
+        action="store_true",
+        help="run independent agents concurrently instead of the round-robin GroupChat",
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        help="exchange schema-validated JSON payloads between agents",
+    )
+    parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="draft the pharmacy reply while the diagnosis is still generating",
+    )
+    parser.add_argument(
+        "--metrics", help="write Prometheus metrics for the batch to this file"
+    )
+    parser.add_argument(
+        "--store", help="also record every consultation in this SQLite store"
+    )
+    args = parser.parse_args(argv)
+
+    load_environment()
+    if not os.getenv("OPENAI_API_KEY"):
+        print("⚠️ OPENAI_API_KEY not set. Cannot run consultations.", file=sys.stderr)
+        return 1
+
+    cache = from_environment()
+    store = ConsultationStore(args.store) if args.store else None
+    similarity = similarity_from_environment()
+    if similarity is not None and store is not None:
+        similarity.load_store(store)
+    instrumentation = Instrumentation()
+    engine = ConsultationEngine(
+        build_llm_config(),
+        concurrency=args.concurrency,
+        instrumentation=instrumentation,
+        silent=True,
+        middlewares=[cache] if cache else [],
+        dag=DEFAULT_DAG if args.dag else None,
+        store=store,
+        similarity=similarity,
+        structured=DEFAULT_STRUCTURED if args.structured else None,
+        speculative=DEFAULT_SPECULATIVE if args.speculative else None,
+    )
+
+    async def stream_results(cases):
+        async for result in engine.run(cases):
+            print(json.dumps(result.to_dict()), flush=True)
+
+    try:
+        if args.cases:
+            with open(args.cases) as f:
+                asyncio.run(stream_results(read_cases(f)))
+        else:
+            asyncio.run(stream_results(read_cases(sys.stdin)))
+    finally:
+        if store is not None:
+            store.close()
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(instrumentation.render_prometheus())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
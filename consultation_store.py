@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Durable store for finished consultations
+
+Consultations (symptoms, per-agent messages, timings and the final
+recommendation) are appended to SQLite by a background writer thread in
+batches, so recording one never blocks the chat loop. Indexed lookups:
+
+- time: ``created``
+- symptom terms: an inverted ``symptom_terms`` table
+- outcome: ``doctor_visit_required``, ``urgent``, ``no_doctor_visit`` or
+  ``unknown``, classified from the consultation agent's recommendation
+
+Token and cost rows from a ``CostLedger`` go through the same writer into a
+``costs`` table indexed by tenant and time.
+"""
+
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+
+from response_cache import retire_connection, normalize_text
+
+logger = logging.getLogger(__name__)
+
+DOCTOR_VISIT_REQUIRED = "doctor_visit_required"
+URGENT = "urgent"
+NO_DOCTOR_VISIT = "no_doctor_visit"
+UNKNOWN = "unknown"
+
+_URGENT = re.compile(
+    r"\b(emergency|urgent(ly)?|immediate(ly)?|call 911|right away|"
+    r"emergency room|\ber\b)",
+    re.IGNORECASE,
+)
+_NO_VISIT = re.compile(
+    r"\b(not (required|necessary|needed)|no need|isn't (required|necessary)|"
+    r"is not required|unnecessary)",
+    re.IGNORECASE,
+)
+# A negation only decides the outcome when it is about seeing a doctor
+_VISIT_SUBJECT = re.compile(
+    r"\b(doctor|physician|visit|appointment|healthcare (provider|professional)|"
+    r"medical attention)",
+    re.IGNORECASE,
+)
+_VISIT = re.compile(
+    r"\b(visit is (required|recommended|advised)|(see|consult|visit) (a|your) "
+    r"(doctor|physician|healthcare (provider|professional))|"
+    r"medical attention|should be (seen|evaluated))",
+    re.IGNORECASE,
+)
+_SELF_CARE = re.compile(
+    r"\b(monitor (your |the )?symptoms|rest at home|self-care|"
+    r"can be managed at home)",
+    re.IGNORECASE,
+)
+# Safety-net advice ("if symptoms worsen, seek emergency care") is not a decision
+_CONDITIONAL = re.compile(
+    r"\b(if|unless|in case|should (they|it|symptoms|your symptoms))\b", re.IGNORECASE
+)
+_SENTENCE = re.compile(r"[^.!?;\n]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can for from have help i im in is it "
+    "my of on or so some the to very with feeling am been since".split()
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS consultations (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    symptoms TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    recommendation TEXT,
+    error TEXT,
+    elapsed REAL
+);
+CREATE INDEX IF NOT EXISTS consultations_created ON consultations (created);
+CREATE INDEX IF NOT EXISTS consultations_outcome
+    ON consultations (outcome, created);
+CREATE TABLE IF NOT EXISTS messages (
+    consultation_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    agent TEXT,
+    content TEXT,
+    PRIMARY KEY (consultation_id, position)
+);
+CREATE TABLE IF NOT EXISTS spans (
+    consultation_id TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    agent TEXT,
+    model TEXT,
+    wall_seconds REAL,
+    ttft_seconds REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cache_hit INTEGER,
+    PRIMARY KEY (consultation_id, round)
+);
+CREATE TABLE IF NOT EXISTS costs (
+    consultation_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    model TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    created REAL NOT NULL,
+    calls INTEGER,
+    prompt_tokens INTEGER,
+    cached_prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cost REAL,
+    PRIMARY KEY (consultation_id, agent, model)
+);
+CREATE INDEX IF NOT EXISTS costs_tenant ON costs (tenant, created);
+CREATE TABLE IF NOT EXISTS symptom_terms (
+    term TEXT NOT NULL,
+    consultation_id TEXT NOT NULL,
+    PRIMARY KEY (term, consultation_id)
+) WITHOUT ROWID;
+"""
+
+
+def classify_outcome(text):
+    """Outcome of a consultation from its final recommendation"""
+    if not text:
+        return UNKNOWN
+    clauses = _SENTENCE.findall(text)
+    if any(_NO_VISIT.search(c) and _VISIT_SUBJECT.search(c) for c in clauses):
+        return NO_DOCTOR_VISIT
+    decided = unconditional(text)
+    # Whatever else is ruled out ("an ER trip is not needed") escalates nothing
+    affirmed = " ".join(c for c in decided if not _NO_VISIT.search(c))
+    if _URGENT.search(affirmed):
+        return URGENT
+    if _VISIT.search(affirmed):
+        return DOCTOR_VISIT_REQUIRED
+    if _SELF_CARE.search(" ".join(decided)):
+        return NO_DOCTOR_VISIT
+    return UNKNOWN
+
+
+def unconditional(text):
+    """The sentences and clauses of ``text`` that are not conditional advice"""
+    return [
+        clause for clause in _SENTENCE.findall(text) if not _CONDITIONAL.search(clause)
+    ]
+
+
+def symptom_terms(symptoms):
+    """Distinct index terms of a symptom description"""
+    words = re.findall(r"[a-z0-9]+", normalize_text(symptoms))
+    return sorted({w for w in words if w not in STOPWORDS and len(w) > 1})
+
+
+def recommendation(messages):
+    """The consultation agent's last message, else the last message with content"""
+    for message in reversed(messages):
+        if message.get("name") == "consultation" and message.get("content"):
+            return message["content"]
+    for message in reversed(messages):
+        if message.get("content"):
+            return message["content"]
+    return None
+
+
+class ConsultationStore:
+    """Append-only SQLite store written in batches by a background thread"""
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._closed = False
+        self.written = 0
+        self.failed = 0
+        self._open()
+        _stores.add(self)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="consultation-store", daemon=True
+        )
+        self._writer.start()
+
+    def _after_fork(self):
+        """In a forked child: own connection and writer; the parent's stay its own"""
+        if self._closed:
+            return
+        retire_connection(self._conn)
+        self._open()
+
+    def record(self, symptoms, messages, consultation_id=None, created=None, **details):
+        """Queue a finished consultation for writing and return its id.
+
+        ``details`` may carry ``error``, ``elapsed`` and ``trace`` (an
+        Instrumentation trace dict, whose spans hold the per-agent timings).
+        """
+        if self._closed:
+            raise RuntimeError("ConsultationStore is closed")
+        consultation_id = consultation_id or uuid.uuid4().hex
+        self._queue.put(
+            {
+                "id": consultation_id,
+                "created": created if created is not None else time.time(),
+                "symptoms": symptoms,
+                "messages": [
+                    {"name": m.get("name"), "content": m.get("content")}
+                    for m in messages
+                ],
+                **details,
+            }
+        )
+        return consultation_id
+
+    def record_costs(self, rows):
+        """Queue cost rows from a CostLedger (one per consultation, agent and model)"""
+        if self._closed:
+            raise RuntimeError("ConsultationStore is closed")
+        self._queue.put({"costs": list(rows)})
+
+    def record_result(self, result, consultation_id=None):
+        """Queue a ConsultationResult from the engine"""
+        trace = result.trace or {}
+        return self.record(
+            result.symptoms,
+            result.messages,
+            consultation_id=consultation_id or trace.get("consultation_id"),
+            created=trace.get("started"),
+            error=result.error,
+            elapsed=result.elapsed,
+            trace=result.trace,
+        )
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in range(len(batch) + int(stop)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        """Write a batch, or its records one by one if the batch fails"""
+        try:
+            self._write(batch)
+            return
+        except Exception:
+            if len(batch) == 1:
+                self.failed += 1
+                logger.exception("Dropping a record the store could not write")
+                return
+            logger.warning("Store batch of %d failed; writing one by one", len(batch))
+        for item in batch:
+            try:
+                self._write([item])
+            except Exception:
+                self.failed += 1
+                logger.exception("Dropping a record the store could not write")
+
+    def _write(self, batch):
+        consultations, messages, spans, terms, costs = [], [], [], [], []
+        for item in batch:
+            if "costs" in item:
+                costs.extend(
+                    (
+                        row["consultation_id"],
+                        row["agent"],
+                        row["model"] or "",
+                        row["tenant"],
+                        row["created"],
+                        row["calls"],
+                        row["prompt_tokens"],
+                        row["cached_prompt_tokens"],
+                        row["completion_tokens"],
+                        row["cost"],
+                    )
+                    for row in item["costs"]
+                )
+                continue
+            final = recommendation(item["messages"])
+            consultations.append(
+                (
+                    item["id"],
+                    item["created"],
+                    item["symptoms"],
+                    UNKNOWN if item.get("error") else classify_outcome(final),
+                    final,
+                    item.get("error"),
+                    item.get("elapsed"),
+                )
+            )
+            for position, message in enumerate(item["messages"]):
+                messages.append(
+                    (item["id"], position, message["name"], message["content"])
+                )
+            for span in (item.get("trace") or {}).get("spans", []):
+                spans.append(
+                    (
+                        item["id"],
+                        span.get("round"),
+                        span.get("agent"),
+                        span.get("model"),
+                        span.get("wall_seconds"),
+                        span.get("ttft_seconds"),
+                        span.get("prompt_tokens"),
+                        span.get("completion_tokens"),
+                        int(bool(span.get("cache_hit"))),
+                    )
+                )
+            terms.extend((term, item["id"]) for term in symptom_terms(item["symptoms"]))
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO consultations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    consultations,
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?)", messages
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    spans,
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO symptom_terms VALUES (?, ?)", terms
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO costs "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    costs,
+                )
+            self.written += len(consultations)
+
+    def flush(self):
+        """Block until every queued consultation has been written"""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def search(self, terms=None, outcome=None, since=None, until=None, limit=100):
+        """Newest consultations matching every symptom term, outcome and time range"""
+        clauses, params = [], []
+        for term in symptom_terms(terms) if terms else []:
+            clauses.append(
+                "id IN (SELECT consultation_id FROM symptom_terms WHERE term = ?)"
+            )
+            params.append(term)
+        if outcome is not None:
+            clauses.append("outcome = ?")
+            params.append(outcome)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT * FROM consultations {where} ORDER BY created DESC LIMIT ?",
+            (*params, limit),
+        )
+
+    def get(self, consultation_id):
+        """One consultation with its messages and spans, or None"""
+        rows = self._query(
+            "SELECT * FROM consultations WHERE id = ?", (consultation_id,)
+        )
+        if not rows:
+            return None
+        consultation = rows[0]
+        consultation["messages"] = self._query(
+            "SELECT agent AS name, content FROM messages "
+            "WHERE consultation_id = ? ORDER BY position",
+            (consultation_id,),
+        )
+        consultation["spans"] = self._query(
+            "SELECT * FROM spans WHERE consultation_id = ? ORDER BY round",
+            (consultation_id,),
+        )
+        return consultation
+
+    def outcome_counts(self, since=None, until=None):
+        """Number of consultations per outcome in a time range"""
+        rows = self._query(
+            "SELECT outcome, COUNT(*) AS n FROM consultations "
+            "WHERE created >= ? AND created < ? GROUP BY outcome",
+            (since or 0, until or float("inf")),
+        )
+        return {row["outcome"]: row["n"] for row in rows}
+
+    def tenant_spend(self, tenant, since=None, until=None):
+        """Cost and tokens recorded for a tenant in a time range"""
+        rows = self._query(
+            "SELECT COALESCE(SUM(cost), 0) AS cost, "
+            "COALESCE(SUM(prompt_tokens + completion_tokens), 0) AS tokens "
+            "FROM costs WHERE tenant = ? AND created >= ? AND created < ?",
+            (tenant, since or 0, until or float("inf")),
+        )
+        return rows[0]
+
+    def cost_by_agent(self, since=None, until=None, tenant=None):
+        """Calls, tokens and cost per agent and model, most expensive first"""
+        clauses = ["created >= ?", "created < ?"]
+        params = [since or 0, until or float("inf")]
+        if tenant is not None:
+            clauses.append("tenant = ?")
+            params.append(tenant)
+        return self._query(
+            "SELECT agent, model, SUM(calls) AS calls, "
+            "SUM(prompt_tokens) AS prompt_tokens, "
+            "SUM(cached_prompt_tokens) AS cached_prompt_tokens, "
+            "SUM(completion_tokens) AS completion_tokens, SUM(cost) AS cost "
+            f"FROM costs WHERE {' AND '.join(clauses)} "
+            "GROUP BY agent, model ORDER BY cost DESC",
+            params,
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM consultations").fetchone()[
+                0
+            ]
+
+
+def from_environment():
+    """ConsultationStore at CONSULTATION_STORE_PATH, or None"""
+    path = os.getenv("CONSULTATION_STORE_PATH")
+    return ConsultationStore(path) if path else None
+
+
+_store = None
+_store_lock = threading.Lock()
+_stores = weakref.WeakSet()
+
+
+def _reopen_after_fork():
+    for store in list(_stores):
+        store._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def get_store():
+    """Return the process-wide store from the environment, or None"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = from_environment()
+    return _store
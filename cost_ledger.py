@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Token and cost accounting for agent LLM calls
+
+``CostLedger`` is an LLM middleware that accounts every call an agent makes
+(prompt, cached prompt and completion tokens, and their cost):
+
+- per consultation, inside ``ledger.consultation(...)``
+- per tenant, agent role and model, as in-memory counters for the process
+
+Costs are priced from ``prices`` (USD per 1k prompt / completion tokens,
+cached prompt tokens at ``cached_discount``), or taken from the model
+client's own ``response.cost`` for models without a price. Replies served
+locally (response cache hits, derived structured replies) cost nothing.
+
+A tenant may have a ``TenantBudget`` of cost and/or tokens per period.
+Each call first reserves its estimated cost; one that would take the tenant
+over budget raises ``BudgetExceeded`` instead of reaching the provider, and
+``ledger.allows(tenant)`` lets callers refuse new work before it starts.
+
+Finished consultations are queued as one row per (agent, model) and handed
+to ``sink`` in batches of ``batch_size`` rows or every ``flush_interval``
+seconds, e.g. ``ConsultationStore.record_costs``.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from instrumentation import cached_prompt_tokens, format_labels
+from llm_middleware import agent_model
+from rate_limit import DEFAULT_COMPLETION_ESTIMATE
+
+DEFAULT_TENANT = "default"
+DEFAULT_PERIOD = 24 * 3600
+
+# USD per 1k (prompt, completion) tokens; the longest matching prefix wins
+DEFAULT_PRICES = {
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4.1": (0.002, 0.008),
+    "gpt-4.1-mini": (0.0004, 0.0016),
+    "gpt-4.1-nano": (0.0001, 0.0004),
+}
+# Share of the prompt price charged for tokens served from the prompt cache
+DEFAULT_CACHED_DISCOUNT = 0.5
+
+_current = ContextVar("consultation_cost", default=None)
+
+
+class BudgetExceeded(RuntimeError):
+    """A tenant's budget for the current period does not cover the call"""
+
+
+@dataclass
+class TenantBudget:
+    """Spend allowed to one tenant per ``period`` seconds"""
+
+    max_cost: Optional[float] = None
+    max_tokens: Optional[int] = None
+    period: float = DEFAULT_PERIOD
+
+
+def new_totals():
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost": 0.0,
+    }
+
+
+def add_totals(totals, calls, prompt, cached, completion, cost):
+    totals["calls"] += calls
+    totals["prompt_tokens"] += prompt
+    totals["cached_prompt_tokens"] += cached
+    totals["completion_tokens"] += completion
+    totals["cost"] += cost
+
+
+class ConsultationCost:
+    """Spend of one consultation, per agent and model"""
+
+    def __init__(self, tenant=DEFAULT_TENANT, consultation_id=None):
+        self.tenant = tenant
+        self.consultation_id = consultation_id or uuid.uuid4().hex
+        self.created = time.time()
+        self.lines = {}
+        self._lock = threading.Lock()
+
+    def add(self, agent, model, prompt, cached, completion, cost):
+        # DAG steps of one consultation run concurrently
+        with self._lock:
+            totals = self.lines.setdefault((agent, model), new_totals())
+            add_totals(totals, 1, prompt, cached, completion, cost)
+
+    @property
+    def cost(self):
+        return sum(totals["cost"] for totals in self.lines.values())
+
+    @property
+    def tokens(self):
+        return sum(
+            totals["prompt_tokens"] + totals["completion_tokens"]
+            for totals in self.lines.values()
+        )
+
+    def by_agent(self):
+        """Totals per agent role, for spotting the role that dominates spend"""
+        agents = {}
+        for (agent, _), totals in self.lines.items():
+            add_totals(agents.setdefault(agent, new_totals()), *totals.values())
+        return agents
+
+    def rows(self):
+        """One row per (agent, model) for ``sink``"""
+        return [
+            {
+                "consultation_id": self.consultation_id,
+                "tenant": self.tenant,
+                "created": self.created,
+                "agent": agent,
+                "model": model,
+                **totals,
+            }
+            for (agent, model), totals in self.lines.items()
+        ]
+
+    def to_dict(self):
+        return {
+            "tenant": self.tenant,
+            "cost": self.cost,
+            "tokens": self.tokens,
+            "agents": self.by_agent(),
+        }
+
+
+class _TenantSpend:
+    """Spend and outstanding reservations of a tenant in the current period"""
+
+    def __init__(self):
+        self.window = None
+        self.cost = 0.0
+        self.tokens = 0
+        self.reserved_cost = 0.0
+        self.reserved_tokens = 0
+
+
+class CostLedger:
+    """LLM middleware accounting tokens and cost, and enforcing tenant budgets"""
+
+    def __init__(
+        self,
+        budgets=None,
+        prices=None,
+        cached_discount=DEFAULT_CACHED_DISCOUNT,
+        sink=None,
+        batch_size=256,
+        flush_interval=5.0,
+        clock=time.time,
+    ):
+        self.budgets = dict(budgets or {})
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self.cached_discount = cached_discount
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._spend = {}
+        self._pending = []
+        self._flushed_at = time.monotonic()
+        self.rejected = 0
+
+    def price(self, model):
+        """(prompt, completion) USD per 1k tokens for ``model``, or None"""
+        model = model or ""
+        matches = [name for name in self.prices if model.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def call_cost(self, model, prompt, cached, completion, response=None):
+        price = self.price(model)
+        if price is None:
+            return getattr(response, "cost", 0.0) or 0.0
+        prompt_price, completion_price = price
+        billed_prompt = prompt - cached + cached * self.cached_discount
+        return (billed_prompt * prompt_price + completion * completion_price) / 1000
+
+    def estimate(self, model, params):
+        """Tokens and cost a call is expected to use, before it is made"""
+        chars = sum(
+            len(str(m.get("content") or "")) for m in params.get("messages") or []
+        )
+        prompt = chars // 4
+        completion = params.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+        return prompt + completion, self.call_cost(model, prompt, 0, completion)
+
+    @contextmanager
+    def consultation(self, tenant=None, consultation_id=None):
+        """Account the LLM calls made inside this block to one consultation"""
+        cost = ConsultationCost(tenant or DEFAULT_TENANT, consultation_id)
+        token = _current.set(cost)
+        try:
+            yield cost
+        finally:
+            _current.reset(token)
+            self._queue(cost.rows())
+
+    def _tenant_spend(self, tenant):
+        """Spend of ``tenant`` in the current period; call with the lock held"""
+        spend = self._spend.get(tenant)
+        if spend is None:
+            spend = self._spend[tenant] = _TenantSpend()
+        budget = self.budgets.get(tenant)
+        window = int(self.clock() // budget.period) if budget else 0
+        if spend.window != window:
+            # Calls reserved in the old period are not released into this one
+            spend.window = window
+            spend.cost = 0.0
+            spend.tokens = 0
+            spend.reserved_cost = 0.0
+            spend.reserved_tokens = 0
+        return spend
+
+    def _over(self, budget, spend, tokens=0, cost=0.0):
+        if budget is None:
+            return False
+        if budget.max_cost is not None:
+            if spend.cost + spend.reserved_cost + cost > budget.max_cost:
+                return True
+        if budget.max_tokens is not None:
+            if spend.tokens + spend.reserved_tokens + tokens > budget.max_tokens:
+                return True
+        return False
+
+    def allows(self, tenant=None):
+        """True while ``tenant`` has budget left in the current period"""
+        tenant = tenant or DEFAULT_TENANT
+        budget = self.budgets.get(tenant)
+        if budget is None:
+            return True
+        with self._lock:
+            spend = self._tenant_spend(tenant)
+            if budget.max_cost is not None and spend.cost >= budget.max_cost:
+                return False
+            return budget.max_tokens is None or spend.tokens < budget.max_tokens
+
+    def check(self, tenant=None):
+        """Raise ``BudgetExceeded`` if ``tenant`` has no budget left"""
+        if not self.allows(tenant):
+            with self._lock:
+                self.rejected += 1
+            raise BudgetExceeded(f"budget for tenant {tenant!r} is exhausted")
+
+    def _reserve(self, tenant, tokens, cost):
+        budget = self.budgets.get(tenant)
+        with self._lock:
+            spend = self._tenant_spend(tenant)
+            if self._over(budget, spend, tokens, cost):
+                self.rejected += 1
+                raise BudgetExceeded(
+                    f"budget for tenant {tenant!r} does not cover this call "
+                    f"(spent ${spend.cost:.4f} and {spend.tokens} tokens)"
+                )
+            spend.reserved_tokens += tokens
+            spend.reserved_cost += cost
+            return spend.window
+
+    def __call__(self, agent, params, call_next):
+        current = _current.get()
+        tenant = current.tenant if current is not None else DEFAULT_TENANT
+        model = params.get("model") or agent_model(agent)
+        tokens, cost = self.estimate(model, params)
+        window = self._reserve(tenant, tokens, cost)
+        response = None
+        try:
+            response = call_next(params)
+            return response
+        finally:
+            self.record(agent.name, model, response, tenant, window, tokens, cost)
+
+    def record(self, agent_name, model, response, tenant, window, tokens, cost):
+        """Settle a call's reservation with its actual usage"""
+        usage = getattr(response, "usage", None)
+        if getattr(response, "cached", False):
+            # Served locally: the provider was not called
+            usage = None
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        cached = cached_prompt_tokens(usage)
+        model = getattr(response, "model", None) or model
+        actual = 0.0
+        if usage is not None:
+            actual = self.call_cost(model, prompt, cached, completion, response)
+        with self._lock:
+            spend = self._tenant_spend(tenant)
+            if spend.window == window:
+                spend.reserved_tokens -= tokens
+                spend.reserved_cost -= cost
+            spend.tokens += prompt + completion
+            spend.cost += actual
+            if response is not None:
+                totals = self._totals.setdefault(
+                    (tenant, agent_name, model), new_totals()
+                )
+                add_totals(totals, 1, prompt, cached, completion, actual)
+        current = _current.get()
+        if current is not None and response is not None:
+            current.add(agent_name, model, prompt, cached, completion, actual)
+
+    def _queue(self, rows):
+        with self._lock:
+            self._pending.extend(rows)
+            due = len(self._pending) >= self.batch_size or (
+                time.monotonic() - self._flushed_at >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Hand every queued consultation row to ``sink``"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._flushed_at = time.monotonic()
+        if rows and self.sink is not None:
+            self.sink(rows)
+
+    def totals(self, by=("tenant", "agent", "model")):
+        """Process totals grouped by any of tenant, agent and model"""
+        fields = ("tenant", "agent", "model")
+        grouped = {}
+        with self._lock:
+            for key, totals in self._totals.items():
+                labels = dict(zip(fields, key))
+                group = tuple(labels[name] for name in by)
+                add_totals(grouped.setdefault(group, new_totals()), *totals.values())
+        return grouped
+
+    def spend(self, tenant=None):
+        """Spend and budget of ``tenant`` in the current period"""
+        tenant = tenant or DEFAULT_TENANT
+        budget = self.budgets.get(tenant)
+        with self._lock:
+            spend = self._tenant_spend(tenant)
+            return {
+                "tenant": tenant,
+                "cost": spend.cost,
+                "tokens": spend.tokens,
+                "max_cost": budget.max_cost if budget else None,
+                "max_tokens": budget.max_tokens if budget else None,
+            }
+
+    def load_store(self, store):
+        """Resume this period's tenant spend from a ConsultationStore's cost rows"""
+        for tenant, budget in self.budgets.items():
+            since = int(self.clock() // budget.period) * budget.period
+            spent = store.tenant_spend(tenant, since=since)
+            with self._lock:
+                spend = self._tenant_spend(tenant)
+                spend.cost += spent["cost"]
+                spend.tokens += spent["tokens"]
+
+    def render_prometheus(self, prefix="consultation_"):
+        """Token and cost counters in the Prometheus text exposition format"""
+        lines = [f"# TYPE {prefix}llm_cost_usd_total counter"]
+        totals = self.totals()
+        for (tenant, agent, model), values in sorted(totals.items()):
+            labels = {"tenant": tenant, "agent": agent, "model": model}
+            lines.append(
+                f"{prefix}llm_cost_usd_total{format_labels(labels)} {values['cost']}"
+            )
+        lines.append(f"# TYPE {prefix}budget_rejections_total counter")
+        lines.append(f"{prefix}budget_rejections_total {self.rejected}")
+        return "\n".join(lines) + "\n"
+
+
+def budgets_from_environment():
+    """Tenant budgets from COST_BUDGETS, e.g. '{"acme": {"max_cost": 5}}'"""
+    value = os.getenv("COST_BUDGETS")
+    if not value:
+        return {}
+    period = float(os.getenv("COST_BUDGET_PERIOD", DEFAULT_PERIOD))
+    return {
+        tenant: TenantBudget(period=period, **limits)
+        for tenant, limits in json.loads(value).items()
+    }
+
+
+def from_environment(store=None):
+    """CostLedger with budgets from the environment, writing rows to ``store``"""
+    ledger = CostLedger(
+        budgets_from_environment(),
+        sink=store.record_costs if store is not None else None,
+    )
+    if store is not None:
+        ledger.load_store(store)
+    return ledger
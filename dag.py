@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+DAG orchestration: run independent specialist agents concurrently
+
+The GroupChat runs diagnosis -> pharmacy -> consultation one after the
+other. Some of that work does not depend on the rest: urgency screening
+only needs the symptoms, just like the differential diagnosis. A DAG of
+``DagStep``s lets independent steps run at the same time and a join step
+merge their outputs, so a consultation takes as long as its critical path
+instead of the sum of every agent's latency.
+
+Enable it with ``ConsultationPipeline(..., dag=DEFAULT_DAG)``. Steps call
+the pipeline's own agents, so middleware (cache, instrumentation, budget
+accounting) applies exactly as in the GroupChat.
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+
+from termination import COMPLETION_MARKER
+
+
+@dataclass(frozen=True)
+class DagStep:
+    """One node of the DAG; ``agent=None`` makes it a join that merges ``needs``"""
+
+    name: str
+    agent: Optional[str] = None
+    needs: tuple = ()
+    instruction: Optional[str] = None
+    title: Optional[str] = None
+
+
+DEFAULT_DAG = (
+    DagStep("diagnosis", agent="diagnosis", title="Possible diagnosis"),
+    DagStep(
+        "urgency",
+        agent="consultation",
+        instruction=(
+            "Screen these symptoms for red flags only. State whether a doctor's "
+            "visit is required and how urgently, with clear next steps."
+        ),
+        title="Urgency and next steps",
+    ),
+    DagStep(
+        "pharmacy",
+        agent="pharmacy",
+        needs=("diagnosis",),
+        title="Recommended medications",
+    ),
+    DagStep("consultation", needs=("diagnosis", "pharmacy", "urgency")),
+)
+
+
+def validate(steps):
+    """Steps in a runnable order; raises ValueError for unknown needs or cycles"""
+    by_name = {step.name: step for step in steps}
+    if len(by_name) != len(steps):
+        raise ValueError("DAG step names must be unique")
+    for step in steps:
+        unknown = set(step.needs) - set(by_name)
+        if unknown:
+            raise ValueError(
+                f"Step {step.name!r} needs unknown steps {sorted(unknown)}"
+            )
+    ordered, done = [], set()
+    while len(ordered) < len(steps):
+        ready = [s for s in steps if s.name not in done and set(s.needs) <= done]
+        if not ready:
+            raise ValueError("DAG steps contain a cycle")
+        ordered.extend(ready)
+        done.update(s.name for s in ready)
+    return ordered
+
+
+def merge_outputs(step, outputs, steps):
+    """Deterministic join: one titled section per needed step"""
+    titles = {s.name: s.title or s.name.capitalize() for s in steps}
+    sections = [
+        f"{titles[name]}:\n{outputs[name].replace(COMPLETION_MARKER, '').strip()}"
+        for name in step.needs
+        if outputs.get(name)
+    ]
+    return "\n\n".join(sections + [COMPLETION_MARKER])
+
+
+class DagRunner:
+    """Runs one consultation through a DAG of steps on a pipeline's agents"""
+
+    def __init__(self, pipeline, steps=DEFAULT_DAG, join=merge_outputs):
+        self.pipeline = pipeline
+        self.steps = validate(tuple(steps))
+        self.join = join
+
+    def step_messages(self, step, opening, outputs):
+        messages = [{"role": "user", "name": "patient", "content": opening}]
+        for name in step.needs:
+            speaker = next(s.agent or s.name for s in self.steps if s.name == name)
+            messages.append({"role": "user", "name": speaker, "content": outputs[name]})
+        if step.instruction:
+            messages.append(
+                {"role": "user", "name": "manager", "content": step.instruction}
+            )
+        return messages
+
+    def run_step(self, step, opening, outputs):
+        if step.agent is None:
+            return self.join(step, outputs, self.steps)
+        agent = self.pipeline.agents[step.agent]
+        reply = agent.generate_reply(
+            messages=self.step_messages(step, opening, outputs),
+            sender=self.pipeline.manager,
+        )
+        if isinstance(reply, dict):
+            reply = reply.get("content")
+        return reply or ""
+
+    async def a_run_step(self, step, opening, outputs):
+        if step.agent is None:
+            return self.join(step, outputs, self.steps)
+        agent = self.pipeline.agents[step.agent]
+        reply = await agent.a_generate_reply(
+            messages=self.step_messages(step, opening, outputs),
+            sender=self.pipeline.manager,
+        )
+        if isinstance(reply, dict):
+            reply = reply.get("content")
+        return reply or ""
+
+    def run(self, opening):
+        """Run every step, concurrently where possible; returns {step: output}"""
+        terminator = self.pipeline.terminator
+        outputs, pending = {}, {}
+        remaining = list(self.steps)
+        with ThreadPoolExecutor(max_workers=len(self.steps)) as executor:
+            while remaining or pending:
+                ready = [s for s in remaining if set(s.needs) <= set(outputs)]
+                for step in ready:
+                    remaining.remove(step)
+                    if terminator is not None and terminator.budget_exhausted():
+                        terminator.stop_reason = "budget"
+                        continue
+                    # Each step runs in a copy of this context so stream sinks
+                    # and traces follow it onto the worker thread
+                    context = contextvars.copy_context()
+                    future = executor.submit(
+                        context.run, self.run_step, step, opening, dict(outputs)
+                    )
+                    pending[future] = step
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    outputs[pending.pop(future).name] = future.result()
+        if terminator is not None and terminator.stop_reason is None:
+            terminator.stop_reason = "dag"
+        return outputs
+
+    async def a_run(self, opening):
+        """Awaitable ``run``: steps are tasks on the running event loop"""
+        terminator = self.pipeline.terminator
+        outputs, pending = {}, {}
+        remaining = list(self.steps)
+        try:
+            while remaining or pending:
+                ready = [s for s in remaining if set(s.needs) <= set(outputs)]
+                for step in ready:
+                    remaining.remove(step)
+                    if terminator is not None and terminator.budget_exhausted():
+                        terminator.stop_reason = "budget"
+                        continue
+                    task = asyncio.ensure_future(
+                        self.a_run_step(step, opening, dict(outputs))
+                    )
+                    pending[task] = step
+                if not pending:
+                    break
+                finished, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    outputs[pending.pop(task).name] = task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        if terminator is not None and terminator.stop_reason is None:
+            terminator.stop_reason = "dag"
+        return outputs
+
+    def messages(self, opening, outputs):
+        """The consultation as GroupChat-style messages, in step order"""
+        messages = [{"role": "user", "name": "patient", "content": opening}]
+        for step in self.steps:
+            if step.name in outputs:
+                messages.append(
+                    {
+                        "role": "user",
+                        "name": step.agent or step.name,
+                        "content": outputs[step.name],
+                    }
+                )
+        return messages
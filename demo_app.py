@@ -5,8 +5,10 @@ A simple web interface to showcase the system
 """
 
 import streamlit as st
+import asyncio
 import os
 import sys
+import uuid
 from datetime import datetime
 
 # Add the current directory to Python path
@@ -18,8 +20,11 @@ try:
     import os
     import logging
     from dotenv import load_dotenv
-    from autogen import ConversableAgent, GroupChat, GroupChatManager
-    from openai import OpenAI
+    from healthcare_chatbot import build_llm_config
+    from agent_pool import get_pool
+    from consultation_store import get_store
+    from session_manager import get_session_manager
+    from streaming import Transcript, on_loop, stream_to, streaming_middleware
 except ImportError:
     st.error("Please install required dependencies: pip install autogen openai python-dotenv streamlit")
     st.stop()
@@ -39,51 +44,14 @@ load_dotenv()
 warnings.filterwarnings("ignore")
 logging.getLogger("autogen.oai.client").setLevel(logging.ERROR)
 
-def initialize_agents():
-    """Initialize the multi-agent system"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return None, None
-    
-    llm_config = {"config_list": [{"model": "gpt-4o", "api_key": api_key}]}
-    
-    agents = {
-        "patient": ConversableAgent(
-            name="patient",
-            system_message="You describe symptoms and ask for medical help.",
-            llm_config=llm_config
-        ),
-        "diagnosis": ConversableAgent(
-            name="diagnosis",
-            system_message="You analyze symptoms and provide a possible diagnosis. Summarize key points in one response.",
-            llm_config=llm_config
-        ),
-        "pharmacy": ConversableAgent(
-            name="pharmacy",
-            system_message="You recommend medications based on diagnosis. Only respond once.",
-            llm_config=llm_config
-        ),
-        "consultation": ConversableAgent(
-            name="consultation",
-            system_message="You determine if a doctor's visit is required. Provide a final summary with clear next steps. IMPORTANT: End your response with 'CONSULTATION_COMPLETE' to signal the end of the conversation.",
-            llm_config=llm_config
-        )
-    }
-    
-    groupchat = GroupChat(
-        agents=[agents["diagnosis"], agents["pharmacy"], agents["consultation"]],
-        messages=[],
-        max_round=5,
-        speaker_selection_method="round_robin"
-    )
-    
-    manager = GroupChatManager(name="manager", groupchat=groupchat)
-    
-    return agents, manager
-
 def main():
     """Main Streamlit app"""
     
+    # Per-browser-session state; pooled agents keep nothing between consultations
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    sessions = get_session_manager()
+    sessions.session(session_id)
+    
     # Header
     st.title("🏥 Multi-Agent Healthcare Chatbot Demo")
     st.markdown("**Experience AI-powered medical consultation with collaborative agents**")
@@ -101,6 +69,8 @@ def main():
         
         if api_key:
             os.environ["OPENAI_API_KEY"] = api_key
+            # Build agents ahead of the first click; later reruns reuse them
+            get_pool().warm(build_llm_config(api_key), middlewares=[streaming_middleware])
             st.success("✅ API Key configured")
         else:
             st.warning("⚠️ Demo mode - no live consultation")
@@ -131,6 +101,12 @@ def main():
         st.markdown(f"**Model**: GPT-4o")
         st.markdown(f"**Max Rounds**: 5")
         st.markdown(f"**Speaker Method**: Round-robin")
+        
+        memory = sessions.stats()
+        st.markdown(f"**Active Sessions**: {memory['sessions']}")
+        st.markdown(f"**Retained History**: {memory['bytes'] / 1024:.1f} KB")
+        if memory["resident_bytes"]:
+            st.markdown(f"**Process Memory**: {memory['resident_bytes'] / 2**20:.0f} MB")
     
     # Main content
     col1, col2 = st.columns([2, 1])
@@ -179,50 +155,64 @@ def main():
                 st.info("💡 This is a demo. Add your API key for live consultation!")
             else:
                 with st.spinner("Initializing multi-agent consultation..."):
+                    pool = get_pool()
+                    pipeline = None
+                    error = None
                     try:
-                        # Initialize agents
-                        agents, manager = initialize_agents()
-                        
-                        if agents is None or manager is None:
-                            st.error("Failed to initialize agents. Please check your API key.")
-                            return
+                        # Check out pre-built agents; they are reset and returned below
+                        pipeline = pool.checkout(
+                            build_llm_config(api_key), middlewares=[streaming_middleware]
+                        )
                         
                         # Start consultation
                         st.markdown("### 🤖 Multi-Agent Consultation")
                         st.markdown("**Patient**: " + symptoms)
                         
-                        # Create a placeholder for the conversation
-                        conversation_placeholder = st.empty()
+                        # One placeholder per agent turn, filled in as tokens arrive
+                        turn_placeholders = []
                         
-                        # For demo purposes, show the same conversation
-                        conversation_text = f"""
-**Patient Agent**: {symptoms}
-
-**Diagnosis Agent**: Based on your symptoms, possible causes include:
-- Dehydration
-- Stress or anxiety
-- Sleep deprivation  
-- Viral infection
-- Migraine
-
-**Pharmacy Agent**: For your symptoms, I recommend:
-- Rest and adequate sleep (7-9 hours)
-- Stay hydrated (8-10 glasses of water daily)
-- Over-the-counter pain relief (ibuprofen or acetaminophen)
-- Stress management techniques
-
-**Consultation Agent**: Monitor your symptoms for 2-3 days. If they worsen or persist, or if you develop additional symptoms like fever, nausea, or vision changes, please consult a healthcare professional immediately.
-
-**CONSULTATION_COMPLETE**
-                        """
+                        def render_turn(turn, agent_name, text):
+                            if turn == len(turn_placeholders):
+                                turn_placeholders.append(st.empty())
+                            turn_placeholders[turn].markdown(
+                                f"**{agent_name.capitalize()} Agent**: {text}"
+                            )
+                        
+                        # One event loop drives the chat; tokens are rendered
+                        # on this script thread as they arrive
+                        async def consult():
+                            with stream_to(on_loop(Transcript(render_turn))):
+                                await pipeline.a_consult(symptoms)
                         
-                        conversation_placeholder.markdown(conversation_text)
+                        asyncio.run(consult())
                         
                         st.success("✅ Consultation completed successfully!")
                         
                     except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
                         st.error(f"❌ Error during consultation: {str(e)}")
                         st.info("This might be due to API rate limits or network issues.")
+                    finally:
+                        if pipeline is not None:
+                            # Keep the transcript before the pipeline is reset
+                            store = get_store()
+                            if store is not None:
+                                store.record(
+                                    symptoms, pipeline.groupchat.messages, error=error
+                                )
+                            sessions.record(
+                                session_id, symptoms, pipeline.groupchat.messages, error
+                            )
+                            pool.release(pipeline)
+        
+        # Earlier consultations from this browser session
+        history = sessions.history(session_id)
+        if history:
+            with st.expander(f"🗂️ Previous consultations ({len(history)})"):
+                for past in reversed(history):
+                    st.markdown(f"**Patient**: {past.symptoms}")
+                    st.markdown(past.error or past.summary or "")
+                    st.markdown("---")
     
     with col2:
         st.header("📋 System Overview")
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Deterministic offline stand-in for the OpenAI chat completions API
+
+Two ways to run the real GroupChat/GroupChatManager flow without a network
+or an API key:
+
+- ``FakeLLMClient``: an autogen ``ModelClient`` selected through
+  ``fake_llm_config()``; it runs inside the agent's OpenAIWrapper.
+- ``FakeOpenAIServer``: a local HTTP server speaking the
+  ``/v1/chat/completions`` protocol (including SSE streaming), for
+  measuring the openai SDK and connection handling as well.
+
+Replies are canned per agent role and latency is drawn from a seeded
+``LatencyModel``, so runs are reproducible. Both simulate provider-side
+prompt caching (``PromptCache``): a prompt prefix of 1024 tokens or more
+that an earlier request already sent is reported as
+``usage.prompt_tokens_details.cached_tokens`` and, with
+``cached_ttft_saving`` set, shortens the time to first token.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from healthcare_chatbot import register_model_client_class
+from prompts import role_section
+from termination import COMPLETION_MARKER
+
+FAKE_API_KEY = "sk-fake-0000000000000000000000000000000000000000"
+
+# Matched in order against the role section of the system message;
+# pharmacy's instructions also mention "diagnosis", so that entry comes last
+ROLE_REPLIES = (
+    (
+        "doctor's visit",
+        "A doctor's visit is not required now. Monitor symptoms for 48 hours "
+        "and seek care if fever, stiff neck or vision changes develop. "
+        + COMPLETION_MARKER,
+    ),
+    (
+        "medications",
+        "Recommended medications: acetaminophen 500 mg every 6 hours as "
+        "needed, oral rehydration, rest.",
+    ),
+    (
+        "diagnosis",
+        "Possible diagnosis: tension headache or dehydration; viral illness "
+        "is less likely. Key points: onset, hydration and sleep.",
+    ),
+)
+DEFAULT_REPLY = "Please describe your symptoms in more detail."
+
+# Payloads for structured_output / response_format requests, by schema name
+STRUCTURED_REPLIES = {
+    "diagnosis": {
+        "conditions": [
+            {"name": "tension headache", "likelihood": "high"},
+            {"name": "dehydration", "likelihood": "medium"},
+        ],
+        "urgency": "routine",
+        "key_points": ["onset", "hydration", "sleep"],
+    },
+    "pharmacy": {
+        "medications": [
+            {
+                "name": "acetaminophen",
+                "dose": "500 mg every 6 hours as needed",
+                "cautions": "no more than 3000 mg a day",
+            }
+        ],
+        "self_care": ["oral rehydration", "rest"],
+        "needs_prescription": False,
+    },
+}
+FILLER = "Additional context follows for completeness."
+
+
+class LatencyModel:
+    """Seeded distribution of time-to-first-token, token rate and reply length"""
+
+    def __init__(
+        self,
+        ttft=0.0,
+        ttft_jitter=0.0,
+        tokens_per_second=0.0,
+        completion_tokens=(20, 40),
+        seed=0,
+    ):
+        self.ttft = ttft
+        self.ttft_jitter = ttft_jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        keys = ("ttft", "ttft_jitter", "tokens_per_second", "completion_tokens")
+        return cls(
+            **{k: config[k] for k in keys if k in config}, seed=config.get("seed", 0)
+        )
+
+    def sample(self):
+        """(time to first token, seconds per token, completion tokens) for one call"""
+        with self._lock:
+            ttft = max(0.0, self._random.gauss(self.ttft, self.ttft_jitter))
+            low, high = self.completion_tokens
+            tokens = self._random.randint(low, high)
+        per_token = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        return ttft, per_token, tokens
+
+
+def rate_limit_error(retry_after_ms=10):
+    """The openai.RateLimitError a provider 429 would raise"""
+    import httpx
+    import openai
+
+    request = httpx.Request("POST", "https://fake.invalid/v1/chat/completions")
+    response = httpx.Response(
+        429, headers={"retry-after-ms": str(retry_after_ms)}, request=request
+    )
+    return openai.RateLimitError(
+        "Rate limit reached (fake)", response=response, body=None
+    )
+
+
+# Provider caching works on whole blocks of a prompt prefix above a minimum
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text):
+    """About four characters per token, like ``rate_limit.estimate_tokens``"""
+    return len(str(text or "")) // CHARS_PER_TOKEN
+
+
+def generate_reply(messages, completion_tokens):
+    """Canned reply for the role described by the system message, padded to length"""
+    system = next(
+        (m.get("content") or "" for m in messages if m.get("role") == "system"), ""
+    )
+    role = role_section(system)
+    text = next((reply for key, reply in ROLE_REPLIES if key in role), DEFAULT_REPLY)
+    words = text.split()
+    marker = [COMPLETION_MARKER] if words and words[-1] == COMPLETION_MARKER else []
+    body = words[: len(words) - len(marker)]
+    filler = FILLER.split()
+    while len(body) + len(marker) < completion_tokens:
+        body.extend(filler)
+    return body + marker
+
+
+def structured_reply(name):
+    """Words of the canned JSON payload for a schema name, or None"""
+    payload = STRUCTURED_REPLIES.get(name)
+    return json.dumps(payload).split() if payload is not None else None
+
+
+def prompt_tokens(messages):
+    return sum(count_tokens(m.get("content")) for m in messages)
+
+
+class PromptCache:
+    """Prefix cache keyed by hashes of 128-token blocks of the prompt, like a provider's"""
+
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _block_hashes(self, messages):
+        text = "".join(f"<{m.get('role')}>{m.get('content') or ''}\n" for m in messages)
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha256()
+        hashes = []
+        for start in range(0, len(text) - block + 1, block):
+            digest.update(text[start : start + block].encode("utf-8"))
+            hashes.append(digest.copy().hexdigest())
+        return hashes
+
+    def lookup(self, messages):
+        """Tokens of the prompt served from cache; remembers this prompt's prefixes"""
+        hashes = self._block_hashes(messages)
+        hits = 0
+        with self._lock:
+            for digest in hashes:
+                if digest not in self._prefixes:
+                    break
+                self._prefixes.move_to_end(digest)
+                hits += 1
+            for digest in hashes[hits:]:
+                self._prefixes[digest] = True
+            while len(self._prefixes) > self.max_entries:
+                self._prefixes.popitem(last=False)
+        cached = hits * CACHE_BLOCK_TOKENS
+        return cached if cached >= CACHE_MIN_TOKENS else 0
+
+    def clear(self):
+        with self._lock:
+            self._prefixes.clear()
+
+
+PROMPT_CACHE = PromptCache()
+
+
+def cached_ttft(ttft, n_prompt, cached, saving):
+    """Time to first token when ``cached`` of ``n_prompt`` tokens hit the cache
+
+    ``saving`` is the share of the time to first token saved on the cached
+    part of the prompt
+    """
+    if not n_prompt or not cached:
+        return ttft
+    return ttft * (1 - saving * min(cached, n_prompt) / n_prompt)
+
+
+def build_completion(model, words, n_prompt, cached=0):
+    """An openai ChatCompletion carrying the generated words"""
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(
+        {
+            "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                }
+            ],
+            "usage": {
+                "prompt_tokens": n_prompt,
+                "completion_tokens": len(words),
+                "total_tokens": n_prompt + len(words),
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+    )
+
+
+@register_model_client_class
+class FakeLLMClient:
+    """autogen ModelClient that answers from canned replies with simulated latency"""
+
+    def __init__(self, config, **kwargs):
+        self.config = config
+        self.model = config.get("model", "fake")
+        self.latency = kwargs.get("latency") or LatencyModel.from_config(config)
+        self.price_per_1k = config.get("fake_price_per_1k", (0.0, 0.0))
+        # Fraction of calls answered with a 429, drawn from a seeded generator
+        self.error_rate = config.get("error_rate", 0.0)
+        self._errors = random.Random(config.get("seed", 0))
+        self.prompt_cache = PROMPT_CACHE if config.get("prompt_cache", True) else None
+        self.cached_ttft_saving = config.get("cached_ttft_saving", 0.0)
+        self.calls = 0
+
+    def create(self, params):
+        self.calls += 1
+        if self.error_rate and self._errors.random() < self.error_rate:
+            raise rate_limit_error()
+        messages = params.get("messages") or []
+        ttft, per_token, tokens = self.latency.sample()
+        structured = params.get("structured_output") or {}
+        words = structured_reply(structured.get("name")) or generate_reply(
+            messages, tokens
+        )
+        n_prompt = prompt_tokens(messages)
+        cached = self.prompt_cache.lookup(messages) if self.prompt_cache else 0
+        time.sleep(cached_ttft(ttft, n_prompt, cached, self.cached_ttft_saving))
+        if params.get("stream"):
+            from autogen.io import IOStream
+            from autogen.messages.client_messages import StreamMessage
+
+            iostream = IOStream.get_default()
+            for index, word in enumerate(words):
+                if per_token:
+                    time.sleep(per_token)
+                iostream.send(StreamMessage(content=word if index == 0 else " " + word))
+        elif per_token:
+            time.sleep(per_token * len(words))
+        return build_completion(
+            params.get("model", self.model), words, n_prompt, cached
+        )
+
+    def message_retrieval(self, response):
+        return [choice.message.content for choice in response.choices]
+
+    def cost(self, response):
+        prompt_price, completion_price = self.price_per_1k
+        usage = response.usage
+        return (
+            usage.prompt_tokens * prompt_price
+            + usage.completion_tokens * completion_price
+        ) / 1000
+
+    @staticmethod
+    def get_usage(response):
+        return {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "total_tokens": response.usage.total_tokens,
+            "cost": getattr(response, "cost", 0.0),
+            "model": response.model,
+        }
+
+
+def fake_llm_config(model="gpt-4o", small_model=None, **latency):
+    """llm_config routing every agent to FakeLLMClient"""
+    models = [model] + ([small_model] if small_model else [])
+    return {
+        "config_list": [
+            {
+                "model": name,
+                "model_client_cls": FakeLLMClient.__name__,
+                **latency,
+            }
+            for name in models
+        ],
+        # autogen's legacy disk cache would otherwise replay earlier runs
+        "cache_seed": None,
+    }
+
+
+class _ChatCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        messages = body.get("messages") or []
+        model = body.get("model", "fake")
+        ttft, per_token, tokens = server.latency.sample()
+        schema = (body.get("response_format") or {}).get("json_schema") or {}
+        words = structured_reply(schema.get("name")) or generate_reply(messages, tokens)
+        n_prompt = prompt_tokens(messages)
+        cached = server.prompt_cache.lookup(messages)
+        time.sleep(cached_ttft(ttft, n_prompt, cached, server.cached_ttft_saving))
+        if body.get("stream"):
+            self._stream(model, words, per_token)
+        else:
+            if per_token:
+                time.sleep(per_token * len(words))
+            completion = build_completion(model, words, n_prompt, cached)
+            payload = completion.model_dump_json().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def _stream(self, model, words, per_token):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        for index, word in enumerate(words + [None]):
+            if per_token and word is not None:
+                time.sleep(per_token)
+            delta = (
+                {} if word is None else {"content": word if index == 0 else " " + word}
+            )
+            if index == 0:
+                delta["role"] = "assistant"
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "finish_reason": "stop" if word is None else None,
+                    }
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer:
+    """Local OpenAI-compatible chat completions server on a background thread"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, cached_ttft_saving=0.0):
+        self._httpd = ThreadingHTTPServer((host, port), _ChatCompletionsHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.latency = latency or LatencyModel()
+        self._httpd.requests = 0
+        self._httpd.prompt_cache = PromptCache()
+        self._httpd.cached_ttft_saving = cached_ttft_saving
+        self._httpd.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self._httpd.requests
+
+    def llm_config(self, model="gpt-4o"):
+        """llm_config pointing every agent at this server"""
+        return {
+            "config_list": [
+                {"model": model, "api_key": FAKE_API_KEY, "base_url": self.url}
+            ],
+            "cache_seed": None,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="fake-openai", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -2,142 +2,866 @@
 """
 Multi-Agent Healthcare Chatbot using AutoGen
 Fixed version of the notebook that runs end-to-end without errors
+
+Importing this module is cheap: autogen, openai and dotenv are only imported
+when a pipeline is first built, so workers can import ``initialize_agents``
+without paying for the full bootstrap.
 """
 
 import warnings
 import os
 import sys
+import json
+import logging
+import threading
+from functools import partial
+
+from async_chat import install_async_reply, run_blocking
+from compaction import DEFAULT_COMPACTION
+from llm_middleware import install_middleware, set_routes
+from prompts import DEFAULT_PROMPTS
+from rate_limit import DEFAULT_SCHEDULER
+from streaming import deliver
+from routing import DEFAULT_ROUTING
+from termination import DEFAULT_TERMINATION
+from triage import DEFAULT_TRIAGE
 
 # Suppress autogen and other deprecation/user warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
-warnings.filterwarnings('ignore', category=UserWarning)
-
-try:
-    from autogen import ConversableAgent, GroupChat, GroupChatManager
-    from openai import OpenAI
-    from dotenv import load_dotenv
-    import logging
-except ImportError as e:
-    print(f"Missing dependencies: {e}")
-    print("Please install: pip install autogen==0.7 openai==1.64.0 python-dotenv==1.1.0")
-    sys.exit(1)
-
-# Load environment variables from a .env file if present
-load_dotenv()
+warnings.filterwarnings("ignore", category=UserWarning)
 
 # Suppress warnings from autogen.oai.client
 logging.getLogger("autogen.oai.client").setLevel(logging.ERROR)
 
-print("🤖 Multi-Agent Healthcare Chatbot Setup")
-print("=" * 50)
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_MAX_ROUND = 5
+DEFAULT_SPEAKER_SELECTION = "round_robin"
+DEFAULT_SYMPTOMS = "headache and fatigue"
+DEFAULT_MAX_CONNECTIONS = 200
+DEFAULT_MAX_KEEPALIVE = 100
+
+# Agent roles in creation order; the patient only initiates the chat
+AGENT_ROLES = ("patient", "diagnosis", "pharmacy", "consultation")
+GROUPCHAT_ROLES = ("diagnosis", "pharmacy", "consultation")
+
+# Full system message per role: the shared, cacheable prefix plus role instructions
+ROLE_SYSTEM_MESSAGES = DEFAULT_PROMPTS.system_messages()
+
+# Keys of config_list entries used by this package rather than the OpenAI API
+LOCAL_CONFIG_KEYS = ("model_client_cls", "requests_per_minute", "tokens_per_minute")
+
+# Custom autogen ModelClient classes selectable by "model_client_cls" in llm_config
+MODEL_CLIENT_CLASSES = {}
+
+_env_loaded = False
+_clients = {}
+_client_lock = threading.Lock()
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def load_environment():
+    """Load environment variables from a .env file once per process"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        _env_loaded = True
+        return
+    load_dotenv()
+    _env_loaded = True
+
+
+def __getattr__(name):
+    """Resolve ``OpenAI`` lazily so importing this module stays cheap"""
+    if name == "OpenAI":
+        from openai import OpenAI
+
+        return OpenAI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_openai_client(api_key=None, base_url=None):
+    """Return the process-wide OpenAI client for these credentials, creating it on first use.
+
+    The client keeps a pool of keep-alive connections (LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE) shared by every agent and consultation in the process.
+    SDK retries are off: ``RateLimitScheduler`` retries each agent turn.
+    """
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(key)
+            if client is None:
+                import httpx
+                from openai import DefaultHttpxClient, OpenAI
+
+                limits = httpx.Limits(
+                    max_connections=int(
+                        os.getenv("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+                    ),
+                    max_keepalive_connections=int(
+                        os.getenv("LLM_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE)
+                    ),
+                )
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(limits=limits),
+                )
+                _clients[key] = client
+    return client
+
+
+def build_llm_config(api_key=None, model=DEFAULT_MODEL, small_model=None):
+    """Build the llm_config shared by every agent.
+
+    ``small_model`` (default: LLM_SMALL_MODEL) adds a cheaper model that the
+    routing policy uses for simple turns; each model falls back to the other.
+    """
+    if api_key is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+    if small_model is None:
+        small_model = os.getenv("LLM_SMALL_MODEL")
+    models = [model] + ([small_model] if small_model and small_model != model else [])
+    return {
+        "config_list": [
+            {
+                "model": name,
+                "api_key": api_key,
+                "model_client_cls": SharedOpenAIClient.__name__,
+            }
+            for name in models
+        ]
+    }
+
+
+def register_model_client_class(cls):
+    """Make a custom ModelClient class available to pipelines by its name"""
+    MODEL_CLIENT_CLASSES[cls.__name__] = cls
+    return cls
+
+
+@register_model_client_class
+class SharedOpenAIClient:
+    """autogen ModelClient that sends every agent's calls through one pooled OpenAI client.
+
+    autogen otherwise creates a separate ``OpenAI`` client, and connection
+    pool, for every agent of every pipeline.
+    """
+
+    def __init__(self, config, **kwargs):
+        from autogen.oai.client import OpenAIClient
+
+        self._client = OpenAIClient(
+            get_openai_client(config.get("api_key"), config.get("base_url"))
+        )
+
+    def create(self, params):
+        params = {k: v for k, v in params.items() if k not in LOCAL_CONFIG_KEYS}
+        structured = params.pop("structured_output", None)
+        if structured:
+            # Set by StructuredOutputPolicy; see structured.py
+            params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {**structured, "strict": True},
+            }
+        return self._client.create(params)
+
+    def message_retrieval(self, response):
+        return self._client.message_retrieval(response)
+
+    def cost(self, response):
+        return self._client.cost(response)
+
+    @staticmethod
+    def get_usage(response):
+        from autogen.oai.client import OpenAIClient
+
+        return OpenAIClient.get_usage(response)
+
+
+def activate_model_clients(agent, llm_config):
+    """Register the custom ModelClient classes named in an agent's config_list"""
+    for config in llm_config.get("config_list", []):
+        name = config.get("model_client_cls")
+        if not name:
+            continue
+        if name not in MODEL_CLIENT_CLASSES:
+            raise ValueError(f"Unknown model_client_cls {name!r}")
+        # autogen activates one config_list entry per registration
+        agent.register_model_client(MODEL_CLIENT_CLASSES[name])
+
+
+def model_route(llm_config, model):
+    """A client trying ``model``'s config_list entries first and the rest as fallback.
+
+    None for the first model, which the agent's own client already starts with.
+    """
+    config_list = llm_config.get("config_list") or []
+    if not config_list or config_list[0].get("model") == model:
+        return None
+    ordered = [c for c in config_list if c.get("model") == model]
+    if not ordered:
+        return None
+    from autogen import OpenAIWrapper
+
+    ordered += [c for c in config_list if c.get("model") != model]
+    client = OpenAIWrapper(**{**llm_config, "config_list": ordered})
+    activate_model_clients(client, llm_config)
+    return client
+
+
+def config_key(llm_config, **options):
+    """Hashable key identifying a pipeline configuration"""
+    return json.dumps(
+        {"llm_config": llm_config, **options}, sort_keys=True, default=str
+    )
+
+
+class ConsultationPipeline:
+    """Patient, diagnosis, pharmacy and consultation agents plus their GroupChat.
+
+    Nothing is constructed until ``agents``, ``groupchat`` or ``manager`` is
+    first accessed, after which the objects are reused.
+    """
+
+    def __init__(
+        self,
+        llm_config,
+        max_round=DEFAULT_MAX_ROUND,
+        speaker_selection_method=DEFAULT_SPEAKER_SELECTION,
+        silent=False,
+        middlewares=(),
+        termination=DEFAULT_TERMINATION,
+        compaction=DEFAULT_COMPACTION,
+        dag=None,
+        scheduler=DEFAULT_SCHEDULER,
+        routing=DEFAULT_ROUTING,
+        similarity=None,
+        triage=DEFAULT_TRIAGE,
+        prompts=DEFAULT_PROMPTS,
+        structured=None,
+        speculative=None,
+    ):
+        self.llm_config = llm_config
+        self.max_round = max_round
+        self.speaker_selection_method = speaker_selection_method
+        self.silent = silent
+        self.middlewares = tuple(middlewares)
+        self.termination = termination
+        self.compaction = compaction
+        self.dag = tuple(dag) if dag else None
+        self.scheduler = scheduler
+        self.routing = routing
+        self.similarity = similarity
+        self.triage = triage
+        self.prompts = prompts
+        self.structured = structured
+        self.speculative = speculative
+        self.terminator = None
+        self.speculator = None
+        self.reused = None
+        self.triaged = None
+        self._agents = None
+        self._groupchat = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return config_key(
+            self.llm_config,
+            max_round=self.max_round,
+            speaker_selection_method=self.speaker_selection_method,
+            silent=self.silent,
+            middlewares=[f"{type(m).__name__}@{id(m):x}" for m in self.middlewares],
+            termination=self.termination,
+            compaction=self.compaction,
+            dag=self.dag,
+            scheduler=self.scheduler,
+            routing=self.routing,
+            similarity=self.similarity,
+            triage=self.triage,
+            prompts=self.prompts.fingerprint,
+            structured=self.structured,
+            speculative=self.speculative,
+        )
+
+    @property
+    def is_built(self):
+        return self._manager is not None
+
+    @property
+    def agents(self):
+        self.build()
+        return self._agents
+
+    @property
+    def groupchat(self):
+        self.build()
+        return self._groupchat
+
+    @property
+    def manager(self):
+        self.build()
+        return self._manager
+
+    def build(self):
+        """Construct the agents, GroupChat and GroupChatManager if needed"""
+        if self._manager is not None:
+            return self
+        with self._lock:
+            if self._manager is None:
+                self._build()
+        return self
+
+    def _build(self):
+        from autogen import ConversableAgent, GroupChat, GroupChatManager
+
+        agents = {
+            role: ConversableAgent(
+                name=role,
+                system_message=self.prompts.system_message(role),
+                llm_config=self.llm_config,
+            )
+            for role in AGENT_ROLES
+        }
+        for agent in agents.values():
+            activate_model_clients(agent, self.llm_config)
+        middlewares = list(self.middlewares)
+        if self.routing is not None:
+            middlewares.insert(0, self.routing)
+        if self.compaction is not None:
+            middlewares.insert(0, self.compaction)
+        if self.structured is not None:
+            # Ahead of compaction, which then sees the compact payloads
+            middlewares.insert(0, self.structured)
+        if self.speculative is not None and not self.dag:
+            # Inside streaming and accounting, which see a kept draft as a reply
+            self.speculator = self.speculative.attach(self)
+            middlewares.append(self.speculator)
+        if self.scheduler is not None:
+            # Innermost, so cache hits and other short-circuits skip pacing
+            middlewares.append(self.scheduler)
+        speaker_selection_method = self.speaker_selection_method
+        manager_options = {}
+        if self.termination is not None:
+            self.terminator = self.termination.attach(speaker_selection_method)
+            middlewares.insert(0, self.terminator)
+            speaker_selection_method = self.terminator.select_speaker
+            manager_options["is_termination_msg"] = self.terminator.is_termination_msg
+        for agent in agents.values():
+            install_async_reply(agent)
+            for middleware in middlewares:
+                install_middleware(agent, middleware)
+            if self.routing is not None:
+                set_routes(agent, partial(model_route, self.llm_config))
+        groupchat = GroupChat(
+            agents=[agents[role] for role in GROUPCHAT_ROLES],
+            messages=[],
+            max_round=self.max_round,
+            speaker_selection_method=speaker_selection_method,
+        )
+        manager = GroupChatManager(
+            name="manager", groupchat=groupchat, silent=self.silent, **manager_options
+        )
+        self._agents, self._groupchat = agents, groupchat
+        self._manager = manager
+
+    def reset(self):
+        """Clear conversation state so the agents can serve another consultation"""
+        if not self.is_built:
+            return
+        self._groupchat.reset()
+        for agent in self._agents.values():
+            agent.reset()
+        self._manager.reset()
+        if self.terminator is not None:
+            self.terminator.reset()
+        if self.speculator is not None:
+            self.speculator.reset()
 
-# Initialize OpenAI Client (API Key is automatically managed from environment variables)
-client = OpenAI()
+    def consult(self, symptoms):
+        """Run one consultation for the given symptoms and return the chat result.
 
-# Disable Docker execution to prevent runtime errors
-code_execution_config = {"use_docker": False}
+        Triage answers emergencies and junk input without the agents (its
+        verdict is kept in ``triaged``). With a ``similarity`` index, a close
+        enough past consultation is replayed (and recorded in ``reused``).
+        """
+        result = self._start(symptoms)
+        if result is not None:
+            return result
+        if self.similarity is not None:
+            match = self.similarity.lookup(symptoms)
+            if match is not None:
+                return self._reuse(symptoms, match)
+        if self.dag:
+            result = self._consult_dag(symptoms)
+        else:
+            result = self.agents["patient"].initiate_chat(
+                self.manager,
+                message=opening_message(symptoms),
+                silent=self.silent,
+            )
+        if self.similarity is not None:
+            self.similarity.add(symptoms, self._groupchat.messages)
+        return result
 
-# Sample LLM Configuration
-llm_config = {"config_list": [{"model": "gpt-4o", "api_key": os.getenv("OPENAI_API_KEY")}]}
+    async def a_consult(self, symptoms):
+        """Awaitable ``consult`` on autogen's async chat path (see ``async_chat``)"""
+        result = self._start(symptoms)
+        if result is not None:
+            return result
+        if self.similarity is not None:
+            # Embedding may be a network call (OpenAIEmbedder)
+            match = await run_blocking(self.similarity.lookup, symptoms)
+            if match is not None:
+                return self._reuse(symptoms, match)
+        if self.dag:
+            result = await self._a_consult_dag(symptoms)
+        else:
+            result = await self.agents["patient"].a_initiate_chat(
+                self.manager,
+                message=opening_message(symptoms),
+                silent=self.silent,
+            )
+        if self.similarity is not None:
+            await run_blocking(
+                self.similarity.add, symptoms, list(self._groupchat.messages)
+            )
+        return result
 
-print(f"✅ OpenAI client initialized")
-print(f"✅ LLM config set to: {llm_config['config_list'][0]['model']}")
+    def _start(self, symptoms):
+        """Reset per-consultation state; the triage reply if it short-circuits"""
+        self.build()
+        if self.terminator is not None:
+            self.terminator.reset()
+        if self.speculator is not None:
+            self.speculator.reset()
+        self.reused = self.triaged = None
+        if self.triage is not None:
+            self.triaged = self.triage(symptoms)
+            if self.triaged.short_circuit:
+                return self._replay(symptoms, self.triaged.messages)
+        return None
 
-# Check if API key is available
-if not os.getenv("OPENAI_API_KEY"):
-    print("⚠️  OPENAI_API_KEY not set. Creating agents but skipping live chat.")
-    print("   Set OPENAI_API_KEY environment variable to run the full demo.")
-else:
-    print("✅ OpenAI API key found")
+    def _reuse(self, symptoms, match):
+        self.reused = match
+        return self._replay(symptoms, match.messages)
 
-print("\n📋 Creating AI Agents...")
+    def _replay(self, symptoms, turns):
+        from autogen import ChatResult
 
-# Step 1: Create AI Agents with Defined Roles
-patient_agent = ConversableAgent(
-    name="patient", 
-    system_message="You describe symptoms and ask for medical help.", 
-    llm_config=llm_config
-)
+        messages = [
+            {"role": "user", "name": "patient", "content": opening_message(symptoms)}
+        ] + [dict(turn) for turn in turns]
+        # Replace, as initiate_chat does: the transcript is stored and indexed
+        self._groupchat.reset()
+        self._groupchat.messages.extend(messages)
+        # UIs render through the sink, which no LLM call has fed
+        for turn in messages[1:]:
+            deliver(turn.get("name"), turn.get("content"))
+        return ChatResult(chat_history=messages, summary=messages[-1]["content"])
 
-diagnosis_agent = ConversableAgent(
-    name="diagnosis", 
-    system_message="You analyze symptoms and provide a possible diagnosis. Summarize key points in one response.", 
-    llm_config=llm_config
-)
+    def _consult_dag(self, symptoms):
+        from autogen import ChatResult
 
-pharmacy_agent = ConversableAgent(
-    name="pharmacy", 
-    system_message="You recommend medications based on diagnosis. Only respond once.", 
-    llm_config=llm_config
-)
+        from dag import DagRunner
 
-consultation_agent = ConversableAgent(
-    name="consultation", 
-    system_message="You determine if a doctor's visit is required. Provide a final summary with clear next steps. IMPORTANT: End your response with 'CONSULTATION_COMPLETE' to signal the end of the conversation.", 
-    llm_config=llm_config
-)
+        runner = DagRunner(self, self.dag)
+        opening = opening_message(symptoms)
+        messages = runner.messages(opening, runner.run(opening))
+        self._groupchat.reset()
+        self._groupchat.messages.extend(messages)
+        return ChatResult(chat_history=messages, summary=messages[-1]["content"])
 
-print("✅ Patient agent created")
-print("✅ Diagnosis agent created") 
-print("✅ Pharmacy agent created")
-print("✅ Consultation agent created")
+    async def _a_consult_dag(self, symptoms):
+        from autogen import ChatResult
 
-# Step 2: Create GroupChat for Structured Interaction
-groupchat = GroupChat(
-    agents=[diagnosis_agent, pharmacy_agent, consultation_agent],  # Patient only initiates
-    messages=[], 
-    max_round=5,  # Limits conversation to 5 rounds
-    speaker_selection_method="round_robin"  # Ensures structured conversation flow
-)
+        from dag import DagRunner
 
-print("✅ GroupChat created with round-robin speaker selection")
+        runner = DagRunner(self, self.dag)
+        opening = opening_message(symptoms)
+        messages = runner.messages(opening, await runner.a_run(opening))
+        self._groupchat.reset()
+        self._groupchat.messages.extend(messages)
+        return ChatResult(chat_history=messages, summary=messages[-1]["content"])
 
-# Step 3: Create GroupChatManager to Handle Conversation
-manager = GroupChatManager(name="manager", groupchat=groupchat)
 
-print("✅ GroupChatManager created")
+def opening_message(symptoms):
+    """The patient agent's first message for a set of symptoms"""
+    return f"I am feeling {symptoms}. Can you help?"
 
-print("\n🎯 Healthcare Consultation System Ready!")
-print("=" * 50)
 
-# Step 4: Get Patient Input and Start Consultation
-print("\n🤖 Welcome to the AI Healthcare Consultation System!")
+def get_pipeline(
+    api_key=None,
+    model=DEFAULT_MODEL,
+    max_round=DEFAULT_MAX_ROUND,
+    speaker_selection_method=DEFAULT_SPEAKER_SELECTION,
+    middlewares=(),
+    dag=None,
+    similarity=None,
+    structured=None,
+    speculative=None,
+):
+    """Return the cached pipeline for this configuration, creating it if needed"""
+    pipeline = ConsultationPipeline(
+        build_llm_config(api_key, model),
+        max_round=max_round,
+        speaker_selection_method=speaker_selection_method,
+        middlewares=middlewares,
+        dag=dag,
+        similarity=similarity,
+        structured=structured,
+        speculative=speculative,
+    )
+    with _pipelines_lock:
+        return _pipelines.setdefault(pipeline.key, pipeline)
 
-# Get symptoms - use environment variable for non-interactive runs
-symptoms = os.getenv("SYMPTOMS", "headache and fatigue")
 
-if os.getenv("INTERACTIVE", "false").lower() == "true":
+def clear_pipelines():
+    """Drop every cached pipeline"""
+    with _pipelines_lock:
+        _pipelines.clear()
+
+
+def initialize_agents():
+    """Initialize the multi-agent system, returning (agents, manager)"""
+    load_environment()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None, None
+    pipeline = get_pipeline(api_key).build()
+    return pipeline.agents, pipeline.manager
+
+
+def check_dependencies():
+    """Exit with install instructions if autogen or openai is missing"""
     try:
-        symptoms = input("🩺 Please describe your symptoms: ")
-    except EOFError:
-        print("🩺 Using default symptoms: headache and fatigue")
-        symptoms = "headache and fatigue"
+        import autogen  # noqa: F401
+        import openai  # noqa: F401
+    except ImportError as e:
+        print(f"Missing dependencies: {e}")
+        print(
+            "Please install: pip install autogen==0.7 openai==1.64.0 python-dotenv==1.1.0"
+        )
+        sys.exit(1)
+
+
+def print_models(llm_config):
+    """Print the main model and, with more than one, that calls are routed"""
+    print(f"✅ LLM config set to: {llm_config['config_list'][0]['model']}")
+    if len(llm_config["config_list"]) > 1:
+        models = ", ".join(c["model"] for c in llm_config["config_list"])
+        print(f"✅ Model routing by role and symptom complexity: {models}")
+
+
+def load_similarity(store=None):
+    """The similar-consultation index configured by the environment, or None"""
+    from similarity import from_environment
+
+    similarity = from_environment()
+    if similarity is None:
+        return None
+    if store is not None:
+        similarity.load_store(store)
+    print(
+        f"✅ Similar consultations reused above {similarity.threshold:.2f} "
+        f"similarity ({len(similarity)} indexed)"
+    )
+    return similarity
+
+
+def print_budget(ledger, tenant):
+    """Print what ``tenant`` has spent of its budget this period, if it has one"""
+    budget = ledger.budgets.get(tenant)
+    if budget is None:
+        return
+    spent = ledger.spend(tenant)
+    limits = []
+    if budget.max_cost is not None:
+        limits.append(f"${spent['cost']:.4f} of ${budget.max_cost:.2f}")
+    if budget.max_tokens is not None:
+        limits.append(f"{spent['tokens']} of {budget.max_tokens} tokens")
+    print(f"✅ Budget for tenant {tenant}: {', '.join(limits)} spent this period")
+
+
+def pipeline_options_from_environment():
+    """Orchestration, structured outputs and speculation chosen by env vars"""
+    options = {"dag": None, "structured": None, "speculative": None}
+    if os.getenv("ORCHESTRATION", "groupchat").lower() == "dag":
+        from dag import DEFAULT_DAG
+
+        options["dag"] = DEFAULT_DAG
+    if os.getenv("STRUCTURED_OUTPUTS", "false").lower() == "true":
+        from structured import DEFAULT_STRUCTURED
 
-print(f"🩺 Patient symptoms: {symptoms}")
+        options["structured"] = DEFAULT_STRUCTURED
+    if os.getenv("SPECULATIVE", "false").lower() == "true":
+        from speculative import DEFAULT_SPECULATIVE
 
-if not os.getenv("OPENAI_API_KEY"):
+        options["speculative"] = DEFAULT_SPECULATIVE
+    return options
+
+
+def create_pipeline(api_key, middlewares, similarity):
+    """Build the pipeline configured by the environment and report what it has"""
+    print("\n📋 Creating AI Agents...")
+    pipeline = get_pipeline(
+        api_key,
+        middlewares=middlewares,
+        similarity=similarity,
+        **pipeline_options_from_environment(),
+    ).build()
+    for role in AGENT_ROLES:
+        print(f"✅ {role.capitalize()} agent created")
+    if pipeline.dag:
+        print("✅ DAG orchestration: independent agents run concurrently")
+    else:
+        print("✅ GroupChat created with round-robin speaker selection")
+    if pipeline.structured:
+        print("✅ Structured outputs: agents exchange schema-validated JSON")
+    if pipeline.speculator is not None:
+        print("✅ Speculative pharmacy: drafted while the diagnosis streams")
+    print("✅ GroupChatManager created")
+    return pipeline
+
+
+def read_symptoms():
+    """Symptoms from SYMPTOMS, or asked for when INTERACTIVE=true"""
+    symptoms = os.getenv("SYMPTOMS", DEFAULT_SYMPTOMS)
+    if os.getenv("INTERACTIVE", "false").lower() == "true":
+        try:
+            symptoms = input("🩺 Please describe your symptoms: ")
+        except EOFError:
+            print(f"🩺 Using default symptoms: {DEFAULT_SYMPTOMS}")
+            symptoms = DEFAULT_SYMPTOMS
+    return symptoms
+
+
+def print_missing_key_help():
+    """Explain how to run the live chat without OPENAI_API_KEY"""
     print("\n⚠️ OPENAI_API_KEY not set. Skipping live chat run.")
     print("   To run the full demo:")
     print("   1. Set OPENAI_API_KEY environment variable")
     print("   2. Run: python healthcare_chatbot.py")
     print("   3. Or run interactively: INTERACTIVE=true python healthcare_chatbot.py")
-else:
+
+
+def print_outcome(pipeline):
+    """Print how the consultation was answered"""
+    print("\n✅ Consultation completed successfully!")
+    if pipeline.triaged is not None and pipeline.triaged.short_circuit:
+        print(f"   ⚡ Answered by triage: {pipeline.triaged.action}")
+    elif pipeline.reused is not None:
+        print(
+            f"   ♻️ Reused a similar consultation "
+            f"({pipeline.reused.score:.2f}): {pipeline.reused.symptoms}"
+        )
+    elif pipeline.terminator is not None:
+        print(f"   Stopped by: {pipeline.terminator.stop_reason or 'max_round'}")
+
+
+def run_consultation(pipeline, symptoms, instrumentation, ledger, tenant, store):
+    """Run, report and store one consultation; returns its trace and cost"""
     print("\n🩺 Diagnosing symptoms...")
+    trace = cost = error = None
     try:
-        response = patient_agent.initiate_chat(
-            manager,
-            message=f"I am feeling {symptoms}. Can you help?",
-        )
-        print("\n✅ Consultation completed successfully!")
+        ledger.check(tenant)
+        with instrumentation.trace(symptoms) as trace:
+            with ledger.consultation(tenant, trace.consultation_id) as cost:
+                pipeline.consult(symptoms)
+        print_outcome(pipeline)
     except Exception as e:
+        error = f"{type(e).__name__}: {e}"
         print(f"\n❌ Error during consultation: {e}")
         print("This might be due to API rate limits or network issues.")
+    if store is not None:
+        store.record(
+            symptoms,
+            pipeline.groupchat.messages,
+            consultation_id=trace.consultation_id if trace else None,
+            created=trace.started if trace else None,
+            error=error,
+            trace=trace.to_dict() if trace else None,
+        )
+    return trace, cost
+
+
+def print_feature_stats(pipeline, cache, similarity):
+    """Summary lines for the cache, triage, reuse, structured, speculation and pacing"""
+    if cache:
+        stats = cache.stats()
+        print(f"   - Response cache: {stats['hits']} hits, {stats['misses']} misses")
+    if pipeline is not None and pipeline.triage is not None:
+        stats = pipeline.triage.stats()
+        print(
+            f"   - Triage: {stats['emergency']} emergencies, "
+            f"{stats['reject']} rejected, {stats['consult']} to agents"
+        )
+    if similarity is not None:
+        stats = similarity.stats()
+        print(
+            f"   - Similar consultations: {stats['hits']} reused, "
+            f"{stats['entries']} indexed"
+        )
+    if pipeline is None:
+        return
+    if pipeline.structured is not None:
+        stats = pipeline.structured.stats()
+        print(
+            f"   - Structured outputs: {stats['structured']} valid, "
+            f"{stats['invalid']} fell back to text, {stats['derived']} answered locally"
+        )
+    if pipeline.speculator is not None:
+        stats = pipeline.speculative.stats()
+        print(
+            f"   - Speculative drafts: {stats['kept']} kept, "
+            f"{stats['discarded']} discarded, {stats['saved_seconds']:.2f}s saved"
+        )
+    if pipeline.scheduler is not None:
+        stats = pipeline.scheduler.stats()
+        print(
+            f"   - Rate limiter: {stats['requests']} requests, "
+            f"{stats['retries']} retries, {stats['waited_seconds']:.1f}s paced"
+        )
+
+
+def print_trace(trace, pipeline):
+    """Summary lines for the consultation's time, tokens and prompt caching"""
+    from instrumentation import prompt_cache_ratio
+
+    print(f"   - Consultation time: {trace.duration:.2f}s")
+    for agent_name, totals in trace.by_agent().items():
+        print(
+            f"   - {agent_name}: {totals['turns']} turns, "
+            f"{totals['wall_seconds']:.2f}s, "
+            f"{totals['prompt_tokens']}+{totals['completion_tokens']} tokens "
+            f"({prompt_cache_ratio([totals]):.0%} prompt cached), "
+            f"{totals['cache_hits']} cached"
+        )
+    print(
+        f"   - Prompt cache: {trace.prompt_cache_ratio():.0%} of prompt tokens "
+        f"(prompts {pipeline.prompts.fingerprint})"
+    )
+
+
+def write_reports(trace, instrumentation, ledger):
+    """Write the trace and metrics to TRACE_PATH / METRICS_PATH if set"""
+    trace_path = os.getenv("TRACE_PATH")
+    if trace_path:
+        with open(trace_path, "w") as f:
+            f.write(trace.to_json())
+        print(f"   - Trace written to: {trace_path}")
+    metrics_path = os.getenv("METRICS_PATH")
+    if metrics_path:
+        with open(metrics_path, "w") as f:
+            f.write(instrumentation.render_prometheus() + ledger.render_prometheus())
+        print(f"   - Metrics written to: {metrics_path}")
+
+
+def print_cost(cost, tenant):
+    """Summary lines for the consultation's cost and each agent's share"""
+    print(f"   - Cost: ${cost.cost:.4f} for {cost.tokens} tokens (tenant {tenant})")
+    if not cost.cost:
+        return
+    agents = sorted(
+        cost.by_agent().items(), key=lambda item: item[1]["cost"], reverse=True
+    )
+    shares = ", ".join(
+        f"{agent_name} {totals['cost'] / cost.cost:.0%}"
+        for agent_name, totals in agents
+    )
+    print(f"   - Spend by agent: {shares}")
+
+
+def close_store(store):
+    """Write what is queued, report the store's size and close it"""
+    if store is None:
+        return
+    store.flush()
+    print(f"   - Consultations stored: {len(store)}")
+    store.close()
+
+
+def main():
+    """Run a single consultation from the command line"""
+    load_environment()
+
+    print("🤖 Multi-Agent Healthcare Chatbot Setup")
+    print("=" * 50)
+    check_dependencies()
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    llm_config = build_llm_config(api_key)
+    print_models(llm_config)
+
+    import consultation_store
+    import cost_ledger
+    from instrumentation import Instrumentation
+    from response_cache import from_environment
+
+    instrumentation = Instrumentation()
+    pipeline = trace = cost = None
+    cache = from_environment()
+    store = consultation_store.from_environment()
+    if store is not None:
+        print(f"✅ Consultation store: {store.path}")
+    ledger = cost_ledger.from_environment(store)
+    tenant = os.getenv("TENANT", cost_ledger.DEFAULT_TENANT)
+    # In front of the cache so hits are counted as such (and cost nothing)
+    middlewares = [instrumentation, ledger] + ([cache] if cache else [])
+    if cache:
+        print(f"✅ Response cache enabled: {os.getenv('RESPONSE_CACHE_PATH')}")
+    similarity = load_similarity(store)
+    print_budget(ledger, tenant)
+
+    # Check if API key is available
+    if not api_key:
+        print("⚠️  OPENAI_API_KEY not set. Skipping agent creation and live chat.")
+        print("   Set OPENAI_API_KEY environment variable to run the full demo.")
+    else:
+        print("✅ OpenAI API key found")
+        pipeline = create_pipeline(api_key, middlewares, similarity)
+
+    print("\n🎯 Healthcare Consultation System Ready!")
+    print("=" * 50)
+
+    print("\n🤖 Welcome to the AI Healthcare Consultation System!")
+
+    # Get symptoms - use environment variable for non-interactive runs
+    symptoms = read_symptoms()
+    print(f"🩺 Patient symptoms: {symptoms}")
+
+    if not api_key:
+        print_missing_key_help()
+    else:
+        trace, cost = run_consultation(
+            pipeline, symptoms, instrumentation, ledger, tenant, store
+        )
+
+    print("\n📊 System Summary:")
+    print(f"   - Agents created: {len(AGENT_ROLES) if api_key else 0}")
+    print(f"   - GroupChat rounds: {DEFAULT_MAX_ROUND}")
+    print(f"   - Speaker method: {DEFAULT_SPEAKER_SELECTION}")
+    print(f"   - Model: {llm_config['config_list'][0]['model']}")
+    print(f"   - API key configured: {'Yes' if api_key else 'No'}")
+    print_feature_stats(pipeline, cache, similarity)
+    if trace is not None:
+        print_trace(trace, pipeline)
+        write_reports(trace, instrumentation, ledger)
+    if cost is not None:
+        print_cost(cost, tenant)
+    ledger.flush()
+    close_store(store)
+
+    print("\n🎉 Multi-Agent Healthcare Chatbot Demo Complete!")
 
-print("\n📊 System Summary:")
-print(f"   - Agents created: 4")
-print(f"   - GroupChat rounds: 5")
-print(f"   - Speaker method: round_robin")
-print(f"   - Model: {llm_config['config_list'][0]['model']}")
-print(f"   - API key configured: {'Yes' if os.getenv('OPENAI_API_KEY') else 'No'}")
 
-print("\n🎉 Multi-Agent Healthcare Chatbot Demo Complete!")
+if __name__ == "__main__":
+    main()
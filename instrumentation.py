@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Per-agent, per-round instrumentation for consultations
+
+``Instrumentation`` is an LLM middleware that records one span per agent
+turn (wall time, time to first token, prompt/completion tokens, prompt
+tokens served from the provider's prompt cache, retries, cache hits,
+errors). Spans are aggregated into Prometheus-style metrics
+for the whole process and, inside ``instrumentation.trace(...)``, collected
+into a JSON-serializable trace for that consultation.
+
+Place it after ``StreamingMiddleware`` so streamed tokens pass through it
+and time to first token is measured from the first chunk.
+"""
+
+import json
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_trace = ContextVar("consultation_trace", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum}"
+        yield f"{name}_count{format_labels(labels)} {self.count}"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return "{" + body + "}"
+
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens the provider served from its prompt cache"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def prompt_cache_ratio(totals):
+    """Cached share of prompt tokens over spans or ``by_agent`` totals"""
+    prompt = sum(t["prompt_tokens"] for t in totals)
+    cached = sum(t.get("cached_prompt_tokens", 0) for t in totals)
+    return cached / prompt if prompt else 0.0
+
+
+class ConsultationTrace:
+    """Spans recorded for a single consultation"""
+
+    def __init__(self, symptoms=None, consultation_id=None):
+        self.consultation_id = consultation_id or uuid.uuid4().hex
+        self.symptoms = symptoms
+        self.started = time.time()
+        self.finished = None
+        self.spans = []
+
+    @property
+    def duration(self):
+        end = self.finished if self.finished is not None else time.time()
+        return end - self.started
+
+    def by_agent(self):
+        """Totals per agent, for spotting the slowest role"""
+        totals = {}
+        for span in self.spans:
+            agent = totals.setdefault(
+                span["agent"],
+                {
+                    "turns": 0,
+                    "wall_seconds": 0.0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cached_prompt_tokens": 0,
+                    "cache_hits": 0,
+                },
+            )
+            agent["turns"] += 1
+            agent["wall_seconds"] += span["wall_seconds"]
+            agent["prompt_tokens"] += span["prompt_tokens"]
+            agent["completion_tokens"] += span["completion_tokens"]
+            agent["cached_prompt_tokens"] += span.get("cached_prompt_tokens", 0)
+            agent["cache_hits"] += int(span["cache_hit"])
+        return totals
+
+    def prompt_cache_ratio(self):
+        """Share of this consultation's prompt tokens served from the provider cache"""
+        return prompt_cache_ratio(self.spans)
+
+    def to_dict(self):
+        return {
+            "consultation_id": self.consultation_id,
+            "symptoms": self.symptoms,
+            "started": self.started,
+            "duration_seconds": self.duration,
+            "spans": self.spans,
+            "agents": self.by_agent(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class _FirstTokenTimer:
+    """IOStream pass-through that notes when the first streamed chunk arrives"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.first_token_at = None
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.inner.print(*objects, sep=sep, end=end, flush=flush)
+
+    def send(self, message):
+        if self.first_token_at is None and type(message).__name__ == "StreamMessage":
+            self.first_token_at = time.perf_counter()
+        self.inner.send(message)
+
+    def input(self, prompt="", *, password=False):
+        return self.inner.input(prompt, password=password)
+
+
+class Instrumentation:
+    """LLM middleware recording spans, metrics and per-consultation traces"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._reply_seconds = {}
+        self._ttft_seconds = {}
+        self._consultation_seconds = Histogram(buckets)
+        self._counters = {}
+
+    @contextmanager
+    def trace(self, symptoms=None, consultation_id=None):
+        """Collect the spans of LLM calls made inside this block"""
+        trace = ConsultationTrace(symptoms, consultation_id)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace.finished = time.time()
+            with self._lock:
+                self._consultation_seconds.observe(trace.duration)
+                self._increment("consultations_total", {})
+
+    def __call__(self, agent, params, call_next):
+        from autogen.io import IOStream
+
+        timer = _FirstTokenTimer(IOStream.get_default())
+        started = time.perf_counter()
+        response, error = None, None
+        try:
+            with IOStream.set_default(timer):
+                response = call_next(params)
+            return response
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            finished = time.perf_counter()
+            first = timer.first_token_at or finished
+            self.record(
+                agent.name, response, finished - started, first - started, error
+            )
+
+    def record(self, agent_name, response, wall, ttft, error=None):
+        usage = getattr(response, "usage", None)
+        span = {
+            "agent": agent_name,
+            "model": getattr(response, "model", None),
+            "wall_seconds": wall,
+            "ttft_seconds": ttft,
+            "prompt_tokens": (getattr(usage, "prompt_tokens", 0) or 0),
+            "completion_tokens": (getattr(usage, "completion_tokens", 0) or 0),
+            "cached_prompt_tokens": cached_prompt_tokens(usage),
+            "cache_hit": bool(getattr(response, "cached", False)),
+            "retries": getattr(response, "retries", 0) or 0,
+            "error": error,
+        }
+        trace = _current_trace.get()
+        if trace is not None:
+            span["round"] = len(trace.spans) + 1
+            trace.spans.append(span)
+
+        labels = {"agent": agent_name}
+        with self._lock:
+            self._reply_seconds.setdefault(agent_name, Histogram(self.buckets)).observe(
+                wall
+            )
+            self._ttft_seconds.setdefault(agent_name, Histogram(self.buckets)).observe(
+                ttft
+            )
+            cache = "hit" if span["cache_hit"] else "miss"
+            self._increment("llm_calls_total", {**labels, "cache": cache})
+            self._increment(
+                "llm_tokens_total", {**labels, "kind": "prompt"}, span["prompt_tokens"]
+            )
+            self._increment(
+                "llm_tokens_total",
+                {**labels, "kind": "completion"},
+                span["completion_tokens"],
+            )
+            self._increment(
+                "llm_tokens_total",
+                {**labels, "kind": "cached_prompt"},
+                span["cached_prompt_tokens"],
+            )
+            if span["retries"]:
+                self._increment("llm_retries_total", labels, span["retries"])
+            if error:
+                self._increment("llm_errors_total", labels)
+        return span
+
+    def _increment(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counter(self, name, **labels):
+        """Current value of a counter, e.g. counter("llm_calls_total", agent="pharmacy", cache="hit")"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render_prometheus(self, prefix="consultation_"):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for metric, histograms in (
+                ("agent_reply_seconds", self._reply_seconds),
+                ("agent_ttft_seconds", self._ttft_seconds),
+            ):
+                name = prefix + metric
+                lines.append(f"# TYPE {name} histogram")
+                for agent_name, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.lines(name, {"agent": agent_name}))
+            name = prefix + "duration_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self._consultation_seconds.lines(name, {}))
+            declared = set()
+            for (metric, labels), value in sorted(self._counters.items()):
+                name = prefix + metric
+                if name not in declared:
+                    lines.append(f"# TYPE {name} counter")
+                    declared.add(name)
+                lines.append(f"{name}{format_labels(dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
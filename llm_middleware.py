@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Middleware chain around agent LLM calls
+
+Every ConversableAgent talks to the model through ``agent.client.create``.
+``install_middleware`` swaps that client for a proxy that passes each call
+through a list of middleware callables before reaching the real client:
+
+    def middleware(agent, params, call_next):
+        ...  # inspect or rewrite params
+        response = call_next(params)
+        ...  # inspect the response
+        return response
+
+Middleware may also return a response without calling ``call_next`` (for
+example a cache hit), using ``TextResponse`` for plain text replies. Setting
+``params["model"]`` sends the call to the client routed for that model, if
+the agent has a route for it (see ``set_routes``).
+"""
+
+import threading
+
+
+class TextResponse:
+    """Minimal completion-like response carrying a single text reply"""
+
+    cost = 0.0
+
+    def __init__(self, text, model=None, usage=None, cached=False):
+        self.text = text
+        self.model = model
+        self.usage = usage
+        self.cached = cached
+        self.choices = []
+
+    @staticmethod
+    def message_retrieval_function(response):
+        return [response.text]
+
+
+class MiddlewareClient:
+    """Proxy for an agent's OpenAIWrapper that runs create() through middleware"""
+
+    def __init__(self, client, agent):
+        self.wrapped = client
+        self.agent = agent
+        self.middlewares = []
+        self.route_factory = None
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def use(self, middleware):
+        with self._lock:
+            if middleware not in self.middlewares:
+                self.middlewares = self.middlewares + [middleware]
+
+    def remove(self, middleware):
+        with self._lock:
+            self.middlewares = [m for m in self.middlewares if m is not middleware]
+
+    def create(self, **params):
+        middlewares = self.middlewares
+
+        def dispatch(index, params):
+            if index == len(middlewares):
+                return self.client_for(params.get("model")).create(**params)
+            return middlewares[index](
+                self.agent, params, lambda params: dispatch(index + 1, params)
+            )
+
+        return dispatch(0, params)
+
+    def client_for(self, model):
+        """The routed client for ``model``, built on first use, else the agent's own"""
+        if model is None or self.route_factory is None:
+            return self.wrapped
+        client = self.routes.get(model)
+        if client is None:
+            with self._lock:
+                client = self.routes.get(model)
+                if client is None:
+                    client = self.route_factory(model) or self.wrapped
+                    self.routes[model] = client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+def middleware_client(agent):
+    """The agent's MiddlewareClient, wrapping its client on first use"""
+    client = agent.client
+    if client is None:
+        return None
+    if not isinstance(client, MiddlewareClient):
+        client = MiddlewareClient(client, agent)
+        agent.client = client
+    return client
+
+
+def install_middleware(agent, middleware):
+    """Route an agent's LLM calls through ``middleware`` (outermost first)"""
+    client = middleware_client(agent)
+    if client is None:
+        return False
+    client.use(middleware)
+    return True
+
+
+def set_routes(agent, route_factory):
+    """Send calls with ``params["model"]`` to ``route_factory(model)`` (None: agent's client)"""
+    client = middleware_client(agent)
+    if client is None:
+        return False
+    client.route_factory = route_factory
+    client.routes = {}
+    return True
+
+
+def agent_model(agent):
+    """Model name from the first entry of an agent's config_list"""
+    llm_config = agent.llm_config or {}
+    config_list = llm_config.get("config_list") or [llm_config]
+    return config_list[0].get("model")
+
+
+def response_text(agent, response):
+    """Text of the first choice of a response, or None for tool/function calls"""
+    extracted = agent.client.extract_text_or_completion_object(response)
+    if extracted and isinstance(extracted[0], str):
+        return extracted[0]
+    return None
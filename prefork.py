@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Pre-fork worker mode for the HTTP consultation service
+
+    python prefork.py --workers 4 --port 8000
+    python prefork.py --timings      # print the startup breakdown and exit
+
+A cold worker pays for importing autogen, openai and dotenv, building the
+llm_config and OpenAI client, and constructing agent pipelines before it
+serves anything. Here the parent process does all of that once
+(``warm_start``), binds the listening socket and then forks the workers.
+They inherit the imported modules, the service and its pool of built
+pipelines through copy-on-write, so a new worker is serving within
+milliseconds:
+
+- a worker that exits is replaced at once; SIGTTIN adds a worker and
+  SIGTTOU removes one, so capacity can follow bursts without cold starts
+- ``gc.freeze()`` before forking keeps the collector from touching (and so
+  copying) the inherited objects
+- the parent makes no LLM calls, and executors, the consultation store and
+  the SQLite response cache open their own threads and connections in each
+  child (``os.register_at_fork`` hooks in those modules)
+
+``StartupTimer`` breaks the parent's startup into phases; the breakdown and
+each worker's fork-to-ready time are served under ``startup`` at GET /health.
+"""
+
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_WARM_PIPELINES = 4
+DEFAULT_BACKLOG = 2048
+
+
+class StartupTimer:
+    """Wall time of named startup phases, in the order they ran"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (
+                time.perf_counter() - started
+            )
+
+    def report(self):
+        """Seconds per phase plus the total since the timer was created"""
+        return {
+            **{f"{name}_seconds": seconds for name, seconds in self.phases.items()},
+            "total_seconds": time.perf_counter() - self.started,
+        }
+
+
+def warm_start(llm_config=None, warm=DEFAULT_WARM_PIPELINES, timer=None):
+    """Import, configure and build everything workers share; returns the service"""
+    timer = timer or StartupTimer()
+    # Imported here so that each import is timed as its own phase
+    with timer.phase("import_autogen"):
+        import autogen  # noqa: F401
+    with timer.phase("import_openai"):
+        import openai  # noqa: F401
+    with timer.phase("environment"):
+        from healthcare_chatbot import load_environment
+
+        load_environment()
+    with timer.phase("import_service"):
+        import service
+    with timer.phase("service"):
+        app = service.create_app(llm_config)
+    with timer.phase("pipelines"):
+        app.engine.pool.warm(app.llm_config, count=warm, **app.engine.options)
+    with timer.phase("gc_freeze"):
+        gc.collect()
+        gc.freeze()
+    app.startup = {"parent": timer.report()}
+    return app
+
+
+def serve_uvicorn(app, sock):
+    """Serve ``app`` on an already listening socket with uvicorn"""
+    import uvicorn
+
+    config = uvicorn.Config(app, lifespan="on", log_level="warning")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class PreforkServer:
+    """Forks warm workers that serve one app on a shared listening socket"""
+
+    def __init__(self, app, sock, workers=None, serve=serve_uvicorn):
+        self.app = app
+        self.sock = sock
+        self.workers = workers or os.cpu_count() or 1
+        self.serve = serve
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        """Fork one worker; returns its pid"""
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                for signum in (signal.SIGTTIN, signal.SIGTTOU):
+                    signal.signal(signum, signal.SIG_IGN)
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    signal.signal(signum, signal.SIG_DFL)
+                self.app.startup = {
+                    **(self.app.startup or {}),
+                    "worker_pid": os.getpid(),
+                    "fork_to_ready_seconds": time.perf_counter() - forked_at,
+                }
+                self.serve(self.app, self.sock)
+                code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self.children[pid] = forked_at
+        return pid
+
+    def start(self):
+        """Fork workers until ``workers`` are running"""
+        while not self.stopping and len(self.children) < self.workers:
+            self.spawn()
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _add_worker(self, *_):
+        self.workers += 1
+        self.start()
+
+    def _remove_worker(self, *_):
+        if self.workers > 1 and self.children:
+            self.workers -= 1
+            os.kill(next(iter(self.children)), signal.SIGTERM)
+
+    def run(self):
+        """Keep ``workers`` workers running until SIGINT or SIGTERM"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGTTIN, self._add_worker)
+        signal.signal(signal.SIGTTOU, self._remove_worker)
+        self.start()
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.children.pop(pid, None)
+            self.start()
+
+
+def main(argv=None):
+    """Warm up once, then serve the consultation API from pre-forked workers"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, help="worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--warm",
+        type=int,
+        default=DEFAULT_WARM_PIPELINES,
+        help="pipelines built in the parent and shared by every worker",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="use the offline fake LLM backend instead of OpenAI",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="print the startup timing breakdown and exit without serving",
+    )
+    args = parser.parse_args(argv)
+
+    timer = StartupTimer()
+    if not args.timings:
+        try:
+            with timer.phase("import_uvicorn"):
+                import uvicorn  # noqa: F401
+        except ImportError:
+            print(
+                "uvicorn is required to serve the API: pip install uvicorn",
+                file=sys.stderr,
+            )
+            return 1
+    llm_config = None
+    if args.offline:
+        from fake_llm import fake_llm_config
+
+        llm_config = fake_llm_config()
+    app = warm_start(llm_config, warm=args.warm, timer=timer)
+    for name, seconds in app.startup["parent"].items():
+        print(f"⏱️  {name}: {seconds:.3f}")
+    if args.timings:
+        print(json.dumps(app.startup, indent=2))
+        return 0
+
+    sock = socket.create_server((args.host, args.port), backlog=DEFAULT_BACKLOG)
+    server = PreforkServer(app, sock, workers=args.workers)
+    print(
+        f"✅ Serving on http://{args.host}:{args.port} with {server.workers} "
+        f"pre-forked workers (parent pid {os.getpid()})"
+    )
+    server.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
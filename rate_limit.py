@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Rate-limit aware scheduling of agent LLM calls
+
+``RateLimitScheduler`` is the innermost LLM middleware of every pipeline.
+For each model it keeps requests-per-minute and tokens-per-minute budgets,
+read from ``requests_per_minute`` / ``tokens_per_minute`` in the agent's
+``config_list`` entry (or the LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE
+environment variables), and:
+
+- paces calls so the budgets are not exceeded, serving callers in arrival order
+- retries a failed agent turn (429, timeouts, connection and 5xx errors)
+  with jittered exponential backoff, honouring ``Retry-After``; a 429 pauses
+  every caller of that model, not just the one that hit it
+- coalesces identical in-flight requests into a single provider call; the
+  other callers get a copy marked ``coalesced`` without usage, so tokens
+  and cost are counted once
+
+One scheduler is shared by the whole process (``DEFAULT_SCHEDULER``), since
+provider limits apply per API key rather than per consultation.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from llm_middleware import agent_model
+
+# Rough completion size reserved before the real usage is known
+DEFAULT_COMPLETION_ESTIMATE = 256
+
+
+def estimate_tokens(params):
+    """Prompt tokens (about four characters each) plus the expected completion"""
+    chars = sum(len(str(m.get("content") or "")) for m in params.get("messages") or [])
+    completion = params.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+    return chars // 4 + completion
+
+
+def request_key(model, params):
+    """Identity of a request for coalescing; streaming does not change the answer"""
+    payload = {k: v for k, v in params.items() if k not in ("stream", "agent", "cache")}
+    return hashlib.sha256(
+        json.dumps([model, payload], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def env_limit(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def retryable_errors():
+    errors = (TimeoutError, ConnectionError)
+    try:
+        import openai
+    except ImportError:
+        return errors
+    return errors + (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+def is_rate_limit(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, if it said so"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class TokenBucket:
+    """Per-minute budget; reservations may go into debt and wait it out in order"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """Take ``amount`` and return the seconds to wait before using it"""
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        self.available -= amount
+        return 0.0 if self.available >= 0 else -self.available / self.rate
+
+    def refund(self, amount):
+        self.available = min(self.capacity, self.available + amount)
+
+
+class ModelBudget:
+    """Request and token budgets for one model"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """Reserve one request and ``tokens`` tokens; returns seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            return wait
+
+    def settle(self, estimated, actual):
+        """Give back (or take more of) the token reservation once usage is known"""
+        if self.tokens is not None:
+            with self._lock:
+                self.tokens.refund(estimated - actual)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def coalesced_copy(response):
+    """A follower's view of a shared response: the same reply, no usage or cost.
+
+    The leader's response carries the one provider call's usage; middleware
+    outside the scheduler (cost ledger, token budgets) must count it once.
+    """
+    response = copy.copy(response)
+    response.usage = None
+    response.cost = 0.0
+    response.coalesced = True
+    return response
+
+
+class RateLimitScheduler:
+    """LLM middleware pacing, retrying and coalescing provider calls"""
+
+    def __init__(
+        self,
+        max_retries=6,
+        base_delay=0.5,
+        max_delay=30.0,
+        coalesce=True,
+        seed=None,
+        sleep=time.sleep,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.coalesce = coalesce
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._budgets = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.waited_seconds = 0.0
+
+    def budget(self, agent, model):
+        """The shared budget for ``model``, created from the agent's config_list"""
+        with self._lock:
+            budget = self._budgets.get(model)
+            if budget is None:
+                llm_config = agent.llm_config or {}
+                config_list = llm_config.get("config_list") or [llm_config]
+                config = next(
+                    (c for c in config_list if c.get("model") == model), config_list[0]
+                )
+                budget = self._budgets[model] = ModelBudget(
+                    config.get("requests_per_minute")
+                    or env_limit("LLM_REQUESTS_PER_MINUTE"),
+                    config.get("tokens_per_minute")
+                    or env_limit("LLM_TOKENS_PER_MINUTE"),
+                )
+            return budget
+
+    def backoff(self, attempt, error):
+        """Seconds to wait before retry number ``attempt + 1``"""
+        delay = retry_after(error)
+        if delay is not None:
+            return min(delay, self.max_delay)
+        with self._lock:
+            # Full jitter keeps retrying callers from synchronizing
+            return self._random.uniform(
+                0, min(self.max_delay, self.base_delay * 2**attempt)
+            )
+
+    def __call__(self, agent, params, call_next):
+        model = params.get("model") or agent_model(agent)
+        if not self.coalesce:
+            return self._send(agent, model, params, call_next)
+        key = request_key(model, params)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return coalesced_copy(future.result())
+        try:
+            response = self._send(agent, model, params, call_next)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _send(self, agent, model, params, call_next):
+        budget = self.budget(agent, model)
+        estimate = estimate_tokens(params)
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            wait = budget.acquire(estimate)
+            if wait > 0:
+                self.sleep(wait)
+            with self._lock:
+                self.requests += 1
+                self.waited_seconds += wait
+            try:
+                response = call_next(params)
+            except Exception as e:
+                # A failed attempt used no tokens; a retry reserves its own
+                budget.settle(estimate, 0)
+                if not isinstance(e, retryable) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                if is_rate_limit(e):
+                    budget.pause(delay)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                self.sleep(delay)
+                continue
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                budget.settle(
+                    estimate,
+                    (usage.prompt_tokens or 0) + (usage.completion_tokens or 0),
+                )
+            try:
+                response.retries = attempt
+            except (AttributeError, ValueError):
+                pass
+            return response
+
+    def stats(self):
+        """Provider calls made, retries, coalesced requests and time spent pacing"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "coalesced": self.coalesced,
+                "waited_seconds": self.waited_seconds,
+            }
+
+
+DEFAULT_SCHEDULER = RateLimitScheduler()
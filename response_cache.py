@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Response cache for agent turns
+
+Keys are built from the model, the agent's system message and the
+normalized conversation so far, so repeated triage cases ("headache and
+fatigue", "Headache  and fatigue.") are answered without calling the LLM.
+Backends are consulted in order; a hit in a slower backend is copied into
+the faster ones in front of it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from llm_middleware import TextResponse, agent_model, response_text
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?,;:]+$")
+
+
+def normalize_text(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    text = _WHITESPACE.sub(" ", str(text or "")).strip().lower()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def cache_key(model, system_message, messages, structured_output=None):
+    """Stable key for a model, role prompt, conversation and requested schema"""
+    role_prompt = normalize_text(system_message)
+    conversation = [
+        [m.get("role"), m.get("name"), normalize_text(m.get("content"))]
+        for m in messages
+        # The role prompt is keyed once; injected instructions are part of the turn
+        if m.get("role") != "system" or normalize_text(m.get("content")) != role_prompt
+    ]
+    key = [model, role_prompt, conversation]
+    if structured_output:
+        key.append(structured_output)
+    payload = json.dumps(key, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCacheBackend:
+    """In-memory LRU with optional TTL"""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# SQLite connections a forked child inherited. They must not be used or
+# closed there (closing could checkpoint the parent's WAL), so they stay
+# referenced, unused, for the life of the child.
+_retired_connections = []
+
+
+def retire_connection(conn):
+    """Keep a connection inherited across fork alive but unused in the child"""
+    _retired_connections.append(conn)
+
+
+class SQLiteCacheBackend:
+    """On-disk cache in a single SQLite table with TTL and size eviction"""
+
+    def __init__(self, path, max_entries=100_000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+        _backends.add(self)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        """In a forked child: open a connection of its own"""
+        retire_connection(self._conn)
+        self._open()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl and created + self.ttl <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+_backends = weakref.WeakSet()
+
+
+def _reopen_after_fork():
+    for backend in list(_backends):
+        backend._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+class ResponseCache:
+    """LLM middleware that serves repeated agent turns from cache backends"""
+
+    def __init__(self, *backends):
+        self.backends = list(backends) or [LRUCacheBackend()]
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        for index, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                for faster in self.backends[:index]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for backend in self.backends:
+            backend.set(key, value)
+
+    def __call__(self, agent, params, call_next):
+        model = params.get("model") or agent_model(agent)
+        key = cache_key(
+            model,
+            agent.system_message,
+            params.get("messages") or [],
+            params.get("structured_output"),
+        )
+        text = self.get(key)
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if text is not None:
+            return TextResponse(text, model=model, cached=True)
+
+        response = call_next(params)
+        text = response_text(agent, response)
+        if text:
+            self.set(key, text)
+        return response
+
+    def stats(self):
+        """Hit/miss counters and entries per backend"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": [len(backend) for backend in self.backends],
+        }
+
+
+def from_environment():
+    """ResponseCache configured by RESPONSE_CACHE_PATH / RESPONSE_CACHE_TTL, or None"""
+    path = os.getenv("RESPONSE_CACHE_PATH")
+    if not path:
+        return None
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "0")) or None
+    return ResponseCache(LRUCacheBackend(ttl=ttl), SQLiteCacheBackend(path, ttl=ttl))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Model routing per agent role and input complexity
+
+Every agent used to call gpt-4o. A ``RoutingPolicy`` picks a model tier for
+each LLM call from the agent's role and how complex the patient's symptoms
+look:
+
+- trivial inputs (a single symptom, no red flags) use the small model for
+  every role
+- otherwise each role uses its tier from ``role_tiers`` (the pharmacy
+  formatting step is small by default, diagnosis and consultation large)
+- complex inputs (red flags, many symptoms, long descriptions) escalate
+  every role to the large model
+
+Unless a policy names its models, tiers follow the agent's ``config_list``
+as ``build_llm_config`` orders it: the main model is large and the second
+entry (LLM_SMALL_MODEL) small. A tier is only used when its model is in the
+``config_list``; the pipeline gives each agent one client per model that
+falls back to the other ``config_list`` entries on errors. With a
+single-model config the policy changes nothing.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+from llm_middleware import agent_model
+
+TRIVIAL, NORMAL, COMPLEX = "trivial", "normal", "complex"
+
+RED_FLAGS = (
+    "chest pain",
+    "shortness of breath",
+    "difficulty breathing",
+    "trouble breathing",
+    "confusion",
+    "fainting",
+    "passed out",
+    "seizure",
+    "stiff neck",
+    "numbness",
+    "slurred speech",
+    "vision loss",
+    "coughing blood",
+    "vomiting blood",
+    "pregnan",
+    "suicid",
+    "severe",
+    "worst",
+    "infant",
+)
+
+_SYMPTOM_SEPARATORS = re.compile(r",|;|\band\b|\bwith\b|\bplus\b")
+
+
+def patient_text(messages):
+    """Content of the patient's messages, where the symptoms are described"""
+    return " ".join(
+        str(m.get("content") or "") for m in messages if m.get("name") == "patient"
+    )
+
+
+def assess_complexity(text):
+    """TRIVIAL, NORMAL or COMPLEX for a symptom description"""
+    text = " ".join(str(text or "").lower().split())
+    if any(flag in text for flag in RED_FLAGS):
+        return COMPLEX
+    symptoms = [part for part in _SYMPTOM_SEPARATORS.split(text) if part.strip()]
+    words = len(text.split())
+    if len(symptoms) >= 4 or words >= 40:
+        return COMPLEX
+    if len(symptoms) <= 1 and words <= 12:
+        return TRIVIAL
+    return NORMAL
+
+
+@dataclass
+class RoutingPolicy:
+    """LLM middleware choosing the model for each call"""
+
+    # None: the second and first entries of the agent's config_list
+    small_model: str = None
+    large_model: str = None
+    role_tiers: dict = field(
+        default_factory=lambda: {
+            "diagnosis": "large",
+            "pharmacy": "small",
+            "consultation": "large",
+        }
+    )
+
+    def route(self, role, complexity, models=()):
+        """Model for ``role`` on an input of the given complexity.
+
+        ``models`` are the configured models, main model first; they name
+        the tiers the policy leaves unset.
+        """
+        if complexity == TRIVIAL:
+            tier = "small"
+        elif complexity == COMPLEX:
+            tier = "large"
+        else:
+            tier = self.role_tiers.get(role, "large")
+        if tier == "small":
+            return self.small_model or (models[1] if len(models) > 1 else None)
+        return self.large_model or (models[0] if models else None)
+
+    def __call__(self, agent, params, call_next):
+        llm_config = agent.llm_config or {}
+        models = [c.get("model") for c in llm_config.get("config_list") or []]
+        complexity = assess_complexity(patient_text(params.get("messages") or []))
+        model = self.route(agent.name, complexity, models)
+        available = set(models)
+        if model in available and model != (params.get("model") or agent_model(agent)):
+            params = {**params, "model": model}
+        return call_next(params)
+
+
+DEFAULT_ROUTING = RoutingPolicy()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+HTTP consultation service (ASGI)
+
+    POST /consultations               {"symptoms": "..."} -> 202 {"id": ...}
+                                      (X-Tenant header: whose budget pays;
+                                      429 once it is exhausted)
+    GET  /consultations/{id}          status, transcript and summary
+                                      (from the consultation store once evicted)
+    GET  /consultations/{id}/stream   server-sent events: token..., [error], done
+    GET  /health                      pool statistics
+    GET  /metrics                     Prometheus metrics
+    GET  /costs                       token and cost totals per tenant, agent
+                                      and model, and tenant budgets
+
+Consultations run on pooled pipelines as coroutines on the server's event
+loop (``ConsultationPipeline.a_consult``); only the provider calls borrow a
+thread, and every agent reaches the model through the process-wide,
+connection-pooled OpenAI client (``SharedOpenAIClient``), so one process can
+serve many concurrent consultations. Serve it with any ASGI server:
+
+    uvicorn service:app
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_chat import run_blocking
+from consultation_engine import ConsultationEngine
+from consultation_store import get_store
+from cost_ledger import DEFAULT_TENANT
+from cost_ledger import from_environment as ledger_from_environment
+from healthcare_chatbot import build_llm_config, load_environment
+from instrumentation import Instrumentation
+from response_cache import from_environment
+from similarity import from_environment as similarity_from_environment
+from streaming import Transcript, stream_to, streaming_middleware
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 128
+DEFAULT_MAX_RECORDS = 1000
+MAX_BODY_BYTES = 64 * 1024
+
+
+class Consultation:
+    """One submitted consultation and the events published while it runs.
+
+    Events are only appended on the event loop; worker threads go through
+    ``publish``.
+    """
+
+    def __init__(self, symptoms, loop, tenant=DEFAULT_TENANT):
+        self.id = uuid.uuid4().hex
+        self.symptoms = symptoms
+        self.tenant = tenant
+        self.status = "queued"
+        self.created = time.time()
+        self.result = None
+        self.events = []
+        self.transcript = Transcript()
+        self._loop = loop
+        self._waiters = []
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def publish(self, event, data):
+        """Thread-safe: schedule an event to be appended on the event loop"""
+        self._loop.call_soon_threadsafe(self.append, event, data)
+
+    def append(self, event, data):
+        if event == "token":
+            self.transcript(data["agent"], data["text"])
+        self.events.append((event, data))
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def follow(self):
+        """Every event so far, then new ones as they arrive, up to ``done``"""
+        index = 0
+        while True:
+            while index < len(self.events):
+                event, data = self.events[index]
+                index += 1
+                yield event, data
+                if event == "done":
+                    return
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    def to_dict(self):
+        result = self.result
+        if result is not None:
+            transcript = [
+                {"name": m.get("name"), "content": m.get("content")}
+                for m in result.messages
+            ]
+        else:
+            transcript = [
+                {"name": agent, "content": text}
+                for agent, text in self.transcript.turns
+            ]
+        return {
+            "id": self.id,
+            "symptoms": self.symptoms,
+            "tenant": self.tenant,
+            "status": self.status,
+            "created": self.created,
+            "transcript": transcript,
+            "summary": result.summary if result is not None else None,
+            "error": result.error if result is not None else None,
+            "elapsed": result.elapsed if result is not None else None,
+            "cost": result.cost if result is not None else None,
+        }
+
+
+class ConsultationService:
+    """ASGI application serving consultations over HTTP"""
+
+    def __init__(
+        self,
+        llm_config=None,
+        workers=DEFAULT_WORKERS,
+        max_records=DEFAULT_MAX_RECORDS,
+        middlewares=(),
+        store=None,
+        ledger=None,
+        **options,
+    ):
+        if llm_config is None:
+            load_environment()
+            llm_config = build_llm_config()
+        self.llm_config = llm_config
+        self.workers = workers
+        self.max_records = max_records
+        self.store = store
+        self.ledger = ledger
+        self.instrumentation = Instrumentation()
+        self.engine = ConsultationEngine(
+            llm_config,
+            concurrency=workers,
+            instrumentation=self.instrumentation,
+            ledger=ledger,
+            silent=True,
+            middlewares=[streaming_middleware, *middlewares],
+            **options,
+        )
+        self.consultations = OrderedDict()
+        # Startup timing breakdown, set by a warm-starting launcher (prefork.py)
+        self.startup = None
+        # At most ``workers`` consultations in flight; the rest stay queued
+        self._slots = asyncio.Semaphore(workers)
+        self._tasks = set()
+
+    async def submit(self, symptoms, tenant=DEFAULT_TENANT):
+        """Start a consultation in the background and return its record"""
+        consultation = Consultation(symptoms, asyncio.get_running_loop(), tenant)
+        self.consultations[consultation.id] = consultation
+        self._evict()
+        task = asyncio.ensure_future(self._run(consultation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return consultation
+
+    def _evict(self):
+        excess = len(self.consultations) - self.max_records
+        for consultation_id in [
+            c.id for c in self.consultations.values() if c.finished
+        ][: max(0, excess)]:
+            del self.consultations[consultation_id]
+
+    async def _run(self, consultation):
+        def on_token(agent, text):
+            consultation.publish("token", {"agent": agent, "text": text})
+
+        try:
+            async with self._slots:
+                consultation.status = "running"
+                with stream_to(on_token):
+                    result = await self.engine.a_consult(
+                        0, consultation.symptoms, tenant=consultation.tenant
+                    )
+            consultation.result = result
+            consultation.status = "done" if result.ok else "failed"
+            if self.store is not None:
+                try:
+                    self.store.record_result(result, consultation_id=consultation.id)
+                except Exception:
+                    # The consultation itself finished; only its history is lost
+                    logger.exception("Could not store consultation %s", consultation.id)
+        except Exception as e:
+            logger.exception("Consultation %s failed", consultation.id)
+            consultation.append("error", {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            # Streams follow events up to "done", so it is always sent
+            if not consultation.finished:
+                consultation.status = "failed"
+            consultation.append("done", consultation.to_dict())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method = scope["method"]
+        parts = [part for part in scope["path"].split("/") if part]
+
+        if parts == ["health"]:
+            health = {"status": "ok", **self.engine.pool.stats()}
+            if self.startup is not None:
+                health["startup"] = self.startup
+            await send_json(send, 200, health)
+        elif parts == ["metrics"]:
+            body = self.instrumentation.render_prometheus()
+            if self.ledger is not None:
+                body += self.ledger.render_prometheus()
+            body = body.encode("utf-8")
+            await send_body(send, 200, body, b"text/plain; version=0.0.4")
+        elif parts == ["costs"]:
+            await send_json(send, 200, self.costs())
+        elif parts == ["consultations"]:
+            if method != "POST":
+                await send_json(send, 405, {"error": "method not allowed"})
+                return
+            await self._create(scope, receive, send)
+        elif len(parts) in (2, 3) and parts[0] == "consultations":
+            consultation = self.consultations.get(parts[1])
+            stored = None
+            if consultation is None and len(parts) == 2 and self.store is not None:
+                stored = await run_blocking(self.store.get, parts[1])
+            if stored is not None:
+                await send_json(send, 200, stored_dict(stored))
+            elif consultation is None:
+                await send_json(send, 404, {"error": "consultation not found"})
+            elif len(parts) == 2:
+                await send_json(send, 200, consultation.to_dict())
+            elif parts[2] == "stream":
+                await self._stream(consultation, send)
+            else:
+                await send_json(send, 404, {"error": "not found"})
+        else:
+            await send_json(send, 404, {"error": "not found"})
+
+    def costs(self):
+        """Spend totals per tenant, agent and model, and each budget's state"""
+        if self.ledger is None:
+            return {}
+        costs = {
+            f"by_{by}": {
+                group[0]: totals
+                for group, totals in self.ledger.totals(by=(by,)).items()
+            }
+            for by in ("tenant", "agent", "model")
+        }
+        costs["budgets"] = [self.ledger.spend(tenant) for tenant in self.ledger.budgets]
+        return costs
+
+    async def _create(self, scope, receive, send):
+        tenant = header(scope, b"x-tenant") or DEFAULT_TENANT
+        if self.ledger is not None and not self.ledger.allows(tenant):
+            await send_json(
+                send, 429, {"error": f"budget for tenant {tenant!r} is exhausted"}
+            )
+            return
+        body = await read_body(receive)
+        if body is None:
+            await send_json(send, 413, {"error": "request body too large"})
+            return
+        try:
+            symptoms = json.loads(body or b"{}").get("symptoms")
+        except (ValueError, AttributeError):
+            symptoms = None
+        if not isinstance(symptoms, str) or not symptoms.strip():
+            await send_json(
+                send, 400, {"error": "'symptoms' must be a non-empty string"}
+            )
+            return
+        consultation = await self.submit(symptoms.strip(), tenant)
+        await send_json(
+            send,
+            202,
+            {
+                "id": consultation.id,
+                "status": consultation.status,
+                "transcript": f"/consultations/{consultation.id}",
+                "stream": f"/consultations/{consultation.id}/stream",
+            },
+        )
+
+    async def _stream(self, consultation, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                ],
+            }
+        )
+        async for event, data in consultation.follow():
+            chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk.encode("utf-8"),
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Build pipelines up front so the first requests don't pay for it
+                await run_blocking(
+                    self.engine.pool.warm,
+                    self.llm_config,
+                    count=min(self.workers, 4),
+                    **self.engine.options,
+                )
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.ledger is not None:
+                    self.ledger.flush()
+                if self.store is not None:
+                    self.store.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def stored_dict(stored):
+    """A stored consultation in the shape of ``Consultation.to_dict``"""
+    return {
+        "id": stored["id"],
+        "symptoms": stored["symptoms"],
+        "status": "failed" if stored["error"] else "done",
+        "created": stored["created"],
+        "transcript": stored["messages"],
+        "summary": stored["recommendation"],
+        "error": stored["error"],
+        "elapsed": stored["elapsed"],
+        "outcome": stored["outcome"],
+    }
+
+
+def header(scope, name):
+    """Value of a request header (``name`` in lower case), or None"""
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value.decode("latin-1").strip() or None
+    return None
+
+
+async def read_body(receive, limit=MAX_BODY_BYTES):
+    """Request body, or None if it exceeds ``limit`` bytes"""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > limit:
+            return None
+        if not message.get("more_body"):
+            return body
+
+
+async def send_body(send, status, body, content_type):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, payload):
+    await send_body(
+        send, status, json.dumps(payload).encode("utf-8"), b"application/json"
+    )
+
+
+def create_app(llm_config=None):
+    """Service configured from the environment (OPENAI_API_KEY, SERVICE_WORKERS, ...)"""
+    cache = from_environment()
+    store = get_store()
+    similarity = similarity_from_environment()
+    if similarity is not None and store is not None:
+        similarity.load_store(store)
+    return ConsultationService(
+        llm_config,
+        workers=int(os.getenv("SERVICE_WORKERS", DEFAULT_WORKERS)),
+        middlewares=[cache] if cache else [],
+        store=store,
+        ledger=ledger_from_environment(store),
+        similarity=similarity,
+    )
+
+
+def __getattr__(name):
+    """Build ``app`` on first access so importing this module stays cheap"""
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main(argv=None):
+    """Serve the consultation API with uvicorn"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        print(
+            "uvicorn is required to serve the API: pip install uvicorn", file=sys.stderr
+        )
+        return 1
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Per-session consultation state with bounded memory
+
+The Streamlit app serves many browser sessions from one long-running
+process. Agents and GroupChats come from the shared ``AgentPool`` and are
+reset after every consultation, so nothing a patient typed stays on them;
+what a session keeps between reruns (its past consultations) lives here,
+keyed by session id, and is bounded:
+
+- at most ``max_messages`` messages and ``max_bytes`` of message text per
+  session; the oldest consultations are dropped first
+- sessions idle for ``idle_seconds`` are evicted, and at most
+  ``max_sessions`` are kept (least recently used go first)
+
+``stats`` reports what is retained alongside the process's resident memory.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_MAX_MESSAGES = 200
+DEFAULT_MAX_BYTES = 256 * 1024
+DEFAULT_IDLE_SECONDS = 30 * 60
+
+
+def message_bytes(message):
+    """Approximate memory retained for one message (its text)"""
+    return len(str(message.get("content") or "").encode("utf-8")) + len(
+        str(message.get("name") or "")
+    )
+
+
+@dataclass
+class SessionConsultation:
+    """One finished consultation kept for a session"""
+
+    symptoms: str
+    messages: list
+    created: float
+    error: str = None
+
+    @property
+    def size(self):
+        return len(self.symptoms.encode("utf-8")) + sum(
+            message_bytes(m) for m in self.messages
+        )
+
+    @property
+    def summary(self):
+        for message in reversed(self.messages):
+            if message.get("content"):
+                return message["content"]
+        return None
+
+
+@dataclass
+class SessionState:
+    """Everything retained for one browser session"""
+
+    session_id: str
+    created: float
+    last_seen: float
+    consultations: deque = field(default_factory=deque)
+    messages: int = 0
+    bytes: int = 0
+
+
+def resident_memory():
+    """Resident set size of this process in bytes, or None if unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class SessionManager:
+    """Thread-safe, bounded store of per-session consultation history"""
+
+    def __init__(
+        self,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+        max_messages=DEFAULT_MAX_MESSAGES,
+        max_bytes=DEFAULT_MAX_BYTES,
+        idle_seconds=DEFAULT_IDLE_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_sessions = 0
+        self.dropped_consultations = 0
+
+    def session(self, session_id):
+        """The session's state, created on first use; marks it as active"""
+        with self._lock:
+            now = self.clock()
+            self._evict_idle(now)
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState(session_id, created=now, last_seen=now)
+                self._sessions[session_id] = state
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted_sessions += 1
+            else:
+                state.last_seen = now
+                self._sessions.move_to_end(session_id)
+            return state
+
+    def history(self, session_id):
+        """The session's retained consultations, oldest first"""
+        return list(self.session(session_id).consultations)
+
+    def record(self, session_id, symptoms, messages, error=None):
+        """Keep a copy of a finished consultation, trimming the session to its caps"""
+        consultation = SessionConsultation(
+            symptoms,
+            [{"name": m.get("name"), "content": m.get("content")} for m in messages],
+            created=time.time(),
+            error=error,
+        )
+        size = consultation.size
+        state = self.session(session_id)
+        with self._lock:
+            state.consultations.append(consultation)
+            state.messages += len(consultation.messages)
+            state.bytes += size
+            # The newest consultation is always kept, even if it alone is over
+            while len(state.consultations) > 1 and (
+                state.messages > self.max_messages or state.bytes > self.max_bytes
+            ):
+                dropped = state.consultations.popleft()
+                state.messages -= len(dropped.messages)
+                state.bytes -= dropped.size
+                self.dropped_consultations += 1
+        return consultation
+
+    def end(self, session_id):
+        """Forget a session"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def evict_idle(self):
+        """Drop sessions idle for longer than ``idle_seconds``; returns how many"""
+        with self._lock:
+            return self._evict_idle(self.clock())
+
+    def _evict_idle(self, now):
+        evicted = 0
+        # Least recently seen first, so stop at the first active session
+        while self._sessions:
+            state = next(iter(self._sessions.values()))
+            if now - state.last_seen <= self.idle_seconds:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        self.evicted_sessions += evicted
+        return evicted
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        """Live sessions, retained messages and bytes, evictions and process RSS"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            stats = {
+                "sessions": len(sessions),
+                "consultations": sum(len(s.consultations) for s in sessions),
+                "messages": sum(s.messages for s in sessions),
+                "bytes": sum(s.bytes for s in sessions),
+                "evicted_sessions": self.evicted_sessions,
+                "dropped_consultations": self.dropped_consultations,
+            }
+        return {**stats, "resident_bytes": resident_memory()}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager():
+    """Return the process-wide session manager"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionManager()
+    return _manager
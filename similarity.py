@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Semantic symptom-similarity index over past consultations
+
+Many intake messages are paraphrases of cases already answered ("headache
+and fever" / "I have a fever and a headache"). A ``SimilarityIndex`` embeds
+the symptoms of each completed consultation into a numpy matrix; when a new
+description scores at or above ``threshold`` (cosine similarity) against a
+past one, the pipeline replays that consultation's diagnosis, pharmacy and
+consultation turns instead of running the three-agent chat.
+
+Embedders are pluggable: any callable mapping a list of strings to a 2-D
+array. ``HashingEmbedder`` (the default) needs nothing beyond numpy and runs
+in microseconds on the CPU; ``OpenAIEmbedder`` uses an embedding model
+through the shared OpenAI client for paraphrases with little word overlap.
+
+Inputs with red flags (``routing.COMPLEX``) always get a fresh consultation.
+"""
+
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from response_cache import normalize_text
+from routing import COMPLEX, assess_complexity
+from termination import COMPLETION_MARKER
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_DIMENSIONS = 1024
+
+_WORD = re.compile(r"[a-z0-9]+")
+_NEGATIONS = frozenset(("no", "not", "without", "never", "denies"))
+_FILLER = frozenset(
+    "a an and are am been but can feeling for have having help i im is it "
+    "me my of really so some the to very with".split()
+)
+
+
+def symptom_tokens(text):
+    """Content words of a symptom description; negated words become ``not_<word>``"""
+    tokens, negate = [], False
+    for word in _WORD.findall(normalize_text(text)):
+        if word in _NEGATIONS:
+            negate = True
+            continue
+        if word in _FILLER:
+            continue
+        tokens.append(f"not_{word}" if negate else word)
+        negate = False
+    return tokens
+
+
+class HashingEmbedder:
+    """Hashed bag of words and character trigrams, L2-normalized"""
+
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def features(self, text):
+        """(feature, weight) pairs; whole words weigh more than their trigrams"""
+        features = []
+        for token in symptom_tokens(text):
+            features.append((f"w:{token}", 1.0))
+            padded = f"<{token}>"
+            features.extend((padded[i : i + 3], 0.5) for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 1 else -1.0
+                vectors[row, (digest >> 1) % self.dimensions] += sign * weight
+        return vectors
+
+
+class OpenAIEmbedder:
+    """Embeddings from an OpenAI embedding model via the shared client"""
+
+    def __init__(self, model="text-embedding-3-small", api_key=None):
+        self.model = model
+        self.api_key = api_key
+
+    def __call__(self, texts):
+        from healthcare_chatbot import get_openai_client
+
+        response = get_openai_client(self.api_key).embeddings.create(
+            model=self.model, input=list(texts)
+        )
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+@dataclass
+class Match:
+    """A past consultation similar to the current symptoms"""
+
+    score: float
+    symptoms: str
+    messages: list = field(default_factory=list)
+
+
+def agent_turns(messages):
+    """The agents' turns of a completed consultation, or None if it did not complete"""
+    turns = [
+        {"role": "user", "name": m.get("name"), "content": m.get("content")}
+        for m in messages
+        if m.get("name") not in ("patient", None) and m.get("content")
+    ]
+    if not turns or COMPLETION_MARKER not in turns[-1]["content"]:
+        return None
+    return turns
+
+
+class SimilarityIndex:
+    """Thread-safe cosine-similarity index of past consultations"""
+
+    def __init__(self, embedder=None, threshold=DEFAULT_THRESHOLD):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self._vectors = None
+        self._entries = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _embed(self, texts):
+        vectors = np.asarray(self.embedder(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add(self, symptoms, messages):
+        """Index a consultation; returns False if it did not complete"""
+        return self.add_many([(symptoms, messages)]) == 1
+
+    def add_many(self, consultations):
+        """Index several (symptoms, messages) pairs with one embedding call"""
+        entries = []
+        for symptoms, messages in consultations:
+            turns = agent_turns(messages)
+            if turns is not None and symptom_tokens(symptoms):
+                entries.append(Match(0.0, symptoms, turns))
+        if not entries:
+            return 0
+        vectors = self._embed([entry.symptoms for entry in entries])
+        with self._lock:
+            count = len(self._entries)
+            if self._vectors is None:
+                self._vectors = np.zeros(
+                    (max(64, len(entries)), vectors.shape[1]), dtype=np.float32
+                )
+            elif count + len(entries) > len(self._vectors):
+                # Grow geometrically so appends stay amortized O(1)
+                grown = np.zeros(
+                    (
+                        max(2 * len(self._vectors), count + len(entries)),
+                        vectors.shape[1],
+                    ),
+                    dtype=np.float32,
+                )
+                grown[:count] = self._vectors[:count]
+                self._vectors = grown
+            self._vectors[count : count + len(entries)] = vectors
+            self._entries.extend(entries)
+        return len(entries)
+
+    def search(self, symptoms, k=1):
+        """The ``k`` most similar past consultations, best first"""
+        with self._lock:
+            count = len(self._entries)
+            vectors = self._vectors
+            # Append-only, so the first ``count`` entries never change
+            entries = self._entries
+        if count == 0 or not symptom_tokens(symptoms):
+            return []
+        scores = vectors[:count] @ self._embed([symptoms])[0]
+        k = min(k, count)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            Match(float(scores[i]), entries[i].symptoms, entries[i].messages)
+            for i in best
+        ]
+
+    def lookup(self, symptoms):
+        """The best past consultation at or above the threshold, or None"""
+        match = None
+        if assess_complexity(symptoms) != COMPLEX:
+            matches = self.search(symptoms)
+            if matches and matches[0].score >= self.threshold:
+                match = matches[0]
+        with self._lock:
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return match
+
+    def load_store(self, store, limit=10000):
+        """Index the most recent completed consultations of a ConsultationStore"""
+        rows = store.search(limit=limit)
+        return self.add_many(
+            (row["symptoms"], store.get(row["id"])["messages"])
+            for row in rows
+            if not row["error"]
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def from_environment():
+    """SimilarityIndex configured by SIMILARITY_THRESHOLD / SIMILARITY_EMBEDDER, or None"""
+    threshold = os.getenv("SIMILARITY_THRESHOLD")
+    if not threshold:
+        return None
+    embedder = None
+    if os.getenv("SIMILARITY_EMBEDDER", "hashing").lower() == "openai":
+        embedder = OpenAIEmbedder(
+            os.getenv("SIMILARITY_EMBEDDING_MODEL", "text-embedding-3-small")
+        )
+    return SimilarityIndex(embedder, threshold=float(threshold))
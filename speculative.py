@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Speculative pre-generation of the pharmacy step
+
+In the round-robin GroupChat the pharmacy agent starts only once the
+diagnosis agent's whole reply has been generated. A ``Speculator`` (LLM
+middleware, one per pipeline from ``SpeculativePolicy.attach``) watches the
+diagnosis tokens as they stream in. Once the reply has committed to its
+leading condition(s), i.e. finished its first sentence (``commit_point``),
+it starts a pharmacy draft on the LLM executor, prompted as the pharmacy
+agent will be but with the diagnosis cut at that point.
+
+When pharmacy's turn comes, the draft is kept if the rest of its prompt is
+unchanged and the finished diagnosis still opens with the committed text
+without revising it later (``REVISIONS``: "however", "rule out", urgency);
+otherwise it is discarded and pharmacy is called as usual. A kept draft
+saves however much of it overlapped the rest of the diagnosis; a discarded
+one costs an extra pharmacy call.
+
+Drafts are ordinary calls through the pharmacy agent's middleware
+(instrumentation, cost ledger, cache, rate limits), so a kept draft is
+accounted once, when it ran. Speculation is skipped under DAG orchestration
+and for structured (JSON) diagnosis replies.
+
+Enable it with ``ConsultationPipeline(..., speculative=DEFAULT_SPECULATIVE)``.
+"""
+
+import contextvars
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from async_chat import get_llm_executor
+from llm_middleware import TextResponse, response_text
+from streaming import stream_to
+
+# Later text that changes or escalates what the opening sentence said
+REVISIONS = re.compile(
+    r"\b(however|actually|on second thought|instead|rather than|rule(d)? out|"
+    r"cannot be excluded|emergency|urgent(ly)?|immediate(ly)?|call 911)\b",
+    re.IGNORECASE,
+)
+# A sentence is complete once its full stop is followed by more text
+_SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+
+_drafting = contextvars.ContextVar("speculative_draft", default=None)
+
+
+def commit_point(text, min_chars=20):
+    """End of the first complete sentence or line of ``text``, else None"""
+    for match in _SENTENCE_END.finditer(text):
+        if match.start() >= min_chars:
+            return match.start() + 1
+    return None
+
+
+def is_stable(committed, final):
+    """True if the finished reply keeps the committed opening and does not revise it"""
+    final = (final or "").strip()
+    if not committed or not final.startswith(committed):
+        return False
+    return REVISIONS.search(final[len(committed) :]) is None
+
+
+@dataclass
+class SpeculativePolicy:
+    """Which reply to draft ahead of its turn, from which agent's streamed reply"""
+
+    source: str = "diagnosis"
+    target: str = "pharmacy"
+    min_chars: int = 20
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"drafted": 0, "kept": 0, "discarded": 0, "saved_seconds": 0.0}
+
+    def attach(self, pipeline):
+        """Fresh per-pipeline state speculating with this policy"""
+        return Speculator(self, pipeline)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class Draft:
+    """A target reply generated ahead of its turn"""
+
+    def __init__(self, committed):
+        self.committed = committed
+        self.params = None
+        self.response = None
+        self.future = None
+        self.started = time.perf_counter()
+        self.finished = None
+
+
+class _SourceWatcher:
+    """IOStream pass-through that reports when the streamed reply commits"""
+
+    def __init__(self, inner, forward, on_commit, min_chars):
+        self.inner = inner
+        self.forward = forward
+        self.on_commit = on_commit
+        self.min_chars = min_chars
+        self.text = ""
+        self.committed = False
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.inner.print(*objects, sep=sep, end=end, flush=flush)
+
+    def send(self, message):
+        from autogen.messages.client_messages import StreamMessage
+
+        if isinstance(message, StreamMessage):
+            if not self.committed:
+                content = message.content
+                if not isinstance(content, str):
+                    content = content.content
+                self.text += content
+                end = commit_point(self.text, self.min_chars)
+                if end is not None:
+                    self.committed = True
+                    self.on_commit(self.text[:end].strip())
+            if not self.forward:
+                # Streaming was only turned on to watch the reply
+                return
+        self.inner.send(message)
+
+    def input(self, prompt="", *, password=False):
+        return self.inner.input(prompt, password=password)
+
+
+class Speculator:
+    """Per-pipeline speculation state and LLM middleware; reset between consultations"""
+
+    def __init__(self, policy, pipeline):
+        self.policy = policy
+        self.pipeline = pipeline
+        self.draft = None
+        self.source_text = None
+
+    def reset(self):
+        if self.draft is not None and self.draft.future is not None:
+            self.draft.future.cancel()
+        self.draft = None
+        self.source_text = None
+
+    def __call__(self, agent, params, call_next):
+        draft = _drafting.get()
+        if draft is not None:
+            # The draft's own call: remember what was sent and what came back
+            draft.params = params
+            draft.response = call_next(params)
+            return draft.response
+        if agent.name == self.policy.source:
+            return self._watch(agent, params, call_next)
+        if agent.name == self.policy.target and self.draft is not None:
+            response = self._use_draft(agent, params)
+            if response is not None:
+                return response
+        return call_next(params)
+
+    def _watch(self, agent, params, call_next):
+        self.reset()
+        if self.pipeline.dag or params.get("structured_output"):
+            return call_next(params)
+        from autogen.io import IOStream
+
+        # Drafts run in this context, without the watcher or a token sink
+        context = contextvars.copy_context()
+        watcher = _SourceWatcher(
+            IOStream.get_default(),
+            bool(params.get("stream")),
+            lambda committed: self._start_draft(agent, committed, context),
+            self.policy.min_chars,
+        )
+        with IOStream.set_default(watcher):
+            response = call_next({**params, "stream": True})
+        self.source_text = response_text(agent, response)
+        return response
+
+    def _start_draft(self, source, committed, context):
+        target = self.pipeline.agents[self.policy.target]
+        manager = self.pipeline.manager
+        # What the target has been sent so far, plus the committed opening
+        messages = [dict(m) for m in target._oai_messages.get(manager, [])]
+        messages.append({"content": committed, "role": "user", "name": source.name})
+        draft = Draft(committed)
+
+        def run():
+            token = _drafting.set(draft)
+            try:
+                with stream_to(None):
+                    target.generate_oai_reply(messages=messages, sender=manager)
+            finally:
+                _drafting.reset(token)
+                draft.finished = time.perf_counter()
+
+        draft.future = get_llm_executor().submit(context.run, run)
+        self.draft = draft
+        self.policy._count("drafted")
+
+    def _use_draft(self, agent, params):
+        """The draft as this call's response if it still holds, else None"""
+        draft, self.draft = self.draft, None
+        # Not started yet (the executor is busy): calling now is no slower
+        if draft.future.cancel():
+            self.policy._count("discarded")
+            return None
+        waited_from = time.perf_counter()
+        try:
+            draft.future.result()
+        except Exception:
+            draft.response = None
+        if not self._matches(draft, params):
+            self.policy._count("discarded")
+            return None
+        waited = time.perf_counter() - waited_from
+        self.policy._count("kept")
+        self.policy._count(
+            "saved_seconds", max(0.0, draft.finished - draft.started - waited)
+        )
+        # Tokens and cost were accounted when the draft ran
+        return TextResponse(
+            response_text(agent, draft.response),
+            model=getattr(draft.response, "model", None),
+        )
+
+    def _matches(self, draft, params):
+        """True if ``params`` is the draft's prompt with the finished source reply"""
+        if draft.response is None or not is_stable(draft.committed, self.source_text):
+            return False
+        sent = params.get("messages") or []
+        drafted = draft.params.get("messages") or []
+        if len(sent) != len(drafted):
+            return False
+        for message, drafted_message in zip(sent, drafted):
+            if message == drafted_message:
+                continue
+            if drafted_message.get("content") != draft.committed or {
+                **drafted_message,
+                "content": self.source_text,
+            } != {**message, "content": (message.get("content") or "").strip()}:
+                return False
+
+        def options(p):
+            return {
+                k: v
+                for k, v in p.items()
+                if k not in ("messages", "stream", "cache", "agent")
+            }
+
+        return options(params) == options(draft.params)
+
+
+DEFAULT_SPECULATIVE = SpeculativePolicy()
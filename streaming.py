@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Token streaming from agents to a UI
+
+``StreamingMiddleware`` turns on ``stream=True`` for an agent's LLM call and
+hands each token to the sink registered for the current consultation with
+``stream_to``. Pipelines are pooled and shared, so the sink lives in a
+context variable rather than on the middleware.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from llm_middleware import response_text
+
+_current_sink = ContextVar("token_sink", default=None)
+
+
+@contextmanager
+def stream_to(on_token):
+    """Send tokens from LLM calls made inside this block to ``on_token(agent, text)``"""
+    token = _current_sink.set(on_token)
+    try:
+        yield
+    finally:
+        _current_sink.reset(token)
+
+
+def deliver(agent_name, text):
+    """Send a whole reply produced without an LLM call (triage, reuse) to the sink"""
+    on_token = _current_sink.get()
+    if on_token is not None and text:
+        on_token(agent_name, text)
+
+
+def on_loop(on_token, loop=None):
+    """Sink that runs ``on_token`` on the event loop, whichever thread tokens arrive on.
+
+    Under ``a_consult`` tokens are produced on provider-call threads; UIs that
+    must only be touched from the loop's thread (Streamlit) wrap their sink
+    with this.
+    """
+    loop = loop or asyncio.get_running_loop()
+
+    def schedule(agent_name, text):
+        loop.call_soon_threadsafe(on_token, agent_name, text)
+
+    return schedule
+
+
+class AgentTokenStream:
+    """IOStream that forwards streamed chunks to a sink, tagged with the agent"""
+
+    def __init__(self, on_token, agent_name, fallback):
+        self.on_token = on_token
+        self.agent_name = agent_name
+        self.fallback = fallback
+        self.tokens = 0
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.fallback.print(*objects, sep=sep, end=end, flush=flush)
+
+    def send(self, message):
+        from autogen.messages.client_messages import StreamMessage
+
+        if isinstance(message, StreamMessage):
+            # Messages are wrapped: the outer model's content is the inner message
+            content = message.content
+            if not isinstance(content, str):
+                content = content.content
+            self.tokens += 1
+            self.on_token(self.agent_name, content)
+        else:
+            self.fallback.send(message)
+
+    def input(self, prompt="", *, password=False):
+        return self.fallback.input(prompt, password=password)
+
+
+class StreamingMiddleware:
+    """LLM middleware that streams tokens to the active ``stream_to`` sink"""
+
+    def __call__(self, agent, params, call_next):
+        on_token = _current_sink.get()
+        if on_token is None:
+            return call_next(params)
+
+        from autogen.io import IOStream
+
+        stream = AgentTokenStream(on_token, agent.name, IOStream.get_default())
+        with IOStream.set_default(stream):
+            response = call_next({**params, "stream": True})
+        if stream.tokens == 0:
+            # Served without streaming (e.g. a cache hit): deliver it in one piece
+            text = response_text(agent, response)
+            if text:
+                on_token(agent.name, text)
+        return response
+
+
+class Transcript:
+    """Accumulates streamed tokens into one entry per agent turn"""
+
+    def __init__(self, on_update=None):
+        self.turns = []
+        self.on_update = on_update
+
+    def __call__(self, agent_name, text):
+        if not self.turns or self.turns[-1][0] != agent_name:
+            self.turns.append([agent_name, ""])
+        self.turns[-1][1] += text
+        if self.on_update is not None:
+            self.on_update(len(self.turns) - 1, agent_name, self.turns[-1][1])
+
+
+streaming_middleware = StreamingMiddleware()
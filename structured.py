@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Structured outputs: compact, schema-validated payloads between agents
+
+With free-text replies every downstream agent re-reads the diagnosis
+agent's prose. A ``StructuredOutputPolicy`` (LLM middleware) instead asks
+the diagnosis and pharmacy agents for a JSON object matching a schema
+(``ROLE_SCHEMAS``) and validates it locally:
+
+- a valid payload is kept, and the chat transcript gets a short rendering
+  of it for people to read
+- when a later agent is prompted, turns that carry a payload are sent as
+  compact JSON rather than prose, so prompts are smaller and nothing has
+  to be re-interpreted
+- roles that are a pure function of earlier payloads (``DERIVED_ROLES``:
+  the consultation agent's final recommendation) are answered locally
+  without calling the model at all
+
+A reply that is not valid JSON for its schema is passed on unchanged as
+prose, and the derived roles then fall back to the model. Our own model
+clients (``SharedOpenAIClient``, ``FakeLLMClient``) also receive the schema
+as a ``structured_output`` parameter, which ``SharedOpenAIClient`` sends to
+OpenAI as a strict ``response_format``. Streamed tokens are the raw JSON.
+
+Enable it with ``ConsultationPipeline(..., structured=DEFAULT_STRUCTURED)``.
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from llm_middleware import TextResponse, response_text
+from termination import COMPLETION_MARKER
+
+URGENCY_LEVELS = ("emergency", "urgent", "routine", "self_care")
+
+DIAGNOSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "conditions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "likelihood": {"type": "string", "enum": ["high", "medium", "low"]},
+                },
+                "required": ["name", "likelihood"],
+                "additionalProperties": False,
+            },
+        },
+        "urgency": {"type": "string", "enum": list(URGENCY_LEVELS)},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["conditions", "urgency", "key_points"],
+    "additionalProperties": False,
+}
+
+PHARMACY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "medications": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "dose": {"type": "string"},
+                    "cautions": {"type": "string"},
+                },
+                "required": ["name", "dose", "cautions"],
+                "additionalProperties": False,
+            },
+        },
+        "self_care": {"type": "array", "items": {"type": "string"}},
+        "needs_prescription": {"type": "boolean"},
+    },
+    "required": ["medications", "self_care", "needs_prescription"],
+    "additionalProperties": False,
+}
+
+ROLE_SCHEMAS = {"diagnosis": DIAGNOSIS_SCHEMA, "pharmacy": PHARMACY_SCHEMA}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+}
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class StructuredOutputError(ValueError):
+    """A reply that is not a valid payload for its schema"""
+
+
+def validate(value, schema, path="$"):
+    """Check ``value`` against the JSON Schema subset used by ``ROLE_SCHEMAS``"""
+    kind = schema.get("type")
+    if kind is not None:
+        expected = _TYPES[kind]
+        if not isinstance(value, expected) or (
+            isinstance(value, bool) and kind in ("integer", "number")
+        ):
+            raise StructuredOutputError(f"{path}: expected {kind}")
+    if "enum" in schema and value not in schema["enum"]:
+        raise StructuredOutputError(f"{path}: {value!r} is not one of {schema['enum']}")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        missing = [name for name in schema.get("required", ()) if name not in value]
+        if missing:
+            raise StructuredOutputError(f"{path}: missing {missing}")
+        if schema.get("additionalProperties") is False:
+            extra = sorted(set(value) - set(properties))
+            if extra:
+                raise StructuredOutputError(f"{path}: unexpected {extra}")
+        for name, item in value.items():
+            if name in properties:
+                validate(item, properties[name], f"{path}.{name}")
+    elif kind == "array" and "items" in schema:
+        for index, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{index}]")
+    return value
+
+
+def parse_payload(text, schema):
+    """The validated JSON object in a reply, allowing a Markdown code fence"""
+    try:
+        payload = json.loads(_FENCE.sub("", str(text or "").strip()))
+    except ValueError as e:
+        raise StructuredOutputError(f"not JSON: {e}")
+    return validate(payload, schema)
+
+
+def compact_json(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def schema_instruction(schema):
+    """Instruction appended to a structured role's prompt"""
+    return (
+        "Reply with only a JSON object matching this JSON schema, without "
+        f"any other text: {compact_json(schema)}"
+    )
+
+
+def render_diagnosis(payload):
+    conditions = ", ".join(
+        f"{c['name']} ({c['likelihood']} likelihood)" for c in payload["conditions"]
+    )
+    lines = [f"Possible diagnosis: {conditions or 'unclear from the symptoms'}."]
+    lines.append(f"Urgency: {payload['urgency'].replace('_', ' ')}.")
+    if payload["key_points"]:
+        lines.append("Key points: " + "; ".join(payload["key_points"]) + ".")
+    return "\n".join(lines)
+
+
+def render_pharmacy(payload):
+    medications = "; ".join(
+        f"{m['name']} {m['dose']}" + (f" ({m['cautions']})" if m["cautions"] else "")
+        for m in payload["medications"]
+    )
+    lines = [f"Recommended medications: {medications or 'none'}."]
+    if payload["self_care"]:
+        lines.append("Self-care: " + "; ".join(payload["self_care"]) + ".")
+    if payload["needs_prescription"]:
+        lines.append("Prescription treatment may be needed; a doctor can prescribe it.")
+    return "\n".join(lines)
+
+
+RENDERERS = {"diagnosis": render_diagnosis, "pharmacy": render_pharmacy}
+
+
+def consultation_reply(diagnosis, pharmacy):
+    """The final recommendation as a pure function of the earlier payloads"""
+    urgency = diagnosis["urgency"]
+    if urgency == "emergency":
+        advice = (
+            "This may be an emergency: call your local emergency number or go "
+            "to the nearest emergency room now."
+        )
+    elif urgency == "urgent":
+        advice = (
+            "A doctor's visit is required urgently: see a doctor today rather "
+            "than waiting for symptoms to pass."
+        )
+    elif pharmacy["needs_prescription"]:
+        advice = (
+            "A doctor's visit is required. Book an appointment in the next few "
+            "days so the right treatment can be prescribed."
+        )
+    else:
+        advice = (
+            "A doctor's visit is not required now. See a doctor if symptoms get "
+            "worse, new symptoms appear, or they last longer than a week."
+        )
+    lines = [advice]
+    if diagnosis["conditions"]:
+        lines.append(f"Most likely: {diagnosis['conditions'][0]['name']}.")
+    if pharmacy["medications"]:
+        names = ", ".join(m["name"] for m in pharmacy["medications"])
+        lines.append(f"For relief: {names}, as described above.")
+    return "\n".join(lines + [COMPLETION_MARKER])
+
+
+# Roles answered locally: role -> (roles whose payloads it needs, function)
+DERIVED_ROLES = {"consultation": (("diagnosis", "pharmacy"), consultation_reply)}
+
+
+@dataclass
+class StructuredOutputPolicy:
+    """LLM middleware exchanging schema-validated payloads between agents"""
+
+    schemas: dict = field(default_factory=lambda: dict(ROLE_SCHEMAS))
+    derived: dict = field(default_factory=lambda: dict(DERIVED_ROLES))
+    max_payloads: int = 4096
+
+    def __post_init__(self):
+        # Rendered transcript text -> (role, payload), shared by all pipelines
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"structured": 0, "invalid": 0, "derived": 0, "compacted": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def remember(self, role, text, payload):
+        with self._lock:
+            self._payloads[text] = (role, payload)
+            self._payloads.move_to_end(text)
+            while len(self._payloads) > self.max_payloads:
+                self._payloads.popitem(last=False)
+
+    def payload(self, message):
+        """(role, payload) behind a transcript message, if it carried one"""
+        content = message.get("content")
+        if not isinstance(content, str):
+            return None
+        with self._lock:
+            return self._payloads.get(content)
+
+    def payloads(self, messages):
+        """The latest payload per role among ``messages``"""
+        found = {}
+        for message in messages:
+            entry = self.payload(message)
+            if entry is not None:
+                found[entry[0]] = entry[1]
+        return found
+
+    def compact(self, messages):
+        """Messages with every payload-carrying turn replaced by its compact JSON"""
+        compacted = []
+        for message in messages:
+            entry = self.payload(message)
+            if entry is not None:
+                message = {**message, "content": compact_json(entry[1])}
+                self._count("compacted")
+            compacted.append(message)
+        return compacted
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "payloads": len(self._payloads)}
+
+    def __call__(self, agent, params, call_next):
+        messages = params.get("messages") or []
+        derived = self.derived.get(agent.name)
+        if derived is not None:
+            needs, derive = derived
+            found = self.payloads(messages)
+            if all(role in found for role in needs):
+                self._count("derived")
+                return TextResponse(derive(*(found[role] for role in needs)))
+        schema = self.schemas.get(agent.name)
+        if messages:
+            messages = self.compact(messages)
+            if schema is not None:
+                messages.append(
+                    {"role": "system", "content": schema_instruction(schema)}
+                )
+            params = {**params, "messages": messages}
+        if schema is None:
+            return call_next(params)
+        if accepts_structured_output(agent):
+            params["structured_output"] = {"name": agent.name, "schema": schema}
+        response = call_next(params)
+        text = response_text(agent, response)
+        try:
+            payload = parse_payload(text, schema)
+        except StructuredOutputError:
+            self._count("invalid")
+            return response
+        self._count("structured")
+        rendered = RENDERERS.get(agent.name, compact_json)(payload)
+        self.remember(agent.name, rendered, payload)
+        structured = TextResponse(
+            rendered,
+            model=getattr(response, "model", None),
+            usage=getattr(response, "usage", None),
+        )
+        structured.cost = getattr(response, "cost", 0.0)
+        return structured
+
+
+def accepts_structured_output(agent):
+    """True if every client of the agent is one of this package's ModelClients"""
+    llm_config = agent.llm_config or {}
+    config_list = llm_config.get("config_list") or [llm_config]
+    return all(config.get("model_client_cls") for config in config_list)
+
+
+DEFAULT_STRUCTURED = StructuredOutputPolicy()
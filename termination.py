@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Early termination for the consultation GroupChat
+
+The consultation agent ends its summary with ``CONSULTATION_COMPLETE``; a
+``TerminationPolicy`` stops the chat as soon as that marker appears, keeps
+single-shot roles such as pharmacy from speaking twice, and optionally caps
+the tokens or cost spent on one consultation.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+COMPLETION_MARKER = "CONSULTATION_COMPLETE"
+
+
+@dataclass
+class TerminationPolicy:
+    """When to stop a consultation. Shared by every pipeline built with it."""
+
+    marker: Optional[str] = COMPLETION_MARKER
+    max_turns: dict = field(default_factory=lambda: {"pharmacy": 1})
+    max_tokens: Optional[int] = None
+    max_cost: Optional[float] = None
+
+    def attach(self, speaker_selection_method):
+        """Fresh per-pipeline state enforcing this policy"""
+        return ConsultationTerminator(self, speaker_selection_method)
+
+
+class ConsultationTerminator:
+    """Per-pipeline termination state; reset between consultations"""
+
+    def __init__(self, policy, speaker_selection_method):
+        self.policy = policy
+        self.speaker_selection_method = speaker_selection_method
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.llm_calls = 0
+        self.tokens = 0
+        self.cost = 0.0
+        self.stop_reason = None
+
+    def is_termination_msg(self, message):
+        """Manager hook: True once a message carries the completion marker"""
+        content = message.get("content") if isinstance(message, dict) else message
+        if self.policy.marker and content and self.policy.marker in str(content):
+            self.stop_reason = "marker"
+            return True
+        return False
+
+    def budget_exhausted(self):
+        policy = self.policy
+        if policy.max_tokens is not None and self.tokens >= policy.max_tokens:
+            return True
+        return policy.max_cost is not None and self.cost >= policy.max_cost
+
+    def select_speaker(self, last_speaker, groupchat):
+        """GroupChat speaker selection that returns None to end the chat"""
+        if groupchat.messages and self.is_termination_msg(groupchat.messages[-1]):
+            return None
+        if self.budget_exhausted():
+            self.stop_reason = "budget"
+            return None
+        if self.speaker_selection_method != "round_robin":
+            return self.speaker_selection_method
+
+        turns = {}
+        for message in groupchat.messages:
+            name = message.get("name")
+            turns[name] = turns.get(name, 0) + 1
+        agents = groupchat.agents
+        start = agents.index(last_speaker) + 1 if last_speaker in agents else 0
+        for offset in range(len(agents)):
+            agent = agents[(start + offset) % len(agents)]
+            limit = self.policy.max_turns.get(agent.name)
+            if limit is None or turns.get(agent.name, 0) < limit:
+                return agent
+        self.stop_reason = "turn_limit"
+        return None
+
+    def __call__(self, agent, params, call_next):
+        """LLM middleware that accounts tokens and cost toward the budget"""
+        response = call_next(params)
+        usage = getattr(response, "usage", None)
+        # DAG steps run concurrently on one pipeline
+        with self._lock:
+            self.llm_calls += 1
+            if usage is not None:
+                self.tokens += (usage.prompt_tokens or 0) + (
+                    usage.completion_tokens or 0
+                )
+            self.cost += getattr(response, "cost", 0.0) or 0.0
+        return response
+
+
+DEFAULT_TERMINATION = TerminationPolicy()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-built agent pipeline pool
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent_pool import AgentPool, get_pool
+from healthcare_chatbot import build_llm_config
+
+LLM_CONFIG = build_llm_config("sk-test")
+
+
+def test_checkout_reuses_released_pipeline():
+    """Test that a released pipeline is handed to the next consultation"""
+    pool = AgentPool()
+    with pool.pipeline(LLM_CONFIG) as first:
+        assert first.is_built
+    with pool.pipeline(LLM_CONFIG) as second:
+        assert second is first
+    assert pool.stats() == {"created": 1, "reused": 1, "in_use": 0, "idle": 1}
+
+
+def test_concurrent_checkouts_get_distinct_pipelines():
+    """Test that two live consultations never share a GroupChat"""
+    pool = AgentPool()
+    first = pool.checkout(LLM_CONFIG)
+    second = pool.checkout(LLM_CONFIG)
+    assert first is not second
+    assert first.groupchat is not second.groupchat
+    pool.release(first)
+    pool.release(second)
+    assert pool.stats()["idle"] == 2
+
+
+def test_pool_is_keyed_by_config():
+    """Test that pipelines are only reused for an identical config"""
+    pool = AgentPool()
+    with pool.pipeline(LLM_CONFIG) as default:
+        pass
+    with pool.pipeline(LLM_CONFIG, max_round=3) as short:
+        assert short is not default
+        assert short.groupchat.max_round == 3
+
+
+def test_release_resets_messages():
+    """Test that conversation history is cleared before reuse"""
+    pool = AgentPool()
+    with pool.pipeline(LLM_CONFIG) as pipeline:
+        pipeline.groupchat.messages.append({"role": "user", "content": "hi"})
+        pipeline.agents["diagnosis"]._oai_messages[pipeline.manager].append(
+            {"role": "user", "content": "hi"}
+        )
+    assert pipeline.groupchat.messages == []
+    assert not pipeline.agents["diagnosis"]._oai_messages
+
+
+def test_release_drops_pipelines_beyond_max_idle():
+    """Test that the pool keeps at most max_idle pipelines per config"""
+    pool = AgentPool(max_idle=1)
+    first = pool.checkout(LLM_CONFIG)
+    second = pool.checkout(LLM_CONFIG)
+    pool.release(first)
+    pool.release(second)
+    assert pool.stats()["idle"] == 1
+
+
+def test_warm_prebuilds_pipelines():
+    """Test that warm tops up idle pipelines without rebuilding them"""
+    pool = AgentPool()
+    pool.warm(LLM_CONFIG, count=2)
+    pool.warm(LLM_CONFIG, count=2)
+    assert pool.stats()["created"] == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_get_pool_is_process_wide():
+    """Test that get_pool returns a single shared pool"""
+    assert get_pool() is get_pool()
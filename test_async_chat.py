@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the async consultation path
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_chat import get_llm_executor
+from consultation_engine import ConsultationEngine
+from dag import DEFAULT_DAG
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline
+from instrumentation import Instrumentation
+from streaming import Transcript, on_loop, stream_to, streaming_middleware
+from termination import COMPLETION_MARKER
+
+
+def make_pipeline(**options):
+    return ConsultationPipeline(fake_llm_config(), silent=True, **options)
+
+
+def test_async_consultation_matches_sync():
+    """Test that a_consult runs the same round-robin chat as consult"""
+    sync_pipeline, async_pipeline = make_pipeline(), make_pipeline()
+    sync_pipeline.consult("headache")
+    asyncio.run(async_pipeline.a_consult("headache"))
+
+    names = [m["name"] for m in async_pipeline.groupchat.messages]
+    assert names == [m["name"] for m in sync_pipeline.groupchat.messages]
+    assert names[:4] == ["patient", "diagnosis", "pharmacy", "consultation"]
+    assert COMPLETION_MARKER in async_pipeline.groupchat.messages[-1]["content"]
+
+
+def test_tokens_and_traces_follow_the_consultation():
+    """Test that stream sinks and traces reach the provider-call threads"""
+    instrumentation = Instrumentation()
+    pipeline = make_pipeline(middlewares=[streaming_middleware, instrumentation])
+    transcript = Transcript()
+    loop_threads = set()
+
+    def on_token(agent_name, text):
+        loop_threads.add(threading.get_ident())
+        transcript(agent_name, text)
+
+    async def consult():
+        with instrumentation.trace("headache") as trace:
+            with stream_to(on_loop(on_token)):
+                await pipeline.a_consult("headache")
+        return trace
+
+    trace = asyncio.run(consult())
+
+    assert [agent for agent, _ in transcript.turns] == [
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    ]
+    assert loop_threads == {threading.get_ident()}
+    assert [span["agent"] for span in trace.spans] == [
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    ]
+
+
+def test_async_dag_consultation():
+    """Test that DAG orchestration also runs on the async path"""
+    pipeline = make_pipeline(dag=DEFAULT_DAG)
+    result = asyncio.run(pipeline.a_consult("headache"))
+
+    names = [m["name"] for m in pipeline.groupchat.messages]
+    assert names[0] == "patient"
+    assert {"diagnosis", "pharmacy"} <= set(names)
+    assert result.summary.endswith(COMPLETION_MARKER)
+
+
+def test_many_consultations_share_one_loop():
+    """Test that in-flight consultations do not each hold a thread"""
+    engine = ConsultationEngine(
+        fake_llm_config(ttft=0.05, ttft_jitter=0.0),
+        concurrency=100,
+        silent=True,
+    )
+    peak = []
+
+    async def watch(done):
+        while not done.is_set():
+            peak.append(threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        done = asyncio.Event()
+        watcher = asyncio.ensure_future(watch(done))
+        results = await asyncio.gather(
+            *[engine.a_consult(i, f"case {i}") for i in range(100)]
+        )
+        done.set()
+        await watcher
+        return results
+
+    results = asyncio.run(run())
+
+    assert all(result.ok for result in results), [r.error for r in results]
+    assert len(results) == 100
+    # Bounded by the provider-call executor, not by consultations in flight
+    assert max(peak) <= get_llm_executor()._max_workers + 10 < len(results)
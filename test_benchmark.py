@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline benchmark harness
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import compare, measure_memory, measure_overhead
+
+
+def test_compare_flags_regressions_in_the_right_direction():
+    """Test that throughput drops and latency increases are both caught"""
+    baseline = {"consultations_per_second": 100.0, "overhead_per_round_ms": 2.0}
+    assert compare(baseline, baseline, 0.25) == []
+    slower = {"consultations_per_second": 50.0, "overhead_per_round_ms": 4.0}
+    regressions = compare(slower, baseline, 0.25)
+    assert len(regressions) == 2
+    faster = {"consultations_per_second": 200.0, "overhead_per_round_ms": 1.0}
+    assert compare(faster, baseline, 0.25) == []
+
+
+def test_compare_ignores_noise():
+    """Test that tiny absolute changes are not reported"""
+    baseline = {"pipeline_build_seconds": 0.001}
+    assert compare({"pipeline_build_seconds": 0.002}, baseline, 0.25) == []
+
+
+def test_measurements_run_offline():
+    """Test that the benchmark runs against the fake backend"""
+    assert measure_overhead(consultations=2, repeats=1)["overhead_per_round_ms"] > 0
+    assert measure_memory(consultations=2)["memory_per_consultation_kb"] > 0
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline bulk evaluation runner
+"""
+
+import json
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bulk_eval import (
+    COLUMNS,
+    Checkpoint,
+    EvalCase,
+    outcome_changes,
+    read_columns,
+    read_dataset,
+    run_eval,
+)
+from consultation_store import NO_DOCTOR_VISIT, URGENT
+from fake_llm import fake_llm_config
+
+
+def write_jsonl(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def test_datasets_are_read_from_jsonl_and_csv(tmp_path):
+    """Test that JSONL and CSV datasets yield the same cases"""
+    jsonl = tmp_path / "cases.jsonl"
+    write_jsonl(
+        jsonl,
+        [
+            {"id": "a", "symptoms": "headache", "expected_outcome": NO_DOCTOR_VISIT},
+            {"id": "b", "symptoms": "  "},
+            {"symptoms": "cough"},
+        ],
+    )
+    csv_path = tmp_path / "cases.csv"
+    csv_path.write_text(
+        f"id,symptoms,expected_outcome\na,headache,{NO_DOCTOR_VISIT}\nb,,\n,cough,\n"
+    )
+
+    expected = [
+        EvalCase(0, "a", "headache", NO_DOCTOR_VISIT),
+        EvalCase(2, "2", "cough", ""),
+    ]
+    assert list(read_dataset(str(jsonl))) == expected
+    assert list(read_dataset(str(csv_path))) == expected
+
+
+def test_run_writes_one_column_per_field(tmp_path):
+    """Test that every case runs across worker processes into columnar output"""
+    cases = [
+        EvalCase(i, f"case-{i}", symptoms, NO_DOCTOR_VISIT)
+        for i, symptoms in enumerate(
+            ["headache", "sore throat", "crushing chest pain and shortness of breath"]
+            * 4
+        )
+    ]
+    output = str(tmp_path / "results.npz")
+
+    summary = run_eval(cases, output, fake_llm_config(), workers=2, shard_size=3)
+    columns = read_columns(output)
+
+    assert summary["cases"] == 12
+    assert summary["errors"] == 0
+    assert summary["outcomes"][URGENT] == 4
+    assert set(columns) == {name for name, _ in COLUMNS}
+    assert columns["case_id"] == [case.case_id for case in cases]
+    assert all(columns["turns"][i] > 1 for i in range(12))
+    assert columns["prompt_tokens"][0] > 0
+    assert not os.path.exists(output + ".checkpoint.jsonl")
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path):
+    """Test that checkpointed cases are not run again"""
+    output = str(tmp_path / "results.npz")
+    cases = [EvalCase(i, f"case-{i}", "headache") for i in range(6)]
+    done = run_eval(cases[:4], output + ".first.npz", fake_llm_config(), workers=1)
+    assert done["cases"] == 4
+
+    first = read_columns(output + ".first.npz")
+    rows = [dict(zip(first, values)) for values in zip(*first.values())]
+    rows[0]["summary"] = "from checkpoint"
+    with open(output + ".checkpoint.jsonl", "w") as f:
+        f.writelines(json.dumps(row) + "\n" for row in rows)
+        # Half-written line left by a crash
+        f.write('{"case_id": "case-')
+
+    summary = run_eval(cases, output, fake_llm_config(), workers=1)
+    columns = read_columns(output)
+
+    assert summary["resumed"] == 4
+    assert summary["cases"] == 6
+    assert columns["case_id"] == [case.case_id for case in cases]
+    assert columns["summary"][0] == "from checkpoint"
+
+
+def test_checkpoint_and_baseline_comparison(tmp_path):
+    """Test checkpoint reload and reporting of changed outcomes"""
+    path = str(tmp_path / "run.checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.append([{"case_id": "a", "outcome": URGENT}])
+    checkpoint.close()
+
+    reloaded = Checkpoint(path)
+    assert "a" in reloaded and len(reloaded) == 1
+    reloaded.remove()
+    assert not os.path.exists(path)
+
+    baseline = {"case_id": ["a", "b"], "outcome": [URGENT, NO_DOCTOR_VISIT]}
+    rows = [
+        {"case_id": "a", "outcome": URGENT},
+        {"case_id": "b", "outcome": URGENT},
+        {"case_id": "c", "outcome": URGENT},
+    ]
+    assert outcome_changes(rows, baseline) == [("b", NO_DOCTOR_VISIT, URGENT)]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for conversation-history compaction
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from compaction import CompactionPolicy, summarize
+from healthcare_chatbot import ConsultationPipeline, build_llm_config
+from llm_middleware import TextResponse
+from termination import TerminationPolicy
+
+LLM_CONFIG = build_llm_config("sk-test")
+LONG_REPLY = "Detailed reasoning. " * 100 + "\nKey points: hydrate and rest."
+
+
+class PromptSpy:
+    """Innermost middleware recording the prompt each agent receives"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, agent, params, call_next):
+        self.prompts.append((agent.name, params["messages"]))
+        return TextResponse(f"{agent.name}: {LONG_REPLY}", model="gpt-4o")
+
+
+def run(max_round, **options):
+    spy = PromptSpy()
+    pipeline = ConsultationPipeline(
+        LLM_CONFIG,
+        max_round=max_round,
+        silent=True,
+        middlewares=[spy],
+        termination=TerminationPolicy(max_turns={}),
+        **options,
+    )
+    pipeline.consult("headache")
+    return spy.prompts
+
+
+def prompt_chars(messages):
+    return sum(len(m.get("content") or "") for m in messages)
+
+
+def test_prompt_size_is_bounded_as_rounds_grow():
+    """Test that late prompts stay small while uncompacted ones keep growing"""
+    compacted = run(max_round=13)
+    full = run(max_round=13, compaction=None)
+
+    assert len(compacted) == len(full) == 12
+    assert max(len(messages) for _, messages in compacted) <= 6
+    assert prompt_chars(compacted[-1][1]) < prompt_chars(full[-1][1]) / 2
+    assert prompt_chars(compacted[-1][1]) <= prompt_chars(compacted[5][1])
+
+
+def test_each_role_sees_only_what_it_needs():
+    """Test that diagnosis is not sent pharmacy or consultation replies"""
+    prompts = run(max_round=6)
+    diagnosis_again = [m for name, m in prompts if name == "diagnosis"][1]
+
+    speakers = {m.get("name") for m in diagnosis_again if m["role"] != "system"}
+    assert speakers == {"patient", "diagnosis"}
+    assert diagnosis_again[0]["role"] == "system"
+    assert diagnosis_again[1]["content"].startswith("I am feeling headache")
+
+
+def test_first_round_is_unchanged():
+    """Test that a short conversation is passed through as-is"""
+    compacted = run(max_round=4)
+    full = run(max_round=4, compaction=None)
+
+    assert [m for _, m in compacted] == [m for _, m in full]
+
+
+def test_older_turns_are_summarized():
+    """Test that turns outside the recent window keep only their summary"""
+    policy = CompactionPolicy(keep_recent=1, summary_chars=100)
+    messages = [
+        {"role": "system", "content": "You recommend medications."},
+        {"role": "user", "name": "patient", "content": "I am feeling headache."},
+        {"role": "user", "name": "diagnosis", "content": LONG_REPLY},
+        {"role": "user", "name": "pharmacy", "content": "Take fluids."},
+    ]
+    compacted = policy.compact("consultation", messages)
+
+    assert [m.get("name") for m in compacted] == [
+        None,
+        "patient",
+        "diagnosis",
+        "pharmacy",
+    ]
+    assert compacted[2]["content"] == "Key points: hydrate and rest."
+    assert messages[2]["content"] == LONG_REPLY
+
+
+def test_recent_window_larger_than_history_keeps_everything():
+    """Test that a keep_recent beyond the history neither drops nor repeats turns"""
+    policy = CompactionPolicy(keep_recent=3)
+    messages = [
+        {"role": "system", "content": "You recommend medications."},
+        {"role": "user", "name": "patient", "content": "I am feeling headache."},
+        {"role": "user", "name": "diagnosis", "content": LONG_REPLY},
+        {"role": "user", "name": "pharmacy", "content": "Take fluids."},
+    ]
+
+    assert policy.compact("consultation", messages) == messages
+
+
+def test_summarize_truncates_on_word_boundary():
+    """Test that summaries without a heading are cut to the character limit"""
+    summary = summarize("one two three four five six", 12)
+
+    assert summary == "one two …"
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the concurrent consultation engine
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from autogen import Agent
+
+from agent_pool import AgentPool
+from consultation_engine import ConsultationEngine, read_cases
+from healthcare_chatbot import ConsultationPipeline, build_llm_config
+
+LLM_CONFIG = build_llm_config("sk-test")
+
+
+class CannedPipeline(ConsultationPipeline):
+    """Pipeline whose agents answer from a canned reply instead of the LLM"""
+
+    delay = 0.0
+    live = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def _build(self):
+        super()._build()
+        for agent in self._groupchat.agents:
+            agent.register_reply([Agent, None], self.canned_reply, position=0)
+
+    @classmethod
+    def canned_reply(cls, recipient, messages, sender, config):
+        with cls.lock:
+            cls.live += 1
+            cls.peak = max(cls.peak, cls.live)
+        time.sleep(cls.delay)
+        with cls.lock:
+            cls.live -= 1
+        if "boom" in messages[0]["content"]:
+            raise RuntimeError("provider unavailable")
+        return True, f"{recipient.name} reply to: {messages[0]['content']}"
+
+
+def make_engine(concurrency):
+    pool = AgentPool(max_idle=concurrency, pipeline_factory=CannedPipeline)
+    return ConsultationEngine(
+        LLM_CONFIG, concurrency=concurrency, pool=pool, max_round=4, silent=True
+    )
+
+
+def test_run_batch_returns_results_in_input_order():
+    """Test that every case runs the full round-robin chat in isolation"""
+    CannedPipeline.delay = 0.0
+    results = make_engine(4).run_batch(["headache", "cough", "rash"])
+
+    assert [r.symptoms for r in results] == ["headache", "cough", "rash"]
+    for result in results:
+        assert result.ok
+        speakers = [m["name"] for m in result.messages]
+        assert speakers == ["patient", "diagnosis", "pharmacy", "consultation"]
+        assert result.symptoms in result.messages[0]["content"]
+        assert result.summary.startswith("consultation reply")
+
+
+def test_run_respects_concurrency_limit():
+    """Test that no more than `concurrency` cases are in flight"""
+    CannedPipeline.delay = 0.02
+    CannedPipeline.peak = 0
+    engine = make_engine(3)
+
+    async def collect():
+        return [r async for r in engine.run(f"headache case {i}" for i in range(9))]
+
+    results = asyncio.run(collect())
+    assert len(results) == 9
+    assert 1 < CannedPipeline.peak <= 3
+    assert engine.pool.stats()["created"] <= 3
+
+
+def test_failed_case_does_not_stop_batch():
+    """Test that errors are captured per case"""
+    CannedPipeline.delay = 0.0
+    results = make_engine(2).run_batch(["headache", "cough boom", "cough"])
+    assert [r.ok for r in results] == [True, False, True]
+    assert "provider unavailable" in results[1].error
+
+
+def test_engine_rejects_invalid_concurrency():
+    """Test that a concurrency below one is rejected"""
+    try:
+        ConsultationEngine(LLM_CONFIG, concurrency=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_read_cases_skips_blank_lines():
+    """Test that case files are read one stripped line at a time"""
+    assert list(read_cases(["headache\n", "\n", "  cough  \n"])) == [
+        "headache",
+        "cough",
+    ]
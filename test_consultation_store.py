@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent consultation store
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from consultation_engine import ConsultationEngine
+from consultation_store import (
+    DOCTOR_VISIT_REQUIRED,
+    NO_DOCTOR_VISIT,
+    UNKNOWN,
+    URGENT,
+    ConsultationStore,
+    classify_outcome,
+    symptom_terms,
+)
+from fake_llm import fake_llm_config
+from instrumentation import Instrumentation
+
+
+def chat(symptoms, recommendation):
+    return [
+        {"name": "patient", "content": symptoms},
+        {"name": "diagnosis", "content": "Possible tension headache."},
+        {"name": "consultation", "content": recommendation},
+    ]
+
+
+def test_classifies_outcomes_and_symptom_terms():
+    """Test that recommendations map to outcomes and symptoms to index terms"""
+    assert classify_outcome("A doctor's visit is required. See a doctor.") == (
+        DOCTOR_VISIT_REQUIRED
+    )
+    assert classify_outcome("Go to the emergency room immediately.") == URGENT
+    assert classify_outcome("A doctor's visit is not necessary; rest.") == (
+        NO_DOCTOR_VISIT
+    )
+    assert classify_outcome("") == UNKNOWN
+    assert symptom_terms("I have a Headache and a headache, with fever") == [
+        "fever",
+        "headache",
+    ]
+
+
+def test_safety_net_advice_is_not_urgent():
+    """Test that conditional escalation advice does not override the decision"""
+    routine = (
+        "A doctor's visit is not required. If symptoms worsen, seek emergency care.",
+        "No need to see a doctor now; if it persists, consult a healthcare "
+        "professional immediately.",
+        # The Streamlit demo transcript
+        "Monitor your symptoms for 2-3 days. If they worsen or persist, or if you "
+        "develop additional symptoms like fever, nausea, or vision changes, please "
+        "consult a healthcare professional immediately.",
+    )
+    for text in routine:
+        assert classify_outcome(text) == NO_DOCTOR_VISIT, text
+    visit = "See a doctor today. Seek emergency care if you faint."
+    assert classify_outcome(visit) == DOCTOR_VISIT_REQUIRED
+    assert classify_outcome("Call 911 now; this may be a stroke.") == URGENT
+
+
+def test_ruling_out_something_else_keeps_the_visit():
+    """Test that a negation about treatment or the ER does not cancel a visit"""
+    for text in (
+        "A doctor visit is required. Antibiotics are not necessary.",
+        "You should see a doctor within 2 days; an ER trip is not needed.",
+    ):
+        assert classify_outcome(text) == DOCTOR_VISIT_REQUIRED, text
+    assert classify_outcome("This can be managed at home.") == NO_DOCTOR_VISIT
+
+
+def test_records_are_written_in_batches(tmp_path):
+    """Test that queued consultations are written together and read back"""
+    with ConsultationStore(str(tmp_path / "store.db"), batch_size=50) as store:
+        ids = [
+            store.record(f"headache case {i}", chat("headache", "No need to visit."))
+            for i in range(20)
+        ]
+        store.flush()
+
+        assert len(store) == 20
+        assert store.written == 20
+        stored = store.get(ids[3])
+        assert stored["symptoms"] == "headache case 3"
+        assert stored["outcome"] == NO_DOCTOR_VISIT
+        assert [m["name"] for m in stored["messages"]] == [
+            "patient",
+            "diagnosis",
+            "consultation",
+        ]
+        assert store.get("missing") is None
+
+
+def test_bad_record_does_not_stop_later_writes(tmp_path):
+    """Test that a record SQLite cannot bind is dropped alone and writing goes on"""
+    with ConsultationStore(str(tmp_path / "store.db"), flush_interval=0.01) as store:
+        good = store.record("headache", chat("headache", "No need to visit."))
+        bad = store.record("cough", [{"name": "patient", "content": {"text": 1}}])
+        store.flush()
+        later = store.record("fever", chat("fever", "See a doctor."))
+        store.flush()
+
+        assert store.failed == 1
+        assert store.get(bad) is None
+        assert store.get(good)["outcome"] == NO_DOCTOR_VISIT
+        assert store.get(later)["outcome"] == DOCTOR_VISIT_REQUIRED
+        assert store.written == 2
+
+
+def test_search_by_terms_outcome_and_time(tmp_path):
+    """Test that lookups combine symptom terms, outcome and time range"""
+    with ConsultationStore(str(tmp_path / "store.db")) as store:
+        store.record("headache and fever", chat("", "See a doctor."), created=100)
+        store.record("headache only", chat("", "Rest at home, no need."), created=200)
+        store.record("chest pain", chat("", "Call 911 right away."), created=300)
+        store.flush()
+
+        assert [r["symptoms"] for r in store.search("headache")] == [
+            "headache only",
+            "headache and fever",
+        ]
+        assert [r["symptoms"] for r in store.search("fever headache")] == [
+            "headache and fever"
+        ]
+        assert [r["symptoms"] for r in store.search(outcome=DOCTOR_VISIT_REQUIRED)] == [
+            "headache and fever"
+        ]
+        assert [r["symptoms"] for r in store.search(since=150, until=300)] == [
+            "headache only"
+        ]
+        assert store.outcome_counts() == {
+            DOCTOR_VISIT_REQUIRED: 1,
+            NO_DOCTOR_VISIT: 1,
+            URGENT: 1,
+        }
+
+
+def test_store_survives_reopen(tmp_path):
+    """Test that consultations are durable across store instances"""
+    path = str(tmp_path / "store.db")
+    with ConsultationStore(path) as store:
+        consultation_id = store.record("cough", chat("cough", "See a doctor."))
+
+    with ConsultationStore(path) as store:
+        assert store.get(consultation_id)["symptoms"] == "cough"
+
+
+def test_engine_records_each_consultation(tmp_path):
+    """Test that the engine records results with their agent timings"""
+    with ConsultationStore(str(tmp_path / "store.db")) as store:
+        engine = ConsultationEngine(
+            fake_llm_config(),
+            concurrency=2,
+            instrumentation=Instrumentation(),
+            store=store,
+            silent=True,
+        )
+        results = engine.run_batch(["headache", "sore throat", "back pain"])
+        store.flush()
+
+        assert len(store) == 3
+        stored = store.get(results[0].trace["consultation_id"])
+        assert stored["symptoms"] == "headache"
+        assert stored["messages"]
+        assert {span["agent"] for span in stored["spans"]} >= {"diagnosis"}
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Tests for per-consultation, per-agent token and cost accounting
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from consultation_engine import ConsultationEngine
+from consultation_store import ConsultationStore
+from cost_ledger import BudgetExceeded, CostLedger, TenantBudget
+from fake_llm import fake_llm_config
+from instrumentation import Instrumentation
+from llm_middleware import TextResponse
+
+
+def agent(name="diagnosis"):
+    return SimpleNamespace(name=name, llm_config={"model": "gpt-4o"})
+
+
+def reply(prompt, completion, cached=0, model="gpt-4o"):
+    usage = SimpleNamespace(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+    return TextResponse("ok", model=model, usage=usage)
+
+
+def params(text="x" * 400):
+    return {"messages": [{"role": "user", "content": text}], "max_tokens": 100}
+
+
+def test_calls_are_priced_by_model_with_cached_prompt_discount():
+    """Test longest-prefix pricing, the cached discount and the client fallback"""
+    ledger = CostLedger(prices={"local-model": (0.0, 0.0)})
+
+    assert ledger.price("gpt-4o-mini-2024-07-18") == (0.00015, 0.0006)
+    assert ledger.price("gpt-4o-2024-08-06") == (0.0025, 0.01)
+    assert ledger.call_cost("gpt-4o", 1000, 0, 1000) == pytest.approx(0.0125)
+    assert ledger.call_cost("gpt-4o", 1000, 1000, 0) == pytest.approx(0.00125)
+    assert ledger.call_cost("local-model", 1000, 0, 1000) == 0.0
+    unpriced = SimpleNamespace(cost=0.42)
+    assert ledger.call_cost("other", 10, 0, 10, unpriced) == 0.42
+
+
+def test_consultations_are_accounted_per_agent_and_model():
+    """Test that every agent's calls land in the result and the process totals"""
+    instrumentation = Instrumentation()
+    ledger = CostLedger()
+    engine = ConsultationEngine(
+        fake_llm_config(),
+        concurrency=2,
+        instrumentation=instrumentation,
+        ledger=ledger,
+        silent=True,
+    )
+    results = engine.run_batch(["headache", "sore throat"])
+
+    for result in results:
+        assert result.ok
+        agents = result.cost["agents"]
+        assert set(agents) == {"diagnosis", "pharmacy", "consultation"}
+        assert result.cost["cost"] > 0
+        traced = result.trace["agents"]
+        for name, totals in agents.items():
+            assert totals["prompt_tokens"] == traced[name]["prompt_tokens"]
+            assert totals["completion_tokens"] == traced[name]["completion_tokens"]
+    by_agent = ledger.totals(by=("agent",))
+    assert by_agent[("diagnosis",)]["calls"] == 2
+    assert ledger.totals(by=("tenant", "model")).keys() == {("default", "gpt-4o")}
+    assert sum(t["cost"] for t in by_agent.values()) == pytest.approx(
+        sum(result.cost["cost"] for result in results)
+    )
+    assert 'tenant="default"' in ledger.render_prometheus()
+
+
+def test_budget_stops_calls_before_an_overrun():
+    """Test that a call the budget cannot cover never reaches the provider"""
+    now = [0.0]
+    ledger = CostLedger(
+        budgets={"acme": TenantBudget(max_tokens=600, period=60)},
+        clock=lambda: now[0],
+    )
+    calls = []
+
+    def provider(params):
+        calls.append(params)
+        return reply(100, 100)
+
+    with ledger.consultation("acme") as cost:
+        # Each estimate is 100 prompt + 100 completion tokens
+        ledger(agent(), params(), provider)
+        ledger(agent("pharmacy"), params(), provider)
+        with pytest.raises(BudgetExceeded):
+            # 400 spent; 500 + 100 more would overrun
+            ledger(agent("consultation"), params("x" * 2000), provider)
+
+    assert len(calls) == 2
+    assert cost.tokens == 400
+    assert ledger.rejected == 1
+    assert ledger.allows("acme") and ledger.allows("other")
+    with ledger.consultation("acme"):
+        ledger(agent(), params(), provider)
+    assert not ledger.allows("acme")
+    with pytest.raises(BudgetExceeded):
+        ledger.check("acme")
+
+    # A new period starts with a fresh budget
+    now[0] = 61.0
+    assert ledger.allows("acme")
+    assert ledger.spend("acme")["tokens"] == 0
+
+
+def test_calls_spanning_a_period_boundary_release_their_reservation():
+    """Test that a call reserved in one period and settled in the next leaks nothing"""
+    now = [50.0]
+    ledger = CostLedger(
+        budgets={"acme": TenantBudget(max_tokens=1000, period=60)},
+        clock=lambda: now[0],
+    )
+
+    def slow_provider(params):
+        # The period rolls over while the call is in flight
+        now[0] += 20.0
+        return reply(100, 100)
+
+    with ledger.consultation("acme"):
+        ledger(agent(), params(), slow_provider)
+        ledger(agent("pharmacy"), params(), slow_provider)
+        spend = ledger._spend["acme"]
+        assert (spend.reserved_tokens, spend.reserved_cost) == (0, 0.0)
+        # 400 tokens spent this period; a leaked reservation would block the last
+        for name in ("consultation", "diagnosis", "pharmacy"):
+            ledger(agent(name), params(), lambda params: reply(100, 100))
+
+    assert ledger.spend("acme")["tokens"] == 1000
+
+
+def test_engine_refuses_consultations_over_budget():
+    """Test that an exhausted tenant gets an error result without any LLM call"""
+    ledger = CostLedger(budgets={"acme": TenantBudget(max_cost=0.0)})
+    instrumentation = Instrumentation()
+    engine = ConsultationEngine(
+        fake_llm_config(), instrumentation=instrumentation, ledger=ledger, silent=True
+    )
+
+    refused = engine.consult(0, "headache", tenant="acme")
+    allowed = engine.consult(1, "headache")
+
+    assert refused.error.startswith("BudgetExceeded")
+    assert allowed.ok
+    calls = instrumentation.counter("llm_calls_total", agent="diagnosis", cache="miss")
+    assert calls == 1
+
+
+def test_rows_are_flushed_in_batches_and_resume_spend(tmp_path):
+    """Test batched writes to the store and reloading this period's spend"""
+    store = ConsultationStore(str(tmp_path / "store.db"))
+    ledger = CostLedger(sink=store.record_costs, batch_size=3, flush_interval=3600)
+
+    for name in ("diagnosis", "pharmacy"):
+        with ledger.consultation("acme", consultation_id=f"c-{name}"):
+            ledger(agent(name), params(), lambda params: reply(1000, 100))
+    store.flush()
+    assert store.tenant_spend("acme")["tokens"] == 0
+
+    with ledger.consultation("acme", consultation_id="c-cached"):
+        ledger(
+            agent("consultation"),
+            params(),
+            lambda params: TextResponse("ok", cached=True),
+        )
+        ledger(agent("consultation"), params(), lambda params: reply(100, 10))
+    store.flush()
+
+    by_agent = {row["agent"]: row for row in store.cost_by_agent(tenant="acme")}
+    assert set(by_agent) == {"diagnosis", "pharmacy", "consultation"}
+    assert by_agent["consultation"]["calls"] == 2
+    assert by_agent["consultation"]["prompt_tokens"] == 100
+    assert store.tenant_spend("acme")["tokens"] == 2310
+
+    resumed = CostLedger(budgets={"acme": TenantBudget(max_tokens=2000)})
+    resumed.load_store(store)
+    assert resumed.spend("acme")["tokens"] == 2310
+    assert not resumed.allows("acme")
+    store.close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for DAG orchestration of independent agents
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dag import DEFAULT_DAG, DagStep, validate
+from healthcare_chatbot import ConsultationPipeline, build_llm_config
+from llm_middleware import TextResponse
+from termination import COMPLETION_MARKER, TerminationPolicy
+
+LLM_CONFIG = build_llm_config("sk-test")
+
+
+class SlowLLM:
+    """Innermost middleware that sleeps and tracks overlapping calls"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.prompts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, agent, params, call_next):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.prompts.setdefault(agent.name, []).append(params["messages"])
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50)
+        return TextResponse(f"{agent.name} says", model="gpt-4o", usage=usage)
+
+
+def make_pipeline(llm, **options):
+    return ConsultationPipeline(
+        LLM_CONFIG, silent=True, middlewares=[llm], dag=DEFAULT_DAG, **options
+    )
+
+
+def test_independent_steps_run_concurrently():
+    """Test that latency follows the critical path, not the sum of agents"""
+    llm = SlowLLM(delay=0.2)
+    pipeline = make_pipeline(llm)
+    pipeline.build()
+    started = time.perf_counter()
+    result = pipeline.consult("headache")
+    elapsed = time.perf_counter() - started
+
+    assert llm.peak == 2
+    assert elapsed < 0.55
+    assert pipeline.terminator.stop_reason == "dag"
+    assert result.summary.endswith(COMPLETION_MARKER)
+
+
+def test_join_merges_outputs_into_groupchat_messages():
+    """Test that the join step's summary carries every specialist's output"""
+    pipeline = make_pipeline(SlowLLM(delay=0))
+    pipeline.consult("headache")
+    messages = pipeline.groupchat.messages
+
+    assert [m["name"] for m in messages] == [
+        "patient",
+        "diagnosis",
+        "consultation",
+        "pharmacy",
+        "consultation",
+    ]
+    summary = messages[-1]["content"]
+    assert "Possible diagnosis:\ndiagnosis says" in summary
+    assert "Recommended medications:\npharmacy says" in summary
+    assert "Urgency and next steps:\nconsultation says" in summary
+
+
+def test_repeated_consultations_do_not_accumulate_messages():
+    """Test that each DAG run replaces the previous transcript, sync and async"""
+    pipeline = make_pipeline(SlowLLM(delay=0))
+    pipeline.consult("headache")
+    first = list(pipeline.groupchat.messages)
+    pipeline.consult("cough")
+    assert len(pipeline.groupchat.messages) == len(first)
+    asyncio.run(pipeline.a_consult("rash"))
+    assert len(pipeline.groupchat.messages) == len(first)
+    assert "rash" in pipeline.groupchat.messages[0]["content"]
+
+
+def test_steps_receive_only_their_dependencies():
+    """Test that pharmacy sees the diagnosis and urgency screening sees symptoms"""
+    llm = SlowLLM(delay=0)
+    make_pipeline(llm).consult("headache")
+
+    pharmacy = llm.prompts["pharmacy"][0]
+    assert [m.get("name") for m in pharmacy[1:]] == ["patient", "diagnosis"]
+    urgency = llm.prompts["consultation"][0]
+    assert [m.get("name") for m in urgency[1:]] == ["patient", "manager"]
+
+
+def test_budget_skips_remaining_steps():
+    """Test that an exhausted budget stops steps that have not started"""
+    llm = SlowLLM(delay=0)
+    pipeline = make_pipeline(llm, termination=TerminationPolicy(max_tokens=100))
+    pipeline.consult("headache")
+
+    assert "pharmacy" not in llm.prompts
+    assert pipeline.terminator.stop_reason == "budget"
+
+
+def test_validate_rejects_cycles_and_unknown_steps():
+    """Test that malformed DAGs are rejected up front"""
+    with pytest.raises(ValueError, match="cycle"):
+        validate((DagStep("a", needs=("b",)), DagStep("b", needs=("a",))))
+    with pytest.raises(ValueError, match="unknown"):
+        validate((DagStep("a", needs=("missing",)),))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline LLM stand-ins
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import FakeOpenAIServer, LatencyModel, fake_llm_config, generate_reply
+from healthcare_chatbot import ConsultationPipeline
+from termination import COMPLETION_MARKER
+
+
+def test_model_client_runs_real_groupchat_offline():
+    """Test the full round-robin flow with FakeLLMClient"""
+    pipeline = ConsultationPipeline(fake_llm_config(), silent=True)
+    pipeline.consult("headache and fatigue")
+
+    messages = pipeline.groupchat.messages
+    assert [m["name"] for m in messages] == [
+        "patient",
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    ]
+    assert messages[1]["content"].startswith("Possible diagnosis")
+    assert messages[2]["content"].startswith("Recommended medications")
+    assert messages[3]["content"].endswith(COMPLETION_MARKER)
+    usage = pipeline.agents["diagnosis"].client.actual_usage_summary
+    assert usage["gpt-4o"]["completion_tokens"] >= 20
+
+
+def test_latency_model_is_deterministic():
+    """Test that the same seed yields the same latency samples"""
+    first = LatencyModel(ttft=0.1, ttft_jitter=0.05, seed=7)
+    second = LatencyModel(ttft=0.1, ttft_jitter=0.05, seed=7)
+    assert [first.sample() for _ in range(5)] == [second.sample() for _ in range(5)]
+    assert LatencyModel(tokens_per_second=50).sample()[1] == 0.02
+
+
+def test_generate_reply_pads_to_length_and_keeps_marker_last():
+    """Test reply length and marker placement"""
+    messages = [{"role": "system", "content": "Is a doctor's visit required?"}]
+    words = generate_reply(messages, 60)
+    assert len(words) >= 60
+    assert words[-1] == COMPLETION_MARKER
+
+
+def test_openai_compatible_server():
+    """Test the HTTP server with autogen and with a streaming SDK call"""
+    from openai import OpenAI
+
+    with FakeOpenAIServer() as server:
+        pipeline = ConsultationPipeline(server.llm_config(), silent=True)
+        pipeline.consult("cough")
+        assert len(pipeline.groupchat.messages) == 4
+        assert server.requests == 3
+
+        client = OpenAI(api_key="sk-fake", base_url=server.url)
+        stream = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "system", "content": "You recommend medications."}],
+            stream=True,
+        )
+        text = "".join(chunk.choices[0].delta.content or "" for chunk in stream)
+        assert text.startswith("Recommended medications")
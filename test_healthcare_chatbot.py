@@ -69,6 +69,43 @@ def test_agent_creation_with_api_key(mock_manager, mock_groupchat, mock_agent, m
     assert manager is not None
     assert mock_agent.call_count == 4  # 4 agents should be created
 
+def test_import_is_side_effect_free():
+    """Test that importing the module does not bootstrap autogen or openai"""
+    import subprocess
+
+    code = (
+        "import sys, healthcare_chatbot; "
+        "assert 'autogen' not in sys.modules; "
+        "assert 'openai' not in sys.modules"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == ""
+
+def test_pipeline_is_lazy_and_cached_per_config():
+    """Test that pipelines build on first use and are reused per config"""
+    from healthcare_chatbot import get_pipeline, clear_pipelines
+
+    clear_pipelines()
+    pipeline = get_pipeline(api_key="sk-test")
+    assert not pipeline.is_built
+    assert get_pipeline(api_key="sk-test") is pipeline
+    assert get_pipeline(api_key="sk-test", max_round=3) is not pipeline
+
+    agents = pipeline.agents
+    assert pipeline.is_built
+    assert set(agents) == {"patient", "diagnosis", "pharmacy", "consultation"}
+    assert pipeline.groupchat.agents == [
+        agents["diagnosis"], agents["pharmacy"], agents["consultation"]
+    ]
+    assert pipeline.agents is agents
+    clear_pipelines()
+
 def test_healthcare_chatbot_script_exists():
     """Test that the main healthcare chatbot script exists and is executable"""
     script_path = os.path.join(os.path.dirname(__file__), 'healthcare_chatbot.py')
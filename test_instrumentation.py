@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for per-agent latency and token instrumentation
+"""
+
+import json
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from consultation_engine import ConsultationEngine
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline
+from instrumentation import Histogram, Instrumentation
+from response_cache import ResponseCache
+from streaming import Transcript, stream_to, streaming_middleware
+
+
+def make_pipeline(*middlewares, **latency):
+    return ConsultationPipeline(
+        fake_llm_config(**latency), max_round=4, silent=True, middlewares=middlewares
+    )
+
+
+def test_trace_records_one_span_per_agent_turn():
+    """Test that each agent reply becomes a span with tokens and timings"""
+    instrumentation = Instrumentation()
+    with instrumentation.trace("headache") as trace:
+        make_pipeline(instrumentation).consult("headache")
+
+    assert [span["agent"] for span in trace.spans] == [
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    ]
+    assert [span["round"] for span in trace.spans] == [1, 2, 3]
+    for span in trace.spans:
+        assert span["prompt_tokens"] > 0
+        assert span["completion_tokens"] >= 20
+        assert 0 <= span["ttft_seconds"] <= span["wall_seconds"]
+        assert span["cache_hit"] is False
+        assert span["error"] is None
+    assert trace.by_agent()["pharmacy"]["turns"] == 1
+
+
+def test_cache_hits_are_flagged():
+    """Test that replies served by ResponseCache are marked as cache hits"""
+    instrumentation = Instrumentation()
+    pipeline = make_pipeline(instrumentation, ResponseCache())
+    pipeline.consult("headache")
+    pipeline.reset()
+    with instrumentation.trace("headache") as trace:
+        pipeline.consult("headache")
+
+    assert all(span["cache_hit"] for span in trace.spans)
+    assert instrumentation.counter("llm_calls_total", agent="diagnosis", cache="hit")
+    assert instrumentation.counter("llm_calls_total", agent="diagnosis", cache="miss")
+
+
+def test_time_to_first_token_with_streaming():
+    """Test that TTFT is measured from the first streamed chunk"""
+    instrumentation = Instrumentation()
+    pipeline = make_pipeline(
+        streaming_middleware, instrumentation, ttft=0.05, tokens_per_second=200
+    )
+    with stream_to(Transcript(lambda *args: None)):
+        with instrumentation.trace("headache") as trace:
+            pipeline.consult("headache")
+
+    for span in trace.spans:
+        assert 0.05 <= span["ttft_seconds"] < span["wall_seconds"]
+
+
+def test_prometheus_exposition():
+    """Test the Prometheus text format of the aggregated metrics"""
+    instrumentation = Instrumentation()
+    with instrumentation.trace("headache"):
+        make_pipeline(instrumentation).consult("headache")
+    text = instrumentation.render_prometheus()
+
+    assert "# TYPE consultation_agent_reply_seconds histogram" in text
+    assert 'consultation_agent_reply_seconds_count{agent="pharmacy"} 1' in text
+    assert (
+        'consultation_agent_ttft_seconds_bucket{agent="diagnosis",le="+Inf"} 1' in text
+    )
+    assert "consultation_consultations_total 1" in text
+    assert "# TYPE consultation_llm_tokens_total counter" in text
+    assert (
+        'consultation_llm_tokens_total{agent="consultation",kind="completion"}' in text
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test that histogram buckets count every observation at or below the bound"""
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    lines = list(histogram.lines("latency", {}))
+
+    assert lines[:3] == [
+        'latency_bucket{le="0.1"} 2',
+        'latency_bucket{le="1.0"} 3',
+        'latency_bucket{le="+Inf"} 4',
+    ]
+    assert lines[-1] == "latency_count 4"
+
+
+def test_engine_attaches_json_trace_to_results():
+    """Test that batch results carry a JSON-serializable trace"""
+    engine = ConsultationEngine(
+        fake_llm_config(), concurrency=2, instrumentation=Instrumentation(), silent=True
+    )
+    results = engine.run_batch(["headache", "fever"])
+
+    for result in results:
+        trace = json.loads(json.dumps(result.trace))
+        assert trace["symptoms"] == result.symptoms
+        assert len(trace["spans"]) == 3
+        assert set(trace["agents"]) == {"diagnosis", "pharmacy", "consultation"}
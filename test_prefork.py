@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-fork warm worker mode
+"""
+
+import asyncio
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import fake_llm_config
+from prefork import PreforkServer, StartupTimer, warm_start
+
+
+def test_startup_timer_reports_each_phase():
+    """Test that phases are timed separately and accumulate when repeated"""
+    timer = StartupTimer()
+    with timer.phase("imports"):
+        time.sleep(0.01)
+    with timer.phase("imports"):
+        time.sleep(0.01)
+    with timer.phase("build"):
+        pass
+    report = timer.report()
+
+    assert list(report) == ["imports_seconds", "build_seconds", "total_seconds"]
+    assert report["imports_seconds"] >= 0.02
+    assert report["total_seconds"] >= report["imports_seconds"]
+
+
+def test_forked_workers_serve_from_the_warm_pool():
+    """Test that workers reuse the parent's pipelines and report fork-to-ready time"""
+    app = warm_start(fake_llm_config(), warm=2)
+    try:
+        assert app.engine.pool.stats()["idle"] == 2
+        assert "pipelines_seconds" in app.startup["parent"]
+        read_end, write_end = os.pipe()
+
+        def serve(app, sock):
+            os.close(read_end)
+            result = asyncio.run(app.engine.a_consult(0, "headache"))
+            report = {
+                "pid": os.getpid(),
+                "ok": result.ok,
+                "pool": app.engine.pool.stats(),
+                "startup": app.startup,
+            }
+            os.write(write_end, (json.dumps(report) + "\n").encode())
+
+        with socket.socket() as sock:
+            server = PreforkServer(app, sock, workers=2, serve=serve)
+            server.start()
+            os.close(write_end)
+            output = b""
+            deadline = time.monotonic() + 60
+            while output.count(b"\n") < 2 and time.monotonic() < deadline:
+                if select.select([read_end], [], [], 1)[0]:
+                    chunk = os.read(read_end, 65536)
+                    if not chunk:
+                        break
+                    output += chunk
+            os.close(read_end)
+            for pid in list(server.children):
+                if output.count(b"\n") < 2:
+                    os.kill(pid, signal.SIGKILL)
+                _, status = os.waitpid(pid, 0)
+                assert os.waitstatus_to_exitcode(status) == 0
+        reports = [json.loads(line) for line in output.decode().splitlines()]
+    finally:
+        gc.unfreeze()
+
+    assert len(reports) == 2
+    assert {report["pid"] for report in reports} == set(server.children)
+    for report in reports:
+        assert report["ok"]
+        # Nothing was built after the fork: the pipeline came from the parent
+        assert report["pool"]["created"] == 2
+        assert report["pool"]["reused"] == 1
+        assert report["startup"]["worker_pid"] == report["pid"]
+        assert report["startup"]["fork_to_ready_seconds"] < 1
+        assert report["startup"]["parent"] == app.startup["parent"]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the prompt registry and prompt-cache accounting
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dataclasses import replace
+
+from fake_llm import PromptCache, count_tokens, fake_llm_config
+from healthcare_chatbot import AGENT_ROLES, ConsultationPipeline
+from instrumentation import Instrumentation
+from prompts import DEFAULT_PROMPTS, ROLE_HEADING, SHARED_PREFIX, role_section
+
+
+def test_every_role_starts_with_the_shared_prefix():
+    """Test that all system messages share one byte-identical prefix"""
+    messages = DEFAULT_PROMPTS.system_messages()
+
+    assert set(messages) == set(AGENT_ROLES)
+    for role, message in messages.items():
+        assert message.startswith(SHARED_PREFIX)
+        assert role_section(message) == f"{role}\n\n{DEFAULT_PROMPTS.roles[role]}"
+        assert ROLE_HEADING not in SHARED_PREFIX
+    # Long enough for providers that only cache prefixes of 1024+ tokens
+    assert count_tokens(SHARED_PREFIX) >= 1024
+
+
+def test_fingerprint_tracks_prompt_changes():
+    """Test that the fingerprint is stable and changes when a prompt changes"""
+    assert DEFAULT_PROMPTS.fingerprint == replace(DEFAULT_PROMPTS).fingerprint
+
+    edited = replace(DEFAULT_PROMPTS, shared_prefix=SHARED_PREFIX + " ")
+    assert edited.fingerprint != DEFAULT_PROMPTS.fingerprint
+    assert edited.system_message("pharmacy") != DEFAULT_PROMPTS.system_message(
+        "pharmacy"
+    )
+
+
+def test_prompt_cache_matches_prefixes_across_roles():
+    """Test that a shared prefix is served from cache for a different role"""
+    cache = PromptCache()
+    patient = {"role": "user", "content": "I have a headache"}
+
+    def prompt(role):
+        return [
+            {"role": "system", "content": DEFAULT_PROMPTS.system_message(role)},
+            patient,
+        ]
+
+    assert cache.lookup(prompt("diagnosis")) == 0
+    cached = cache.lookup(prompt("pharmacy"))
+    assert 1024 <= cached <= count_tokens(SHARED_PREFIX)
+    assert cached % 128 == 0
+
+
+def test_consultation_reports_cached_prompt_tokens():
+    """Test that traces and metrics report the cached share of prompt tokens"""
+    instrumentation = Instrumentation()
+    pipeline = ConsultationPipeline(
+        fake_llm_config(), silent=True, middlewares=[instrumentation]
+    )
+    with instrumentation.trace("headache") as trace:
+        pipeline.consult("headache")
+    with instrumentation.trace("headache") as repeat:
+        pipeline.consult("headache")
+
+    assert repeat.prompt_cache_ratio() > 0.5
+    for totals in repeat.by_agent().values():
+        assert 0 < totals["cached_prompt_tokens"] <= totals["prompt_tokens"]
+    assert (
+        instrumentation.counter(
+            "llm_tokens_total", agent="pharmacy", kind="cached_prompt"
+        )
+        > 0
+    )
+    assert (
+        trace.spans[0]["cached_prompt_tokens"]
+        <= repeat.spans[0]["cached_prompt_tokens"]
+    )
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Tests for the rate-limit aware scheduler
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from consultation_engine import ConsultationEngine
+from fake_llm import fake_llm_config, rate_limit_error
+from instrumentation import Instrumentation
+from llm_middleware import TextResponse
+from rate_limit import ModelBudget, RateLimitScheduler, TokenBucket
+
+AGENT = SimpleNamespace(
+    name="diagnosis",
+    llm_config={
+        "config_list": [
+            {"model": "gpt-4o", "requests_per_minute": 600, "tokens_per_minute": 6000}
+        ]
+    },
+)
+PARAMS = {"messages": [{"role": "user", "content": "headache"}]}
+
+
+def make_scheduler(**options):
+    sleeps = []
+    scheduler = RateLimitScheduler(seed=0, sleep=sleeps.append, **options)
+    return scheduler, sleeps
+
+
+def test_retries_rate_limited_turn_with_retry_after():
+    """Test that a 429 is retried at the turn level after Retry-After"""
+    scheduler, sleeps = make_scheduler()
+    attempts = []
+
+    def call_next(params):
+        attempts.append(params)
+        if len(attempts) < 3:
+            raise rate_limit_error(retry_after_ms=250)
+        return TextResponse("ok")
+
+    response = scheduler(AGENT, PARAMS, call_next)
+
+    assert response.text == "ok"
+    assert response.retries == 2
+    assert len(attempts) == 3
+    assert 0.25 in sleeps
+    assert scheduler.stats()["retries"] == 2
+
+
+def test_gives_up_after_max_retries_and_skips_other_errors():
+    """Test that retries are bounded and non-retryable errors surface at once"""
+    scheduler, _ = make_scheduler(max_retries=2)
+    calls = []
+
+    def always_limited(params):
+        calls.append(params)
+        raise rate_limit_error()
+
+    with pytest.raises(Exception, match="Rate limit"):
+        scheduler(AGENT, PARAMS, always_limited)
+    assert len(calls) == 3
+
+    def broken(params):
+        calls.append(params)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler(AGENT, PARAMS, broken)
+    assert len(calls) == 4
+
+
+def test_backoff_is_jittered_and_capped():
+    """Test that backoff without Retry-After stays within the exponential cap"""
+    scheduler, _ = make_scheduler(base_delay=1.0, max_delay=5.0)
+    delays = [scheduler.backoff(attempt, ValueError()) for attempt in range(6)]
+
+    assert all(
+        0 <= delay <= min(5.0, 2**attempt) for attempt, delay in enumerate(delays)
+    )
+    assert len(set(delays)) == len(delays)
+
+
+def test_budgets_pace_requests():
+    """Test that requests beyond the per-minute budget wait their turn"""
+    budget = ModelBudget(requests_per_minute=60)
+    waits = [budget.acquire(0) for _ in range(62)]
+
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == pytest.approx(1.0, abs=0.05)
+    assert waits[61] == pytest.approx(2.0, abs=0.05)
+
+
+def test_token_reservation_is_settled_with_real_usage():
+    """Test that unused estimated tokens are returned to the budget"""
+    bucket = TokenBucket(1000)
+    bucket.reserve(800, time.monotonic())
+    bucket.refund(800 - 100)
+
+    assert bucket.available == pytest.approx(900, abs=1)
+
+
+def test_failed_attempts_give_their_tokens_back():
+    """Test that retries leave the token bucket as if only the answer was sent"""
+    scheduler, _ = make_scheduler(max_retries=2)
+    tokens = scheduler.budget(AGENT, "gpt-4o").tokens
+
+    def always_limited(params):
+        raise rate_limit_error()
+
+    with pytest.raises(Exception, match="Rate limit"):
+        scheduler(AGENT, PARAMS, always_limited)
+    assert tokens.available == pytest.approx(6000, abs=1)
+
+    attempts = []
+
+    def limited_then_ok(params):
+        attempts.append(params)
+        if len(attempts) < 3:
+            raise rate_limit_error()
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+        return TextResponse("ok", usage=usage)
+
+    scheduler(AGENT, PARAMS, limited_then_ok)
+    assert tokens.available == pytest.approx(6000 - 15, abs=1)
+
+
+def test_identical_in_flight_requests_are_coalesced():
+    """Test that concurrent identical requests share one provider call"""
+    scheduler, _ = make_scheduler()
+    calls = []
+    release = threading.Event()
+
+    def call_next(params):
+        calls.append(params)
+        release.wait(1)
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+        return TextResponse("shared", model="gpt-4o", usage=usage)
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(scheduler(AGENT, PARAMS, call_next))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [r.text for r in results] == ["shared"] * 5
+    assert scheduler.stats()["coalesced"] == 4
+    # Downstream accounting sees the provider call's tokens once
+    followers = [r for r in results if getattr(r, "coalesced", False)]
+    assert len(followers) == 4
+    assert all(r.usage is None and r.cost == 0.0 for r in followers)
+    assert sum(r.usage.completion_tokens for r in results if r.usage) == 20
+
+
+def test_batch_survives_rate_limits():
+    """Test that a batch completes without failures when the model returns 429s"""
+    scheduler = RateLimitScheduler(seed=0)
+    instrumentation = Instrumentation()
+    engine = ConsultationEngine(
+        fake_llm_config(error_rate=0.3, seed=1),
+        concurrency=4,
+        instrumentation=instrumentation,
+        scheduler=scheduler,
+        silent=True,
+    )
+    results = engine.run_batch(f"headache case {i}" for i in range(8))
+
+    assert all(result.ok for result in results), [r.error for r in results]
+    assert scheduler.stats()["retries"] > 0
+    assert (
+        sum(span["retries"] for result in results for span in result.trace["spans"])
+        == scheduler.stats()["retries"]
+    )
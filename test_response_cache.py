@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the agent response cache
+"""
+
+import os
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline, build_llm_config
+from llm_middleware import TextResponse
+from response_cache import (
+    LRUCacheBackend,
+    ResponseCache,
+    SQLiteCacheBackend,
+    cache_key,
+    normalize_text,
+)
+from structured import DEFAULT_STRUCTURED
+
+LLM_CONFIG = build_llm_config("sk-test")
+
+
+class FakeLLM:
+    """Innermost middleware standing in for the model"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, agent, params, call_next):
+        self.calls += 1
+        return TextResponse(f"{agent.name} says hello", model="gpt-4o")
+
+
+def run_consultation(cache, llm, symptoms):
+    pipeline = ConsultationPipeline(
+        LLM_CONFIG, max_round=4, silent=True, middlewares=[cache, llm]
+    )
+    pipeline.consult(symptoms)
+    return [m["content"] for m in pipeline.groupchat.messages]
+
+
+def test_repeated_consultation_is_served_from_cache():
+    """Test that a paraphrased repeat case makes no LLM calls"""
+    cache, llm = ResponseCache(), FakeLLM()
+    first = run_consultation(cache, llm, "headache and fatigue")
+    assert llm.calls == 3
+    assert cache.stats()["misses"] == 3
+
+    second = run_consultation(cache, llm, "Headache  and FATIGUE")
+    assert llm.calls == 3
+    assert cache.stats()["hits"] == 3
+    assert second[1:] == first[1:]
+
+
+def test_cache_key_depends_on_model_and_role_prompt():
+    """Test that different models or system messages never share entries"""
+    messages = [{"role": "user", "name": "patient", "content": "Headache."}]
+    key = cache_key("gpt-4o", "You diagnose.", messages)
+    assert key == cache_key(
+        "gpt-4o", "you diagnose", [{**messages[0], "content": " headache "}]
+    )
+    assert key != cache_key("gpt-4o-mini", "You diagnose.", messages)
+    assert key != cache_key("gpt-4o", "You prescribe.", messages)
+
+
+def test_structured_and_text_replies_never_share_entries():
+    """Test that JSON replies cached by a structured run are not served as prose"""
+    cache = ResponseCache()
+    config = fake_llm_config()
+    for structured in (DEFAULT_STRUCTURED, None, DEFAULT_STRUCTURED):
+        pipeline = ConsultationPipeline(
+            config, silent=True, middlewares=[cache], structured=structured
+        )
+        pipeline.consult("headache")
+        diagnosis = pipeline.groupchat.messages[1]["content"]
+        if structured is None:
+            assert diagnosis.startswith("Possible diagnosis: tension headache or")
+        else:
+            assert "(high likelihood)" in diagnosis
+    # The repeat structured run is served from the structured entries
+    assert cache.stats()["hits"] >= 2
+
+    messages = [{"role": "user", "name": "patient", "content": "Headache."}]
+    schema = {"name": "diagnosis", "schema": {"type": "object"}}
+    key = cache_key("gpt-4o", "You diagnose.", messages)
+    assert key == cache_key(
+        "gpt-4o",
+        "You diagnose.",
+        [{"role": "system", "content": "You diagnose."}] + messages,
+    )
+    assert key != cache_key("gpt-4o", "You diagnose.", messages, schema)
+    instructed = messages + [{"role": "system", "content": "Reply with JSON."}]
+    assert key != cache_key("gpt-4o", "You diagnose.", instructed)
+
+
+def test_normalize_text():
+    """Test whitespace, case and trailing punctuation normalization"""
+    assert normalize_text("  Headache\n and   Fatigue?! ") == "headache and fatigue"
+    assert normalize_text(None) == ""
+
+
+def test_lru_backend_evicts_least_recently_used():
+    """Test LRU size eviction"""
+    backend = LRUCacheBackend(max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert len(backend) == 2
+
+
+def test_lru_backend_expires_entries():
+    """Test LRU TTL expiry"""
+    backend = LRUCacheBackend(ttl=0.01)
+    backend.set("a", "1")
+    time.sleep(0.02)
+    assert backend.get("a") is None
+
+
+def test_sqlite_backend_persists_and_evicts(tmp_path):
+    """Test that the on-disk backend survives reopening and bounds its size"""
+    path = str(tmp_path / "cache" / "responses.db")
+    backend = SQLiteCacheBackend(path, max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.set("c", "3")
+    backend.close()
+
+    reopened = SQLiteCacheBackend(path, max_entries=2)
+    assert len(reopened) == 2
+    assert reopened.get("c") == "3"
+
+
+def test_sqlite_backend_expires_entries(tmp_path):
+    """Test on-disk TTL expiry"""
+    backend = SQLiteCacheBackend(str(tmp_path / "responses.db"), ttl=0.01)
+    backend.set("a", "1")
+    time.sleep(0.02)
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_disk_hit_populates_memory(tmp_path):
+    """Test that hits in a slower backend are copied to faster ones"""
+    memory = LRUCacheBackend()
+    disk = SQLiteCacheBackend(str(tmp_path / "responses.db"))
+    disk.set("a", "1")
+    cache = ResponseCache(memory, disk)
+    assert cache.get("a") == "1"
+    assert memory.get("a") == "1"
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for model routing per role and input complexity
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline, model_route
+from instrumentation import Instrumentation
+from routing import COMPLEX, NORMAL, TRIVIAL, RoutingPolicy, assess_complexity
+
+
+def models_used(llm_config, symptoms):
+    instrumentation = Instrumentation()
+    pipeline = ConsultationPipeline(
+        llm_config, silent=True, middlewares=[instrumentation]
+    )
+    with instrumentation.trace(symptoms) as trace:
+        pipeline.consult(symptoms)
+    return {span["agent"]: span["model"] for span in trace.spans}
+
+
+def test_assess_complexity():
+    """Test the trivial / normal / complex classification of symptoms"""
+    assert assess_complexity("I am feeling headache. Can you help?") == TRIVIAL
+    assert assess_complexity("headache and fatigue") == NORMAL
+    assert assess_complexity("mild chest pain") == COMPLEX
+    assert assess_complexity("fever, cough, rash, joint pain") == COMPLEX
+
+
+def test_route_by_role_and_complexity():
+    """Test that pharmacy is small by default and complex cases escalate"""
+    policy = RoutingPolicy()
+    models = ("gpt-4.1", "gpt-4.1-mini")
+
+    assert policy.route("diagnosis", TRIVIAL, models) == "gpt-4.1-mini"
+    assert policy.route("diagnosis", NORMAL, models) == "gpt-4.1"
+    assert policy.route("pharmacy", NORMAL, models) == "gpt-4.1-mini"
+    assert policy.route("pharmacy", COMPLEX, models) == "gpt-4.1"
+    assert policy.route("pharmacy", NORMAL, ("gpt-4o",)) is None
+
+    named = RoutingPolicy(small_model="gpt-4o-mini", large_model="gpt-4o")
+    assert named.route("pharmacy", NORMAL, models) == "gpt-4o-mini"
+
+
+def test_pipeline_routes_calls_to_the_chosen_model():
+    """Test that agents are served by the routed model in a real GroupChat"""
+    llm_config = fake_llm_config(small_model="gpt-4o-mini")
+
+    assert models_used(llm_config, "headache") == {
+        "diagnosis": "gpt-4o-mini",
+        "pharmacy": "gpt-4o-mini",
+        "consultation": "gpt-4o-mini",
+    }
+    assert models_used(llm_config, "headache and fatigue") == {
+        "diagnosis": "gpt-4o",
+        "pharmacy": "gpt-4o-mini",
+        "consultation": "gpt-4o",
+    }
+    assert set(models_used(llm_config, "severe headache").values()) == {"gpt-4o"}
+
+
+def test_tiers_follow_the_configured_models():
+    """Test that routing works for any main and LLM_SMALL_MODEL model names"""
+    llm_config = fake_llm_config(model="gpt-4.1", small_model="gpt-4.1-mini")
+
+    assert models_used(llm_config, "headache and fatigue") == {
+        "diagnosis": "gpt-4.1",
+        "pharmacy": "gpt-4.1-mini",
+        "consultation": "gpt-4.1",
+    }
+
+
+def test_single_model_config_is_unchanged():
+    """Test that routing is a no-op when only one model is configured"""
+    assert set(models_used(fake_llm_config(), "headache").values()) == {"gpt-4o"}
+
+
+def test_routes_fall_back_across_config_list():
+    """Test that a routed client tries its model first, then the others"""
+    llm_config = fake_llm_config(small_model="gpt-4o-mini")
+    client = model_route(llm_config, "gpt-4o-mini")
+
+    assert [c["model"] for c in client._config_list] == ["gpt-4o-mini", "gpt-4o"]
+    assert model_route(llm_config, "gpt-4o") is None
+    assert model_route(llm_config, "unknown") is None
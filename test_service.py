@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Tests for the HTTP consultation service
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from consultation_store import ConsultationStore
+from cost_ledger import CostLedger, TenantBudget
+from fake_llm import fake_llm_config
+from healthcare_chatbot import SharedOpenAIClient, build_llm_config, get_openai_client
+from service import ConsultationService
+
+
+def make_service(**options):
+    return ConsultationService(fake_llm_config(), workers=8, **options)
+
+
+def request(service, *calls):
+    """Run ``calls(client)`` coroutines against the service in one event loop"""
+
+    async def run():
+        transport = httpx.ASGITransport(app=service)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://service"
+        ) as client:
+            return [await call(client) for call in calls]
+
+    return asyncio.run(run())
+
+
+def parse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_submit_stream_and_fetch_transcript():
+    """Test the submit -> stream -> transcript flow"""
+    service = make_service()
+
+    async def flow(client):
+        created = await client.post("/consultations", json={"symptoms": "headache"})
+        assert created.status_code == 202
+        consultation_id = created.json()["id"]
+        streamed = await client.get(created.json()["stream"])
+        fetched = await client.get(f"/consultations/{consultation_id}")
+        return streamed, fetched
+
+    [(streamed, fetched)] = request(service, flow)
+
+    events = parse_events(streamed.text)
+    assert streamed.headers["content-type"] == "text/event-stream"
+    assert {data["agent"] for event, data in events if event == "token"} == {
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    }
+    assert events[-1][0] == "done"
+    body = fetched.json()
+    assert body["status"] == "done"
+    assert [turn["name"] for turn in body["transcript"]] == [
+        "patient",
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    ]
+    assert body["summary"]
+
+
+def test_many_concurrent_consultations():
+    """Test that concurrent submissions all complete on pooled pipelines"""
+    service = make_service()
+
+    async def flow(client):
+        created = await asyncio.gather(
+            *[
+                client.post("/consultations", json={"symptoms": f"case {i}"})
+                for i in range(20)
+            ]
+        )
+        streams = await asyncio.gather(
+            *[client.get(c.json()["stream"]) for c in created]
+        )
+        return [parse_events(s.text)[-1][1]["status"] for s in streams]
+
+    [statuses] = request(service, flow)
+
+    assert statuses == ["done"] * 20
+    assert service.engine.pool.stats()["created"] <= 8
+
+
+def test_invalid_requests():
+    """Test validation errors and unknown routes"""
+    service = make_service()
+
+    async def bad_json(client):
+        return await client.post("/consultations", content=b"not json")
+
+    async def missing(client):
+        return await client.get("/consultations/nope")
+
+    async def wrong_method(client):
+        return await client.get("/consultations")
+
+    responses = request(service, bad_json, missing, wrong_method)
+
+    assert [r.status_code for r in responses] == [400, 404, 405]
+
+
+def test_health_and_metrics():
+    """Test that health reports pool stats and metrics follow consultations"""
+    service = make_service()
+
+    async def flow(client):
+        created = await client.post("/consultations", json={"symptoms": "fever"})
+        await client.get(created.json()["stream"])
+        return await client.get("/health"), await client.get("/metrics")
+
+    [(health, metrics)] = request(service, flow)
+
+    assert health.json()["status"] == "ok"
+    assert "consultation_consultations_total 1" in metrics.text
+
+
+def test_tenant_budgets_and_costs():
+    """Test that costs are reported per tenant and exhausted tenants get a 429"""
+    ledger = CostLedger(budgets={"acme": TenantBudget(max_cost=0.0)})
+    service = make_service(ledger=ledger)
+
+    async def flow(client):
+        created = await client.post(
+            "/consultations", json={"symptoms": "fever"}, headers={"X-Tenant": "beta"}
+        )
+        done = parse_events((await client.get(created.json()["stream"])).text)
+        refused = await client.post(
+            "/consultations", json={"symptoms": "fever"}, headers={"X-Tenant": "acme"}
+        )
+        return done[-1][1], refused, await client.get("/costs")
+
+    [(done, refused, costs)] = request(service, flow)
+
+    assert done["tenant"] == "beta"
+    assert done["cost"]["cost"] > 0
+    assert refused.status_code == 429
+    body = costs.json()
+    assert set(body["by_tenant"]) == {"beta"}
+    assert set(body["by_agent"]) == {"diagnosis", "pharmacy", "consultation"}
+    assert body["budgets"][0]["tenant"] == "acme"
+
+
+def test_evicted_consultations_are_served_from_the_store(tmp_path):
+    """Test that finished consultations stay readable after eviction"""
+    store = ConsultationStore(str(tmp_path / "store.db"))
+    service = make_service(max_records=1, store=store)
+
+    async def flow(client):
+        ids = []
+        for symptoms in ("headache", "cough"):
+            created = await client.post("/consultations", json={"symptoms": symptoms})
+            await client.get(created.json()["stream"])
+            ids.append(created.json()["id"])
+        store.flush()
+        return await client.get(f"/consultations/{ids[0]}"), ids[0]
+
+    [(fetched, first_id)] = request(service, flow)
+    store.close()
+
+    assert first_id not in service.consultations
+    assert fetched.status_code == 200
+    assert fetched.json()["symptoms"] == "headache"
+    assert fetched.json()["status"] == "done"
+    assert fetched.json()["transcript"]
+
+
+def test_stream_ends_when_the_store_or_engine_fails():
+    """Test that the stream still gets its terminal event when a step raises"""
+
+    class BrokenStore:
+        def record_result(self, result, consultation_id=None):
+            raise OSError("disk full")
+
+    async def broken_consult(*args, **kwargs):
+        raise RuntimeError("pool exhausted")
+
+    def flow(symptoms):
+        async def run(client):
+            created = await client.post("/consultations", json={"symptoms": symptoms})
+            # Without a terminal event the stream would never end
+            streamed = await asyncio.wait_for(client.get(created.json()["stream"]), 5)
+            return parse_events(streamed.text)
+
+        return run
+
+    service = make_service(store=BrokenStore())
+    [events] = request(service, flow("headache"))
+    assert events[-1][0] == "done"
+    assert events[-1][1]["status"] == "done"
+
+    service = make_service()
+    service.engine.a_consult = broken_consult
+    [events] = request(service, flow("headache"))
+    assert [event for event, _ in events] == ["error", "done"]
+    assert "pool exhausted" in events[0][1]["error"]
+    assert events[-1][1]["status"] == "failed"
+
+
+def test_agents_share_one_pooled_openai_client():
+    """Test that every agent of every pipeline reuses one OpenAI client"""
+    llm_config = build_llm_config("sk-test")
+    config = llm_config["config_list"][0]
+
+    assert config["model_client_cls"] == "SharedOpenAIClient"
+    first = SharedOpenAIClient(config)._client._oai_client
+    second = SharedOpenAIClient(config)._client._oai_client
+    assert first is second is get_openai_client("sk-test")
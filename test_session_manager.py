@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-session state manager
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent_pool import AgentPool
+from fake_llm import fake_llm_config
+from session_manager import SessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def chat(symptoms, size=10):
+    return [
+        {"name": "patient", "content": symptoms},
+        {"name": "consultation", "content": "x" * size},
+    ]
+
+
+def test_sessions_are_isolated():
+    """Test that each session only sees its own consultations"""
+    manager = SessionManager()
+    manager.record("alice", "headache", chat("headache"))
+    manager.record("bob", "cough", chat("cough"))
+
+    assert [c.symptoms for c in manager.history("alice")] == ["headache"]
+    assert [c.symptoms for c in manager.history("bob")] == ["cough"]
+    assert manager.history("carol") == []
+
+
+def test_history_is_capped_by_messages_and_bytes():
+    """Test that the oldest consultations are dropped to stay within the caps"""
+    manager = SessionManager(max_messages=6, max_bytes=10_000)
+    for i in range(5):
+        manager.record("alice", f"case {i}", chat(f"case {i}"))
+
+    assert [c.symptoms for c in manager.history("alice")] == [
+        "case 2",
+        "case 3",
+        "case 4",
+    ]
+
+    manager = SessionManager(max_messages=100, max_bytes=2500)
+    for i in range(5):
+        manager.record("alice", f"case {i}", chat(f"case {i}", size=1000))
+    stats = manager.stats()
+
+    assert stats["consultations"] == 2
+    assert stats["bytes"] <= 2500
+    assert stats["dropped_consultations"] == 3
+
+
+def test_idle_and_excess_sessions_are_evicted():
+    """Test idle-timeout and least-recently-used eviction of sessions"""
+    clock = FakeClock()
+    manager = SessionManager(max_sessions=2, idle_seconds=60, clock=clock)
+    manager.session("alice")
+    clock.now = 30
+    manager.session("bob")
+    clock.now = 70
+
+    assert manager.evict_idle() == 1
+    assert manager.stats()["sessions"] == 1
+
+    manager.session("carol")
+    manager.session("dave")
+    assert len(manager) == 2
+    assert manager.stats()["evicted_sessions"] == 2
+    assert manager.end("bob") is False
+
+
+def test_stats_report_memory():
+    """Test that retained bytes and process memory are reported"""
+    manager = SessionManager()
+    manager.record("alice", "headache", chat("headache", size=100))
+    stats = manager.stats()
+
+    assert stats["sessions"] == 1
+    assert stats["messages"] == 2
+    assert stats["bytes"] >= 100
+    assert stats["resident_bytes"] is None or stats["resident_bytes"] > 0
+
+
+def test_pooled_pipelines_keep_no_history_between_sessions():
+    """Test that a pipeline returned to the pool starts the next session empty"""
+    pool = AgentPool(max_idle=1)
+    manager = SessionManager()
+    llm_config = fake_llm_config()
+
+    with pool.pipeline(llm_config, silent=True) as pipeline:
+        pipeline.consult("headache")
+        manager.record("alice", "headache", pipeline.groupchat.messages)
+    with pool.pipeline(llm_config, silent=True) as reused:
+        assert reused is pipeline
+        assert reused.groupchat.messages == []
+
+    assert manager.history("alice")[0].messages[0]["name"] == "patient"
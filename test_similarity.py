@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the symptom-similarity index
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from consultation_store import ConsultationStore
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline
+from similarity import HashingEmbedder, SimilarityIndex, symptom_tokens
+from termination import COMPLETION_MARKER
+
+
+def chat(symptoms, advice="Rest and drink fluids."):
+    return [
+        {"name": "patient", "content": f"I am feeling {symptoms}. Can you help?"},
+        {"name": "diagnosis", "content": f"Likely a mild viral illness ({symptoms})."},
+        {"name": "pharmacy", "content": "Paracetamol as directed."},
+        {"name": "consultation", "content": f"{advice} {COMPLETION_MARKER}"},
+    ]
+
+
+def test_paraphrases_score_higher_than_different_symptoms():
+    """Test that reworded symptoms are closer than unrelated or negated ones"""
+    index = SimilarityIndex(threshold=0.8)
+    index.add("headache and fever", chat("headache and fever"))
+    index.add("sore throat and cough", chat("sore throat and cough"))
+
+    [paraphrase] = index.search("I have a fever and a headache")
+    [other] = index.search("back pain")
+    [negated] = index.search("headache with no fever")
+
+    assert paraphrase.symptoms == "headache and fever"
+    assert paraphrase.score > 0.95
+    assert other.score < 0.5
+    assert negated.score < paraphrase.score
+    assert "not_fever" in symptom_tokens("headache with no fever")
+
+
+def test_lookup_respects_threshold_and_red_flags():
+    """Test that only close, non-urgent inputs reuse a past consultation"""
+    index = SimilarityIndex(threshold=0.9)
+    index.add("headache and fever", chat("headache and fever"))
+    index.add("chest pain", chat("chest pain"))
+
+    assert index.lookup("fever, headache").symptoms == "headache and fever"
+    assert index.lookup("sprained ankle") is None
+    assert index.lookup("severe chest pain") is None
+    assert index.stats() == {"entries": 2, "hits": 1, "misses": 2}
+
+
+def test_incomplete_consultations_are_not_indexed():
+    """Test that chats that never reached the completion marker are skipped"""
+    index = SimilarityIndex()
+    messages = chat("headache")[:-1]
+
+    assert index.add("headache", messages) is False
+    assert len(index) == 0
+
+
+def test_pipeline_replays_similar_consultation():
+    """Test that a paraphrase is answered from the index without calling agents"""
+    index = SimilarityIndex(threshold=0.9)
+    pipeline = ConsultationPipeline(fake_llm_config(), silent=True, similarity=index)
+
+    pipeline.consult("headache and fever")
+    advice = pipeline.groupchat.messages[-1]["content"]
+    pipeline.reset()
+    started = time.perf_counter()
+    second = pipeline.consult("fever and headache")
+    elapsed = time.perf_counter() - started
+
+    assert pipeline.reused is not None
+    assert pipeline.reused.symptoms == "headache and fever"
+    assert second.summary == advice
+    assert second.chat_history[0]["content"].startswith("I am feeling fever")
+    assert [m["name"] for m in pipeline.groupchat.messages][0] == "patient"
+    assert elapsed < 0.5
+
+
+def test_index_loads_from_store_and_grows(tmp_path):
+    """Test warm-up from the consultation store and growth past the initial capacity"""
+    with ConsultationStore(str(tmp_path / "store.db")) as store:
+        for i in range(100):
+            store.record(f"symptom{i} ache", chat(f"symptom{i} ache"))
+        store.flush()
+        index = SimilarityIndex(HashingEmbedder(dimensions=256))
+        assert index.load_store(store) == 100
+
+    assert len(index) == 100
+    [match] = index.search("symptom42 ache")
+    assert match.symptoms == "symptom42 ache"
+    assert np.isclose(match.score, 1.0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for speculative pre-generation of the pharmacy step
+"""
+
+import os
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import fake_llm
+from consultation_engine import ConsultationEngine
+from cost_ledger import CostLedger
+from dag import DEFAULT_DAG
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline
+from speculative import SpeculativePolicy, commit_point, is_stable
+from streaming import Transcript, stream_to, streaming_middleware
+from structured import DEFAULT_STRUCTURED
+
+# Long enough replies that pharmacy can overlap most of the diagnosis
+LATENCY = {"ttft": 0.02, "tokens_per_second": 400, "completion_tokens": (120, 120)}
+
+
+def consult(speculative, **options):
+    pipeline = ConsultationPipeline(
+        fake_llm_config(**LATENCY),
+        silent=True,
+        middlewares=[streaming_middleware],
+        speculative=speculative,
+        **options,
+    )
+    transcript = Transcript()
+    started = time.perf_counter()
+    with stream_to(transcript):
+        pipeline.consult("headache")
+    return pipeline, transcript, time.perf_counter() - started
+
+
+def test_commit_point_waits_for_a_complete_sentence():
+    """Test that the draft starts only after a full stop followed by more text"""
+    text = "Possible diagnosis: tension headache."
+    assert commit_point(text) is None
+    assert commit_point(text + " Key") == len(text)
+    assert commit_point("Dose 2.5 mg is typical", min_chars=0) is None
+    assert commit_point("Hi. Possible diagnosis: migraine. More") == 33
+
+    committed = "Possible diagnosis: migraine."
+    assert is_stable(committed, committed + " Rest and fluids.")
+    assert not is_stable(committed, committed + " However, rule out meningitis.")
+    assert not is_stable(committed, "Possible diagnosis: meningitis.")
+
+
+def test_kept_draft_overlaps_the_diagnosis():
+    """Test that pharmacy's reply is drafted during the diagnosis and reused"""
+    baseline, baseline_transcript, baseline_wall = consult(None)
+    policy = SpeculativePolicy()
+    pipeline, transcript, wall = consult(policy)
+
+    stats = policy.stats()
+    assert (stats["drafted"], stats["kept"], stats["discarded"]) == (1, 1, 0)
+    assert stats["saved_seconds"] > 0.1
+    assert wall < baseline_wall - 0.1
+    # The conversation and what the UI saw are unchanged
+    assert [m["content"] for m in pipeline.groupchat.messages] == [
+        m["content"] for m in baseline.groupchat.messages
+    ]
+    assert transcript.turns == baseline_transcript.turns
+
+
+def test_revised_diagnosis_discards_the_draft(monkeypatch):
+    """Test that a diagnosis which later changes its mind gets a fresh pharmacy call"""
+    revising = (
+        "diagnosis",
+        "Possible diagnosis: tension headache or dehydration. However, with "
+        "fever and a stiff neck meningitis must be ruled out urgently.",
+    )
+    monkeypatch.setattr(
+        fake_llm, "ROLE_REPLIES", fake_llm.ROLE_REPLIES[:2] + (revising,)
+    )
+    policy = SpeculativePolicy()
+    pipeline, transcript, wall = consult(policy)
+
+    stats = policy.stats()
+    assert (stats["drafted"], stats["kept"], stats["discarded"]) == (1, 0, 1)
+    pharmacy = pipeline.groupchat.messages[2]
+    assert pharmacy["name"] == "pharmacy"
+    assert pharmacy["content"].startswith("Recommended medications")
+
+
+def test_kept_draft_is_accounted_once():
+    """Test that the ledger charges for pharmacy's tokens once, when the draft ran"""
+    results = {}
+    for speculative in (None, SpeculativePolicy()):
+        engine = ConsultationEngine(
+            fake_llm_config(**LATENCY),
+            ledger=CostLedger(),
+            silent=True,
+            speculative=speculative,
+        )
+        results[speculative is not None] = engine.consult(0, "headache")
+
+    assert results[True].ok
+    baseline = results[False].cost["agents"]["pharmacy"]
+    pharmacy = results[True].cost["agents"]["pharmacy"]
+    # The kept draft is a free reply, like a cache hit; only the draft is billed
+    assert pharmacy["completion_tokens"] == baseline["completion_tokens"]
+    assert pharmacy["cost"] <= baseline["cost"]
+
+
+def test_dag_and_structured_consultations_are_not_speculated():
+    """Test that speculation stays out of DAG runs and JSON diagnosis replies"""
+    policy = SpeculativePolicy()
+    pipeline, _, _ = consult(policy, dag=DEFAULT_DAG)
+    assert pipeline.speculator is None
+
+    pipeline, _, _ = consult(policy, structured=DEFAULT_STRUCTURED)
+    assert pipeline.speculator is not None
+    assert policy.stats()["drafted"] == 0
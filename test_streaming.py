@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming agent tokens to a UI
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from autogen.io import IOStream
+from autogen.messages.client_messages import StreamMessage
+
+from healthcare_chatbot import ConsultationPipeline, build_llm_config
+from llm_middleware import TextResponse
+from response_cache import ResponseCache
+from streaming import Transcript, stream_to, streaming_middleware
+
+LLM_CONFIG = build_llm_config("sk-test")
+
+
+class FakeStreamingLLM:
+    """Innermost middleware that streams word by word when asked to"""
+
+    def __init__(self):
+        self.stream_flags = []
+
+    def __call__(self, agent, params, call_next):
+        words = [f"{agent.name} ", "is ", "thinking"]
+        self.stream_flags.append(params.get("stream", False))
+        if params.get("stream"):
+            for word in words:
+                IOStream.get_default().send(StreamMessage(content=word))
+        return TextResponse("".join(words), model="gpt-4o")
+
+
+def make_pipeline(*middlewares):
+    return ConsultationPipeline(
+        LLM_CONFIG, max_round=4, silent=True, middlewares=middlewares
+    )
+
+
+def test_tokens_are_streamed_per_agent_turn():
+    """Test that each agent's tokens land in its own transcript turn"""
+    llm = FakeStreamingLLM()
+    updates = []
+    transcript = Transcript(lambda turn, agent, text: updates.append((turn, agent)))
+    with stream_to(transcript):
+        make_pipeline(streaming_middleware, llm).consult("headache")
+
+    assert llm.stream_flags == [True, True, True]
+    assert transcript.turns == [
+        ["diagnosis", "diagnosis is thinking"],
+        ["pharmacy", "pharmacy is thinking"],
+        ["consultation", "consultation is thinking"],
+    ]
+    assert updates[:3] == [(0, "diagnosis")] * 3
+
+
+def test_without_sink_requests_are_not_streamed():
+    """Test that the middleware is inert outside stream_to"""
+    llm = FakeStreamingLLM()
+    make_pipeline(streaming_middleware, llm).consult("headache")
+    assert llm.stream_flags == [False, False, False]
+
+
+def test_cache_hits_are_delivered_whole():
+    """Test that replies served without streaming still reach the sink"""
+    cache, llm = ResponseCache(), FakeStreamingLLM()
+    make_pipeline(streaming_middleware, cache, llm).consult("headache")
+
+    transcript = Transcript()
+    with stream_to(transcript):
+        make_pipeline(streaming_middleware, cache, llm).consult("headache")
+    assert len(llm.stream_flags) == 3
+    assert [text for _, text in transcript.turns] == [
+        "diagnosis is thinking",
+        "pharmacy is thinking",
+        "consultation is thinking",
+    ]
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for schema-validated structured outputs between agents
+"""
+
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from consultation_store import (
+    DOCTOR_VISIT_REQUIRED,
+    NO_DOCTOR_VISIT,
+    URGENT,
+    classify_outcome,
+)
+from fake_llm import STRUCTURED_REPLIES, fake_llm_config
+from healthcare_chatbot import ConsultationPipeline, SharedOpenAIClient
+from instrumentation import Instrumentation
+from llm_middleware import TextResponse
+from structured import (
+    DIAGNOSIS_SCHEMA,
+    StructuredOutputError,
+    StructuredOutputPolicy,
+    compact_json,
+    consultation_reply,
+    parse_payload,
+)
+from termination import COMPLETION_MARKER
+
+
+def make_pipeline(policy, *middlewares):
+    return ConsultationPipeline(
+        fake_llm_config(), silent=True, structured=policy, middlewares=middlewares
+    )
+
+
+def test_payloads_are_validated_against_the_schema():
+    """Test that replies are parsed locally and rejected when off-schema"""
+    payload = STRUCTURED_REPLIES["diagnosis"]
+    assert parse_payload(compact_json(payload), DIAGNOSIS_SCHEMA) == payload
+    assert parse_payload(f"```json\n{compact_json(payload)}\n```", DIAGNOSIS_SCHEMA)
+
+    invalid = [
+        "Possible diagnosis: a cold",
+        compact_json({**payload, "urgency": "soon"}),
+        compact_json({**payload, "notes": "extra"}),
+        compact_json({"conditions": [], "urgency": "routine"}),
+        compact_json({**payload, "conditions": [{"name": "cold"}]}),
+    ]
+    for text in invalid:
+        with pytest.raises(StructuredOutputError):
+            parse_payload(text, DIAGNOSIS_SCHEMA)
+
+
+def test_consultation_is_answered_without_the_model():
+    """Test that the final recommendation is derived from the payloads"""
+    policy = StructuredOutputPolicy()
+    instrumentation = Instrumentation()
+    pipeline = make_pipeline(policy, instrumentation)
+    with instrumentation.trace("headache") as trace:
+        pipeline.consult("headache")
+    messages = pipeline.groupchat.messages
+
+    assert [m["name"] for m in messages] == [
+        "patient",
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+    ]
+    assert [span["agent"] for span in trace.spans] == ["diagnosis", "pharmacy"]
+    assert messages[1]["content"].startswith("Possible diagnosis: tension headache")
+    assert messages[-1]["content"].endswith(COMPLETION_MARKER)
+    assert classify_outcome(messages[-1]["content"]) == NO_DOCTOR_VISIT
+    assert policy.stats()["derived"] == 1
+
+
+def test_downstream_agents_receive_compact_payloads():
+    """Test that later prompts carry the JSON payload and the schema request"""
+    seen = {}
+
+    def record(agent, params, call_next):
+        seen[agent.name] = params
+        return call_next(params)
+
+    make_pipeline(StructuredOutputPolicy(), record).consult("headache")
+    pharmacy = seen["pharmacy"]
+    contents = [m["content"] for m in pharmacy["messages"]]
+
+    assert compact_json(STRUCTURED_REPLIES["diagnosis"]) in contents
+    assert not any(c.startswith("Possible diagnosis") for c in contents)
+    assert pharmacy["structured_output"]["name"] == "pharmacy"
+    # Compaction moves the schema request up with the other system messages
+    assert pharmacy["messages"][1]["role"] == "system"
+    assert "JSON schema" in contents[1]
+
+
+def test_invalid_replies_fall_back_to_text():
+    """Test that an off-schema reply is kept as prose and consultation uses the model"""
+    policy = StructuredOutputPolicy()
+
+    def prose(agent, params, call_next):
+        if agent.name == "diagnosis":
+            return TextResponse("Possible diagnosis: a common cold.")
+        return call_next(params)
+
+    pipeline = make_pipeline(policy, prose)
+    pipeline.consult("headache")
+    messages = pipeline.groupchat.messages
+
+    assert messages[1]["content"] == "Possible diagnosis: a common cold."
+    assert policy.stats()["invalid"] == 1
+    assert policy.stats()["derived"] == 0
+    assert COMPLETION_MARKER in messages[-1]["content"]
+
+
+def test_derived_recommendation_follows_urgency():
+    """Test the urgency-to-outcome mapping of the derived recommendation"""
+    diagnosis = STRUCTURED_REPLIES["diagnosis"]
+    pharmacy = STRUCTURED_REPLIES["pharmacy"]
+
+    def outcome(urgency, needs_prescription=False):
+        return classify_outcome(
+            consultation_reply(
+                {**diagnosis, "urgency": urgency},
+                {**pharmacy, "needs_prescription": needs_prescription},
+            )
+        )
+
+    assert outcome("emergency") == URGENT
+    assert outcome("urgent") == URGENT
+    assert outcome("routine", needs_prescription=True) == DOCTOR_VISIT_REQUIRED
+    assert outcome("self_care") == NO_DOCTOR_VISIT
+
+
+def test_shared_client_requests_a_strict_response_format():
+    """Test that SharedOpenAIClient turns the schema into OpenAI's response_format"""
+    sent = []
+
+    class Recorder:
+        def create(self, params):
+            sent.append(params)
+
+    client = SharedOpenAIClient.__new__(SharedOpenAIClient)
+    client._client = Recorder()
+    client.create(
+        {
+            "messages": [],
+            "model_client_cls": "SharedOpenAIClient",
+            "structured_output": {"name": "diagnosis", "schema": DIAGNOSIS_SCHEMA},
+        }
+    )
+
+    assert sent == [
+        {
+            "messages": [],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "diagnosis",
+                    "schema": DIAGNOSIS_SCHEMA,
+                    "strict": True,
+                },
+            },
+        }
+    ]
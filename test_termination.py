@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for early termination of the consultation GroupChat
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from healthcare_chatbot import ConsultationPipeline, build_llm_config
+from llm_middleware import TextResponse
+from termination import COMPLETION_MARKER, TerminationPolicy
+
+LLM_CONFIG = build_llm_config("sk-test")
+
+
+class FakeLLM:
+    """Innermost middleware standing in for the model"""
+
+    def __init__(self, finish=True):
+        self.finish = finish
+        self.calls = 0
+
+    def __call__(self, agent, params, call_next):
+        self.calls += 1
+        text = f"{agent.name} turn"
+        if self.finish and agent.name == "consultation":
+            text += f"\n{COMPLETION_MARKER}"
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50)
+        return TextResponse(text, model="gpt-4o", usage=usage)
+
+
+def run(llm, **options):
+    pipeline = ConsultationPipeline(
+        LLM_CONFIG, max_round=10, silent=True, middlewares=[llm], **options
+    )
+    pipeline.consult("headache")
+    speakers = [m["name"] for m in pipeline.groupchat.messages]
+    return pipeline, speakers
+
+
+def test_chat_stops_at_completion_marker():
+    """Test that no rounds run after the consultation summary"""
+    llm = FakeLLM()
+    pipeline, speakers = run(llm)
+    assert speakers == ["patient", "diagnosis", "pharmacy", "consultation"]
+    assert llm.calls == 3
+    assert pipeline.terminator.stop_reason == "marker"
+
+
+def test_pharmacy_responds_only_once():
+    """Test that capped roles are skipped in the round-robin order"""
+    _, speakers = run(FakeLLM(finish=False))
+    assert len(speakers) == 10
+    assert speakers.count("pharmacy") == 1
+    assert speakers[:6] == [
+        "patient",
+        "diagnosis",
+        "pharmacy",
+        "consultation",
+        "diagnosis",
+        "consultation",
+    ]
+
+
+def test_token_budget_stops_chat():
+    """Test that the chat ends once the token budget is spent"""
+    llm = FakeLLM(finish=False)
+    pipeline, speakers = run(llm, termination=TerminationPolicy(max_tokens=300))
+    assert speakers == ["patient", "diagnosis", "pharmacy"]
+    assert pipeline.terminator.tokens == 300
+    assert pipeline.terminator.stop_reason == "budget"
+
+
+def test_state_resets_between_consultations():
+    """Test that budgets and stop reasons are per consultation"""
+    llm = FakeLLM()
+    pipeline, _ = run(llm, termination=TerminationPolicy(max_tokens=450))
+    pipeline.reset()
+    assert pipeline.terminator.tokens == 0
+    pipeline.consult("cough")
+    assert len(pipeline.groupchat.messages) == 4
+    assert pipeline.terminator.stop_reason == "marker"
+
+
+def test_termination_can_be_disabled():
+    """Test the plain round-robin behaviour without a policy"""
+    _, speakers = run(FakeLLM(), termination=None)
+    assert len(speakers) == 10
+    assert speakers.count("pharmacy") == 3
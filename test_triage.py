@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Tests for the rule-based triage stage
+"""
+
+import asyncio
+import os
+import sys
+import timeit
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import fake_llm_config
+from healthcare_chatbot import ConsultationPipeline
+from routing import NORMAL, TRIVIAL
+from streaming import Transcript, on_loop, stream_to
+from termination import COMPLETION_MARKER
+from triage import CONSULT, EMERGENCY, REJECT, Triage
+
+
+def test_emergencies_are_recognized():
+    """Test that red-flag presentations are short-circuited as emergencies"""
+    triage = Triage()
+    cases = {
+        "chest pain and shortness of breath": "cardiac",
+        "Shortness of breath with CHEST TIGHTNESS": "cardiac",
+        "my face is drooping and I have slurred speech": "stroke",
+        "sudden numbness on one side of my body": "stroke",
+        "one side of my face feels weak": "stroke",
+        "high fever and a stiff neck": "meningitis",
+        "worst headache of my life": "thunderclap",
+        "my throat is swelling after a bee sting": "anaphylaxis",
+        "my toddler swallowed a battery": "poisoning",
+        "I drank some bleach by mistake": "poisoning",
+        "I think I was poisoned": "poisoning",
+        "overdosed on my sleeping pills": "poisoning",
+        "I want to kill myself": "self_harm",
+    }
+    for symptoms, reason in cases.items():
+        result = triage(symptoms)
+        assert result.action == EMERGENCY, symptoms
+        assert reason in result.reasons
+        assert result.messages[-1]["content"].endswith(COMPLETION_MARKER)
+
+
+def test_harmless_mentions_are_not_emergencies():
+    """Test that everyday mentions of poison, overdose or one side reach the agents"""
+    triage = Triage()
+    for symptoms in (
+        "food poisoning with nausea and vomiting",
+        "I ate bad chicken and think I have food poisoning",
+        "poison ivy rash on my arm",
+        "itchy rash from poison oak",
+        "my dog ate poison ivy and now my hands itch",
+        "worried about overdosing on ibuprofen",
+        "itchy rash on one side of my body",
+        "pain on one side of my face",
+        "headache on one side of my head, weak coffee helps",
+        "how do I avoid an overdose of acetaminophen with a fever",
+    ):
+        result = triage(symptoms)
+        assert result.action == CONSULT, symptoms
+        assert result.reasons == ()
+
+
+def test_junk_is_rejected():
+    """Test that empty, oversized and keyboard-mashed input is rejected"""
+    triage = Triage()
+    for symptoms in ("", "   ", "???", "12345", "zzzzzzz", "qwrt zxcv", "a" * 5000):
+        assert triage(symptoms).action == REJECT, symptoms
+    for symptoms in ("asdfghjkl", "qwerty", "lol", "lol qwerty"):
+        assert triage(symptoms).action == REJECT, symptoms
+    for symptoms in ("flu", "tinnitus", "headaches", "my knee", "gastritis again"):
+        assert triage(symptoms).action == CONSULT, symptoms
+
+
+def test_ordinary_symptoms_go_to_the_agents_with_tags():
+    """Test that everyday symptoms are tagged for routing and passed on"""
+    triage = Triage()
+    headache = triage("I have a headache")
+    cold = triage("sore throat, runny nose and a cough")
+    chest_alone = triage("mild chest pain when I press on my ribs")
+
+    assert (headache.action, headache.tags, headache.complexity) == (
+        CONSULT,
+        ("headache",),
+        TRIVIAL,
+    )
+    assert cold.tags == ("cough", "runny nose", "sore throat")
+    assert cold.complexity == NORMAL
+    assert chest_alone.action == CONSULT
+    assert triage.stats()["skipped_ratio"] == 0.0
+
+
+def test_pipeline_skips_llm_calls_for_short_circuited_input():
+    """Test that emergencies and junk never reach the model"""
+    calls = []
+
+    def count_calls(agent, params, call_next):
+        calls.append(agent.name)
+        return call_next(params)
+
+    triage = Triage()
+    pipeline = ConsultationPipeline(
+        fake_llm_config(), silent=True, middlewares=[count_calls], triage=triage
+    )
+
+    result = pipeline.consult("crushing chest pain and I can't breathe")
+    assert pipeline.triaged.action == EMERGENCY
+    assert "emergency" in result.summary
+    pipeline.reset()
+    pipeline.consult("!!!")
+    assert pipeline.triaged.action == REJECT
+
+    assert calls == []
+    pipeline.reset()
+    pipeline.consult("headache")
+    assert calls
+    assert triage.stats() == {
+        EMERGENCY: 1,
+        REJECT: 1,
+        CONSULT: 1,
+        "skipped_ratio": 2 / 3,
+    }
+
+
+def test_short_circuited_answer_reaches_the_stream_sink():
+    """Test that a UI rendering through stream_to sees the emergency advice"""
+    pipeline = ConsultationPipeline(fake_llm_config(), silent=True)
+    transcript = Transcript()
+
+    async def consult():
+        with stream_to(on_loop(transcript)):
+            await pipeline.a_consult("chest pain and shortness of breath")
+
+    asyncio.run(consult())
+
+    assert pipeline.triaged.action == EMERGENCY
+    [(agent_name, text)] = transcript.turns
+    assert agent_name == "consultation"
+    assert "emergency number" in text
+
+
+def test_short_circuited_answer_replaces_the_previous_transcript():
+    """Test that a triaged consult leaves only its own turns in the group chat"""
+    pipeline = ConsultationPipeline(fake_llm_config(), silent=True)
+    pipeline.consult("headache")
+    assert len(pipeline.groupchat.messages) > 2
+
+    result = pipeline.consult("chest pain and shortness of breath")
+    assert pipeline.groupchat.messages == result.chat_history
+    assert [m["name"] for m in pipeline.groupchat.messages] == [
+        "patient",
+        "consultation",
+    ]
+
+
+def test_triage_runs_in_microseconds():
+    """Test that a verdict costs well under a millisecond"""
+    triage = Triage()
+    seconds = timeit.timeit(
+        lambda: triage("headache and sore throat since yesterday, no fever"),
+        number=1000,
+    )
+    assert seconds / 1000 < 0.001
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Tests for work-queue backed consultation processing
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from consultation_engine import ConsultationEngine
+from cost_ledger import CostLedger, TenantBudget
+from fake_llm import fake_llm_config
+from work_queue import (
+    DONE,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    MemoryBroker,
+    QueueFull,
+    QueueWorker,
+    SQLiteBroker,
+    WorkQueue,
+)
+
+
+def test_full_queue_pushes_back_on_producers():
+    """Test that intake is refused, or waits, once max_depth jobs are queued"""
+    queue = WorkQueue(MemoryBroker(), max_depth=2, poll_interval=0.01)
+    first = queue.submit("headache")
+    assert queue.offer("cough")
+    assert queue.offer("fever") is None
+    assert queue.pressure() == 1.0
+    with pytest.raises(QueueFull):
+        queue.submit("fever")
+    with pytest.raises(QueueFull):
+        queue.submit("fever", block=True, timeout=0.05)
+
+    # A blocked producer proceeds as soon as a worker takes a job
+    claimer = threading.Timer(0.05, queue.broker.claim, args=("worker",))
+    claimer.start()
+    job_id = queue.submit("fever", block=True, timeout=5)
+    claimer.join()
+
+    assert queue.status(first)["status"] == RUNNING
+    assert queue.status(job_id)["position"] == 1
+    assert queue.stats()[QUEUED] == 2
+
+
+def test_expired_leases_are_requeued_then_failed(tmp_path):
+    """Test that a job whose worker died is retried up to max_attempts claims"""
+    now = [0.0]
+    path = str(tmp_path / "queue.db")
+    broker = SQLiteBroker(path, max_attempts=2, clock=lambda: now[0])
+    queue = WorkQueue(broker)
+    job_id = queue.submit("headache", tenant="acme")
+    later = queue.submit("cough")
+    assert queue.status(later)["position"] == 1
+
+    assert broker.claim("a", lease=10)["id"] == job_id
+    now[0] = 11.0
+    retried = broker.claim("b", lease=10)
+    assert (retried["id"], retried["attempts"], retried["worker"]) == (job_id, 2, "b")
+    now[0] = 22.0
+    assert broker.claim("c", lease=10)["id"] == later
+    failed = queue.status(job_id)
+    assert (failed["status"], failed["error"]) == (FAILED, "lease expired")
+
+    broker.complete(later, {"summary": "rest"})
+    broker.close()
+    # Jobs survive the process: another broker on the same file sees them
+    reopened = SQLiteBroker(path)
+    assert reopened.get(later)["result"] == {"summary": "rest"}
+    assert reopened.get(job_id)["tenant"] == "acme"
+    assert reopened.counts() == {QUEUED: 0, RUNNING: 0, DONE: 1, FAILED: 1}
+    reopened.close()
+
+
+def test_concurrent_claims_never_share_a_job(tmp_path):
+    """Test that brokers on one file (as separate processes would) claim atomically"""
+    path = str(tmp_path / "queue.db")
+    queue = WorkQueue(SQLiteBroker(path))
+    submitted = {queue.submit(f"case {i}") for i in range(40)}
+    claimed = []
+
+    def drain(worker):
+        broker = SQLiteBroker(path)
+        while True:
+            job = broker.claim(worker)
+            if job is None:
+                break
+            claimed.append(job["id"])
+        broker.close()
+
+    threads = [threading.Thread(target=drain, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(submitted)
+    assert queue.depth() == 0
+
+
+def test_worker_runs_jobs_with_bounded_concurrency(tmp_path):
+    """Test that queued cases are run, at most ``concurrency`` at once, to a status"""
+    queue = WorkQueue(SQLiteBroker(str(tmp_path / "queue.db")))
+    ledger = CostLedger(budgets={"over": TenantBudget(max_cost=0.0)})
+    engine = ConsultationEngine(fake_llm_config(), ledger=ledger, silent=True)
+    consult = engine.a_consult
+    running, peak = [0], [0]
+
+    async def tracked(*args, **kwargs):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            return await consult(*args, **kwargs)
+        finally:
+            running[0] -= 1
+
+    engine.a_consult = tracked
+    jobs = [queue.submit(symptoms) for symptoms in ["headache", "sore throat"] * 3]
+    refused = queue.submit("fever", tenant="over")
+    worker = QueueWorker(queue, engine, concurrency=2, poll_interval=0.01)
+
+    asyncio.run(worker.run(until_idle=True))
+
+    assert peak[0] == 2
+    assert worker.stats()["completed"] == 6
+    for job_id in jobs:
+        job = queue.status(job_id)
+        assert job["status"] == DONE
+        assert job["result"]["summary"]
+        assert job["result"]["cost"]["tenant"] == "default"
+    failed = queue.status(refused)
+    assert failed["status"] == FAILED
+    assert failed["error"].startswith("BudgetExceeded")
+
+
+def test_stale_worker_cannot_overwrite_a_reclaimed_job(tmp_path):
+    """Test that only the worker holding the lease can renew, complete or fail"""
+    now = [0.0]
+    for broker in (
+        MemoryBroker(clock=lambda: now[0]),
+        SQLiteBroker(str(tmp_path / "queue.db"), clock=lambda: now[0]),
+    ):
+        now[0] = 0.0
+        job_id = WorkQueue(broker).submit("headache")
+        broker.claim("a", lease=10)
+        assert broker.renew(job_id, "a", lease=10)
+        now[0] = 21.0
+        assert broker.claim("b", lease=10)["id"] == job_id
+
+        assert not broker.renew(job_id, "a")
+        assert not broker.complete(job_id, {"summary": "stale"}, worker="a")
+        assert not broker.fail(job_id, "stale", worker="a")
+        assert broker.get(job_id)["worker"] == "b"
+        assert broker.complete(job_id, {"summary": "rest"}, worker="b")
+        assert not broker.fail(job_id, "late", worker="b")
+        assert broker.get(job_id)["result"] == {"summary": "rest"}
+
+
+def test_heartbeat_keeps_long_jobs_from_being_reclaimed(tmp_path):
+    """Test that a job running past its lease is renewed, not run a second time"""
+    path = str(tmp_path / "queue.db")
+    queue = WorkQueue(SQLiteBroker(path))
+    job_id = queue.submit("headache")
+    calls = []
+
+    async def slow_consult(index, symptoms, tenant=None):
+        calls.append(symptoms)
+        await asyncio.sleep(0.6)
+        return SimpleNamespace(ok=True, to_dict=lambda: {"summary": "rest"})
+
+    engine = SimpleNamespace(concurrency=1, a_consult=slow_consult)
+    worker = QueueWorker(queue, engine, lease=0.2, poll_interval=0.01)
+    rival = SQLiteBroker(path)
+    claims = []
+
+    async def run():
+        task = asyncio.ensure_future(worker.run(until_idle=True))
+        while not calls:
+            await asyncio.sleep(0.01)
+        # Another worker keeps trying to claim while the first one runs the job
+        while not task.done():
+            claims.append(rival.claim("rival", lease=0.2))
+            await asyncio.sleep(0.05)
+        await task
+
+    asyncio.run(run())
+
+    assert calls == ["headache"]
+    assert not any(claims)
+    assert queue.status(job_id)["status"] == DONE
+    assert queue.status(job_id)["attempts"] == 1
+    assert worker.stats()["completed"] == 1
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Rule-based triage in front of the LLM agents
+
+``Triage`` runs before the patient agent opens the chat. It is a handful of
+regular expressions compiled once at import time over a curated lexicon, so
+a verdict takes microseconds:
+
+- EMERGENCY: red-flag presentations (chest pain with breathlessness, stroke
+  signs, anaphylaxis, suicidal intent, ...) are answered at once with advice
+  to contact emergency services; no LLM call is made
+- REJECT: empty, oversized or non-language input gets a request to describe
+  the symptoms; no LLM call is made
+- CONSULT: everything else goes to the agents, tagged with the symptom
+  terms found and the routing complexity
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+
+from routing import assess_complexity
+from termination import COMPLETION_MARKER
+
+EMERGENCY, REJECT, CONSULT = "emergency", "reject", "consult"
+
+MAX_CHARS = 2000
+
+_BREATHLESS = (
+    r"short(ness)? of breath|can'?t breathe|cannot breathe|"
+    r"(difficulty|trouble|struggling) breathing"
+)
+
+# Rule name -> pattern over the lowercased, whitespace-collapsed text
+EMERGENCY_RULES = {
+    "cardiac": (
+        r"^(?=.*\bchest (pain|pressure|tightness))"
+        rf"(?=.*(\b({_BREATHLESS})|sweating|\b(left )?arm\b|\bjaw\b))"
+    ),
+    "breathing": r"\b(not breathing|stopped breathing|turning blue|choking)\b",
+    # One-sided only with a deficit in the same clause; not a one-sided rash
+    "stroke": (
+        r"\b(face (is )?droop\w*|slurred speech|"
+        r"(weak|numb|droop|paraly[sz]|limp)\w*[^.,;]* on one side|"
+        r"one side of (my|his|her|the) (face|body)[^.,;]*\b"
+        r"(weak|numb|droop|paraly[sz]|limp|can'?t move)\w*)"
+    ),
+    "consciousness": r"\b(unconscious|unresponsive|won'?t wake up)\b",
+    "seizure": r"\b(having a seizure|seizure (that )?(lasting|won'?t stop))",
+    "self_harm": (
+        r"\b(suicid\w*|kill myself|end my life|"
+        r"(want|going|plan\w*|tr(y|ying)) to (overdose|take all my (pills|tablets)))"
+    ),
+    "bleeding": (
+        r"\b(severe bleeding|bleeding heavily|(won'?t|will not) stop bleeding|"
+        r"(coughing|vomiting) (up )?blood)"
+    ),
+    "anaphylaxis": r"\b(anaphyla\w*|throat (is )?(swelling|closing)|swollen tongue)",
+    "meningitis": r"^(?=.*\bstiff neck\b)(?=.*\bfever\b)",
+    "thunderclap": r"\bworst headache of my life\b",
+    # Actual ingestion or overdose; not "food poisoning", "poison ivy" or worries
+    "poisoning": (
+        r"\b((swallowed|drank|drunk|ate|ingested) (\w+ ){0,2}?"
+        r"(bleach|batter(y|ies)|antifreeze|detergent|pesticide\w*|rat poison|"
+        r"poison(ous)?(?! (ivy|oak|sumac))|cleaning (fluid|product)s?|laundry pods?)\b|"
+        r"(was|been|got|being) poisoned|overdosed|took an overdose|"
+        r"took too many (pills|tablets))"
+    ),
+}
+
+SYMPTOM_LEXICON = (
+    "abdominal pain",
+    "ache",
+    "anxiety",
+    "back pain",
+    "bleeding",
+    "bloating",
+    "blurred vision",
+    "breathless",
+    "bruise",
+    "burn",
+    "chest pain",
+    "chills",
+    "congestion",
+    "constipation",
+    "cough",
+    "cramp",
+    "diarrhea",
+    "dizziness",
+    "dizzy",
+    "earache",
+    "fatigue",
+    "fever",
+    "headache",
+    "heartburn",
+    "insomnia",
+    "itch",
+    "joint pain",
+    "migraine",
+    "muscle pain",
+    "nausea",
+    "numbness",
+    "pain",
+    "palpitations",
+    "rash",
+    "runny nose",
+    "shortness of breath",
+    "sneezing",
+    "sore throat",
+    "sprain",
+    "stomach ache",
+    "sweating",
+    "swelling",
+    "tired",
+    "toothache",
+    "vomiting",
+    "weakness",
+    "wheezing",
+)
+
+EMERGENCY_ADVICE = (
+    "These symptoms can be signs of a medical emergency. Call your local "
+    "emergency number (for example 911) or go to the nearest emergency room "
+    "now. Do not wait for an online consultation."
+)
+CRISIS_ADVICE = (
+    "If you are thinking about harming yourself, you can also call or text a "
+    "crisis line such as 988 (US) at any time."
+)
+# Everyday words in symptom descriptions, beyond SYMPTOM_LEXICON; input
+# without any of them (or a medical-sounding word) is treated as junk
+COMMON_WORDS = frozenset("""
+    a about after again all allergy am an and arm arms asthma at back bad been
+    belly blood body bone breathe breathing but can cant chest cold covid day
+    days did do does dont ear ears eye eyes face feel feeling feels feet flu foot
+    for from gut had hand hands has have head hear heart help hip hurt hurts i
+    ill im in infection injury is it itchy its keep keeps knee leg legs like lump
+    me mild month morning mouth my neck night no nose not now of on or pee period
+    really red right severe shoulder sick side since skin sleep so some sore
+    spot still stomach stool swollen the this throat tight to toe tooth very
+    week weeks when with worse year yesterday
+    """.split()) | frozenset(word for term in SYMPTOM_LEXICON for word in term.split())
+
+REJECT_ADVICE = (
+    "I could not find a description of symptoms in your message. Please "
+    "describe what you are feeling, for example: headache and fever since "
+    "yesterday."
+)
+
+_RULES = {
+    name: re.compile(pattern, re.DOTALL) for name, pattern in EMERGENCY_RULES.items()
+}
+# Every rule in one pattern, so non-emergencies are screened in a single pass
+_EMERGENCY = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in EMERGENCY_RULES.values()), re.DOTALL
+)
+# Longest first, so "chest pain" wins over "pain"
+_SYMPTOMS = re.compile(
+    r"\b("
+    + "|".join(
+        re.escape(term) for term in sorted(SYMPTOM_LEXICON, key=len, reverse=True)
+    )
+    + r")\w*"
+)
+_WORD = re.compile(r"[a-z]+")
+_VOWELS = re.compile(r"[aeiouy]")
+_MEDICAL_WORD = re.compile(r"(itis|algia|osis|emia|itus|oma|pathy|rrhea|uria)$")
+
+
+@dataclass
+class TriageResult:
+    """Verdict for one symptom description"""
+
+    action: str
+    reasons: tuple = ()
+    tags: tuple = ()
+    complexity: str = None
+    messages: list = field(default_factory=list)
+
+    @property
+    def short_circuit(self):
+        """True if the agents are skipped"""
+        return self.action != CONSULT
+
+
+def emergency_reasons(text):
+    """Names of the emergency rules matched by lowercased text"""
+    if _EMERGENCY.search(text) is None:
+        return ()
+    return tuple(name for name, rule in _RULES.items() if rule.search(text))
+
+
+def symptom_tags(text):
+    """Lexicon terms mentioned in lowercased text"""
+    return tuple(sorted({match.group(1) for match in _SYMPTOMS.finditer(text)}))
+
+
+def is_junk(text):
+    """Empty, oversized, not made of words or without a single known word"""
+    if not text or len(text) > MAX_CHARS:
+        return True
+    words = _WORD.findall(text)
+    if not words or sum(len(word) for word in words) < 2:
+        return True
+    # Keyboard mashing: words without vowels, or a single repeated letter
+    voiced = [word for word in words if _VOWELS.search(word) and len(set(word)) > 1]
+    if len(voiced) * 2 < len(words):
+        return True
+    # Mashing that happens to have vowels ("asdfghjkl", "qwerty", "lol")
+    return not any(
+        word in COMMON_WORDS or _MEDICAL_WORD.search(word) or _SYMPTOMS.match(word)
+        for word in words
+    )
+
+
+def reply(text):
+    """A reply from the consultation agent, in GroupChat message form"""
+    return [{"role": "user", "name": "consultation", "content": text}]
+
+
+class Triage:
+    """Local triage stage deciding whether the agents are needed at all"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {EMERGENCY: 0, REJECT: 0, CONSULT: 0}
+
+    def __call__(self, symptoms):
+        text = " ".join(str(symptoms or "").lower().split())
+        if is_junk(text):
+            result = TriageResult(REJECT, messages=reply(REJECT_ADVICE))
+        else:
+            reasons = emergency_reasons(text)
+            if reasons:
+                advice = EMERGENCY_ADVICE
+                if "self_harm" in reasons:
+                    advice = f"{advice} {CRISIS_ADVICE}"
+                result = TriageResult(
+                    EMERGENCY,
+                    reasons=reasons,
+                    tags=symptom_tags(text),
+                    messages=reply(f"{advice} {COMPLETION_MARKER}"),
+                )
+            else:
+                result = TriageResult(
+                    CONSULT, tags=symptom_tags(text), complexity=assess_complexity(text)
+                )
+        with self._lock:
+            self.counts[result.action] += 1
+        return result
+
+    def stats(self):
+        """Verdicts so far and the share of inputs that skipped the agents"""
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        skipped = counts[EMERGENCY] + counts[REJECT]
+        return {**counts, "skipped_ratio": skipped / total if total else 0.0}
+
+
+DEFAULT_TRIAGE = Triage()
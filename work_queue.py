@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""
+Work-queue backed consultation processing
+
+    python work_queue.py submit cases.txt          # enqueue, one case per line
+    python work_queue.py work --concurrency 16     # run jobs until interrupted
+    python work_queue.py status <job id>
+
+Intake enqueues symptom cases and returns at once; ``QueueWorker`` runs them
+on a ``ConsultationEngine`` (pooled GroupChatManager pipelines) with bounded
+concurrency, in as many processes as needed:
+
+- backpressure: a queue holds at most ``max_depth`` waiting jobs. ``submit``
+  then blocks (or raises ``QueueFull``), ``offer`` returns None, and
+  ``pressure()`` tells producers how full it is so they can slow down first
+- workers only claim a job when they have a free slot, so a burst waits in
+  the queue rather than in memory, and the provider sees a steady stream of
+  calls that ``RateLimitScheduler`` paces at the model's sustainable rate
+- every job's status (queued, running, done, failed), queue position and
+  result can be polled with ``status(job_id)``
+- a claimed job holds a lease that its worker renews while the job runs; if
+  the worker dies the lease expires and the job is queued again, up to
+  ``max_attempts`` claims. Results from a worker that lost its lease are
+  ignored
+
+Brokers are pluggable: any object with ``put``, ``claim``, ``renew``,
+``complete``, ``fail``, ``get``, ``position`` and ``counts``. ``SQLiteBroker`` keeps jobs
+in a file shared by every process on the host; ``MemoryBroker`` keeps them
+in this process.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_chat import run_blocking
+from response_cache import retire_connection
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_MAX_DEPTH = 10_000
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_QUEUE_PATH = "work_queue.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    symptoms TEXT NOT NULL,
+    tenant TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker TEXT,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+
+class QueueFull(RuntimeError):
+    """The queue already holds ``max_depth`` waiting jobs"""
+
+    def __init__(self, depth):
+        super().__init__(f"work queue is full ({depth} jobs waiting)")
+        self.depth = depth
+
+
+def new_job(symptoms, tenant=None, created=None):
+    return {
+        "id": uuid.uuid4().hex,
+        "status": QUEUED,
+        "symptoms": symptoms,
+        "tenant": tenant,
+        "created": created if created is not None else time.time(),
+        "started": None,
+        "finished": None,
+        "attempts": 0,
+        "lease_until": None,
+        "worker": None,
+        "error": None,
+        "result": None,
+    }
+
+
+class MemoryBroker:
+    """Jobs in this process, in arrival order"""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, clock=time.time):
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._jobs = {}
+        self._queued = deque()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def put(self, job, max_depth=None):
+        """Queue ``job`` unless ``max_depth`` jobs are already waiting"""
+        with self._lock:
+            if max_depth is not None and len(self._queued) >= max_depth:
+                return False
+            self._jobs[job["id"]] = dict(job)
+            self._queued.append(job["id"])
+            return True
+
+    def _expire_leases(self, now):
+        for job_id in list(self._running):
+            job = self._jobs[job_id]
+            if job["lease_until"] < now:
+                self._running.discard(job_id)
+                if job["attempts"] >= self.max_attempts:
+                    job.update(status=FAILED, finished=now, error="lease expired")
+                else:
+                    job.update(status=QUEUED, worker=None, lease_until=None)
+                    self._queued.appendleft(job["id"])
+
+    def claim(self, worker, lease=DEFAULT_LEASE_SECONDS):
+        """The oldest queued job, now running under ``worker``, or None"""
+        with self._lock:
+            now = self.clock()
+            self._expire_leases(now)
+            if not self._queued:
+                return None
+            job = self._jobs[self._queued.popleft()]
+            self._running.add(job["id"])
+            job.update(
+                status=RUNNING,
+                started=now,
+                attempts=job["attempts"] + 1,
+                lease_until=now + lease,
+                worker=worker,
+            )
+            return dict(job)
+
+    def _owned(self, job_id, worker):
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != RUNNING:
+            return None
+        if worker is not None and job["worker"] != worker:
+            return None
+        return job
+
+    def renew(self, job_id, worker, lease=DEFAULT_LEASE_SECONDS):
+        """Extend ``worker``'s lease on a running job; False if it no longer owns it"""
+        with self._lock:
+            job = self._owned(job_id, worker)
+            if job is None:
+                return False
+            job["lease_until"] = self.clock() + lease
+            return True
+
+    def complete(self, job_id, result, worker=None):
+        """Record a running job's result; False if ``worker`` no longer owns it"""
+        with self._lock:
+            job = self._owned(job_id, worker)
+            if job is None:
+                return False
+            self._running.discard(job_id)
+            job.update(
+                status=DONE, finished=self.clock(), result=result, lease_until=None
+            )
+            return True
+
+    def fail(self, job_id, error, worker=None):
+        """Record a running job's failure; False if ``worker`` no longer owns it"""
+        with self._lock:
+            job = self._owned(job_id, worker)
+            if job is None:
+                return False
+            self._running.discard(job_id)
+            job.update(
+                status=FAILED, finished=self.clock(), error=error, lease_until=None
+            )
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def position(self, job_id):
+        """Jobs ahead of a queued job, or None if it is not waiting"""
+        with self._lock:
+            try:
+                return self._queued.index(job_id)
+            except ValueError:
+                return None
+
+    def counts(self):
+        """Number of jobs per status"""
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return counts
+
+
+class SQLiteBroker:
+    """Jobs in a SQLite file; claims are atomic across threads and processes"""
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS, clock=time.time):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.clock = clock
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+        _brokers.add(self)
+
+    def _open(self):
+        # Autocommit, so claims can take the write lock up front (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        """In a forked child: own connection; the parent's stays its own"""
+        retire_connection(self._conn)
+        self._open()
+
+    def _transaction(self, body):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = body(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def put(self, job, max_depth=None):
+        """Queue ``job`` unless ``max_depth`` jobs are already waiting"""
+
+        def insert(conn):
+            if max_depth is not None:
+                (depth,) = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+                ).fetchone()
+                if depth >= max_depth:
+                    return False
+            conn.execute(
+                "INSERT INTO jobs (id, status, symptoms, tenant, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job["id"], QUEUED, job["symptoms"], job["tenant"], job["created"]),
+            )
+            return True
+
+        return self._transaction(insert)
+
+    def claim(self, worker, lease=DEFAULT_LEASE_SECONDS):
+        """The oldest queued job, now running under ``worker``, or None"""
+
+        def take(conn):
+            now = self.clock()
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = 'lease expired' "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL "
+                "WHERE status = ? AND lease_until < ?",
+                (QUEUED, RUNNING, now),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created, rowid LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1, "
+                "lease_until = ?, worker = ? WHERE id = ?",
+                (RUNNING, now, now + lease, worker, row[0]),
+            )
+            return row[0]
+
+        job_id = self._transaction(take)
+        return self.get(job_id) if job_id is not None else None
+
+    def _update_owned(self, assignments, values, job_id, worker):
+        """Update a running job if ``worker`` (any, if None) owns it; True if so"""
+        sql = f"UPDATE jobs SET {assignments} WHERE id = ? AND status = ?"
+        params = (*values, job_id, RUNNING)
+        if worker is not None:
+            sql += " AND worker = ?"
+            params += (worker,)
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount == 1
+
+    def renew(self, job_id, worker, lease=DEFAULT_LEASE_SECONDS):
+        """Extend ``worker``'s lease on a running job; False if it no longer owns it"""
+        return self._update_owned(
+            "lease_until = ?", (self.clock() + lease,), job_id, worker
+        )
+
+    def complete(self, job_id, result, worker=None):
+        """Record a running job's result; False if ``worker`` no longer owns it"""
+        return self._update_owned(
+            "status = ?, finished = ?, result = ?, lease_until = NULL",
+            (DONE, self.clock(), json.dumps(result)),
+            job_id,
+            worker,
+        )
+
+    def fail(self, job_id, error, worker=None):
+        """Record a running job's failure; False if ``worker`` no longer owns it"""
+        return self._update_owned(
+            "status = ?, finished = ?, error = ?, lease_until = NULL",
+            (FAILED, self.clock(), error),
+            job_id,
+            worker,
+        )
+
+    def get(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([c[0] for c in cursor.description], row))
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def position(self, job_id):
+        """Jobs ahead of a queued job, or None if it is not waiting"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, rowid FROM jobs WHERE id = ? AND status = ?",
+                (job_id, QUEUED),
+            ).fetchone()
+            if row is None:
+                return None
+            (ahead,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? "
+                "AND (created < ? OR (created = ? AND rowid < ?))",
+                (QUEUED, row[0], row[0], row[1]),
+            ).fetchone()
+            return ahead
+
+    def counts(self):
+        """Number of jobs per status"""
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_brokers = weakref.WeakSet()
+
+
+def _reopen_after_fork():
+    for broker in list(_brokers):
+        broker._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+class WorkQueue:
+    """Producer side of a broker: bounded intake and job status"""
+
+    def __init__(self, broker=None, max_depth=DEFAULT_MAX_DEPTH, poll_interval=0.1):
+        self.broker = broker if broker is not None else MemoryBroker()
+        self.max_depth = max_depth
+        self.poll_interval = poll_interval
+
+    def offer(self, symptoms, tenant=None):
+        """Enqueue a case and return its job id, or None if the queue is full"""
+        job = new_job(symptoms, tenant)
+        return job["id"] if self.broker.put(job, self.max_depth) else None
+
+    def submit(self, symptoms, tenant=None, block=False, timeout=None):
+        """Enqueue a case and return its job id.
+
+        A full queue raises ``QueueFull``, or with ``block`` waits for room
+        (at most ``timeout`` seconds).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job_id = self.offer(symptoms, tenant)
+            if job_id is not None:
+                return job_id
+            if not block or (deadline is not None and time.monotonic() >= deadline):
+                raise QueueFull(self.depth())
+            time.sleep(self.poll_interval)
+
+    def depth(self):
+        """Jobs waiting to be claimed"""
+        return self.broker.counts()[QUEUED]
+
+    def pressure(self):
+        """How full the queue is, from 0.0 (empty) to 1.0 (refusing jobs)"""
+        if not self.max_depth:
+            return 0.0
+        return min(1.0, self.depth() / self.max_depth)
+
+    def status(self, job_id):
+        """A job with its status, queue position while waiting and result, or None"""
+        job = self.broker.get(job_id)
+        if job is not None:
+            job["position"] = (
+                self.broker.position(job_id) if job["status"] == QUEUED else None
+            )
+        return job
+
+    def wait(self, job_id, timeout=None):
+        """Poll until the job is done or failed and return it"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.status(job_id)
+            if job is None or job["status"] in (DONE, FAILED):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"job {job_id} is still {job['status']}")
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        return {
+            **self.broker.counts(),
+            "max_depth": self.max_depth,
+            "pressure": self.pressure(),
+        }
+
+
+class QueueWorker:
+    """Runs queued jobs on a ConsultationEngine, at most ``concurrency`` at a time"""
+
+    def __init__(
+        self,
+        queue,
+        engine,
+        concurrency=None,
+        lease=DEFAULT_LEASE_SECONDS,
+        poll_interval=0.2,
+        worker_id=None,
+        heartbeat=None,
+    ):
+        self.queue = queue
+        self.engine = engine
+        self.concurrency = concurrency or engine.concurrency
+        self.lease = lease
+        # Renew well before expiry, so a slow renewal never lets the lease lapse
+        self.heartbeat = heartbeat or lease / 3
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.completed = 0
+        self.failed = 0
+        self.lost = 0
+        self._stopping = False
+
+    def stop(self):
+        """Finish the jobs in hand and claim no more"""
+        self._stopping = True
+
+    async def run(self, until_idle=False):
+        """Claim and run jobs until stopped (or, with ``until_idle``, the queue is empty)"""
+        self._stopping = False
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        broker = self.queue.broker
+        while not self._stopping:
+            # Claim only with a free slot: waiting jobs stay in the broker
+            await slots.acquire()
+            job = await run_blocking(broker.claim, self.worker_id, self.lease)
+            if job is None:
+                slots.release()
+                if until_idle and not tasks:
+                    break
+                await asyncio.sleep(self.poll_interval)
+                continue
+            task = asyncio.ensure_future(self._process(job, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _renew(self, job_id):
+        """Keep the lease on a running job until cancelled or the job is lost"""
+        broker = self.queue.broker
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            renewed = await run_blocking(
+                broker.renew, job_id, self.worker_id, self.lease
+            )
+            if not renewed:
+                return
+
+    async def _process(self, job, slots):
+        heartbeat = asyncio.ensure_future(self._renew(job["id"]))
+        try:
+            result = await self.engine.a_consult(
+                0, job["symptoms"], tenant=job["tenant"]
+            )
+        finally:
+            heartbeat.cancel()
+            slots.release()
+        broker = self.queue.broker
+        if result.ok:
+            owned = await run_blocking(
+                broker.complete, job["id"], result.to_dict(), self.worker_id
+            )
+        else:
+            owned = await run_blocking(
+                broker.fail, job["id"], result.error, self.worker_id
+            )
+        if not owned:
+            # The lease lapsed and another worker has the job now
+            self.lost += 1
+        elif result.ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def stats(self):
+        return {
+            "worker": self.worker_id,
+            "completed": self.completed,
+            "failed": self.failed,
+            "lost": self.lost,
+        }
+
+
+def from_environment():
+    """WorkQueue on a SQLiteBroker at WORK_QUEUE_PATH (default work_queue.db)"""
+    path = os.getenv("WORK_QUEUE_PATH", DEFAULT_QUEUE_PATH)
+    max_depth = int(os.getenv("WORK_QUEUE_MAX_DEPTH", DEFAULT_MAX_DEPTH))
+    return WorkQueue(SQLiteBroker(path), max_depth=max_depth)
+
+
+def main(argv=None):
+    """Enqueue cases, run a worker, or show a job"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="enqueue one case per line")
+    submit.add_argument("cases", nargs="?", help="file of cases (default: stdin)")
+    submit.add_argument("--tenant")
+    work = commands.add_parser("work", help="run queued consultations")
+    work.add_argument("--concurrency", type=int, default=8)
+    work.add_argument(
+        "--until-idle", action="store_true", help="exit once the queue is empty"
+    )
+    work.add_argument(
+        "--offline",
+        action="store_true",
+        help="use the offline fake LLM backend instead of OpenAI",
+    )
+    status = commands.add_parser("status", help="print a job as JSON")
+    status.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    queue = from_environment()
+    if args.command == "status":
+        job = queue.status(args.job_id)
+        if job is None:
+            print(f"❌ No such job: {args.job_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(job, indent=2))
+        return 0
+
+    if args.command == "submit":
+        from consultation_engine import read_cases
+
+        stream = open(args.cases) if args.cases else sys.stdin
+        submitted = 0
+        with stream:
+            for symptoms in read_cases(stream):
+                # Blocks while the queue is full: the producer slows to the workers' pace
+                print(queue.submit(symptoms, args.tenant, block=True), flush=True)
+                submitted += 1
+        print(f"✅ {submitted} cases queued ({queue.depth()} waiting)", file=sys.stderr)
+        return 0
+
+    from consultation_engine import ConsultationEngine
+    from healthcare_chatbot import build_llm_config, load_environment
+
+    if args.offline:
+        from fake_llm import fake_llm_config
+
+        llm_config = fake_llm_config()
+    else:
+        load_environment()
+        if not os.getenv("OPENAI_API_KEY"):
+            print(
+                "⚠️ OPENAI_API_KEY not set. Cannot run consultations.", file=sys.stderr
+            )
+            return 1
+        llm_config = build_llm_config()
+    engine = ConsultationEngine(llm_config, concurrency=args.concurrency, silent=True)
+    worker = QueueWorker(queue, engine)
+    print(f"👷 Worker {worker.worker_id} running {args.concurrency} at a time")
+    try:
+        asyncio.run(worker.run(until_idle=args.until_idle))
+    except KeyboardInterrupt:
+        pass
+    stats = worker.stats()
+    print(f"✅ {stats['completed']} completed, {stats['failed']} failed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())